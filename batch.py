@@ -0,0 +1,186 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import meal_engine as me
+
+# 요양원별 어르신 정보 파일(.xlsx)이 든 폴더 + 공통 메뉴 파일 → 요양원마다 맞춤 식단 파일 하나
+# Streamlit 페이지의 "전체 수급자" 모드와 같은 함수(meal_engine.run_facility / write_results)를 쓴다
+#
+#   python batch.py 어르신정보폴더 --out 결과폴더 --workers 4 [--method solver] [--format parquet] [--cards]
+#                          [--ingredients [--plan-days 28]] [--nutrients ingredient] [--snapshots roster_snapshots]
+#                          [--store meal_results.sqlite3 [--date 2026-10-01]]
+#   --snapshots: 요양원마다 처리한 명단(<폴더>/<파일명>.parquet)을 남기고 지난 실행 대비 추가·변경·삭제 수급자를 센다
+#     (계산은 항상 전체: 결과 스냅숏은 복원·저장이 다시 계산하는 것보다 오래 걸려 두지 않는다)
+#   --store: 결과를 (요양원=파일명, 날짜) 단위로 SQLite 결과 저장소에 쌓는다 (페이지의 "저장된 식단·판정 조회"와 같은 파일)
+#   (요양원 한 곳만이면 python -m meal_engine 어르신정보.xlsx)
+
+# 작업 프로세스마다 한 번만 읽는 공통 데이터 (메뉴 category 시트, 밥 색인, MFDS 기준)
+_shared = {}
+
+def init_worker(menu_path, mfds_path, nutrients="category"):
+    menu_sheets = me.load_menu_workbook(menu_path)
+    category_df = me.prepare_category_df(menu_sheets["category"])
+    if nutrients == "ingredient":
+        category_df, _ = me.recompute_category_nutrients(category_df, menu_sheets)
+    _shared["category_df"] = category_df
+    _shared["rice_index"] = me.build_rice_index(category_df)
+    _shared["standards"] = me.compile_standards(me.load_disease_standards(mfds_path))
+    _shared["cache"] = me.MenuVariantCache()
+    _shared["ingredient_index"] = me.build_ingredient_index(menu_sheets["ingredient"]) if "ingredient" in menu_sheets else None
+
+def process_facility(patient_path, out_dir, method="ratio", fmt="xlsx", cards=False, ingredients=False, plan_days=None,
+                     snapshot_dir=None, store_path=None, meal_date=None):
+    # 요양원 한 곳: 분류·개인 기준 → 식단 생성 → 양 조절 → MFDS 판정 → 결과 파일
+    # snapshot_dir이 있으면 지난 실행 명단 대비 추가/변경/삭제 수급자를 세고 명단 기록을 갱신한다
+    started = time.perf_counter()
+    facility = os.path.splitext(os.path.basename(patient_path))[0]
+    with open(patient_path, "rb") as f:
+        patient_raw = me.load_patient_sheet(f.read())
+    patient_df = me.prepare_patient_df(patient_raw)
+    adjusted_results, eval_df, ratio_table, missing_rice = me.run_facility(
+        patient_df, _shared["category_df"], _shared["standards"],
+        rice_index=_shared["rice_index"], method=method, cache=_shared["cache"],
+    )
+    roster = None
+    if snapshot_dir:
+        roster_path = me.snapshot_path(facility, snapshot_dir)
+        previous = me.read_roster(roster_path)
+        current = pd.DataFrame({"수급자ID": patient_df["수급자ID"].to_numpy(dtype=object), "_hash": me.patient_row_hashes(patient_raw)})
+        roster = me.roster_changes(previous, current["수급자ID"], current["_hash"])
+        if previous is None or any(roster.values()):
+            me.write_roster(current, roster_path)
+    output_path = os.path.join(out_dir, me.export_file_name(facility, fmt))
+    me.write_results(adjusted_results, patient_df, output_path, fmt)
+    if cards:
+        me.write_resident_cards_zip(adjusted_results, eval_df, patient_df, os.path.join(out_dir, f"{facility}_식단카드.zip"))
+    procurement = None
+    if ingredients:
+        if _shared["ingredient_index"] is None:
+            raise ValueError("메뉴 파일에 ingredient 시트가 없습니다")
+        procurement, _ = me.facility_procurement(
+            adjusted_results, ratio_table, patient_df, _shared["ingredient_index"],
+            _shared["category_df"], _shared["standards"], plan_days=plan_days,
+        )
+        me.write_procurement(procurement, os.path.join(out_dir, f"{facility}_식자재.csv"))
+    if store_path:
+        # 작업 프로세스마다 연결을 따로 연다 (WAL + busy timeout으로 다른 프로세스의 쓰기를 기다린다)
+        store = me.ResultsStore(store_path)
+        try:
+            store.save(facility, meal_date or time.strftime("%Y-%m-%d"), adjusted_results, eval_df)
+        finally:
+            store.close()
+
+    return {
+        "facility": facility,
+        "residents": int(patient_df["수급자ID"].nunique()),
+        "failed": me.count_failed(eval_df),
+        "missing_rice": missing_rice,
+        "output": output_path,
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+        "procurement": procurement,
+        "roster": roster,
+    }
+
+def run_batch(patient_dir, out_dir, menu_path=me.MENU_PATH, mfds_path=me.MFDS_PATH, workers=None, method="ratio",
+              fmt="xlsx", cards=False, ingredients=False, plan_days=None, nutrients="category", snapshot_dir=None,
+              store_path=None, meal_date=None):
+    # 요양원 파일을 ProcessPoolExecutor로 나눠 처리. 반환: (요양원별 결과 목록, 전체 소요 시간)
+    patient_paths = sorted(
+        path for path in glob.glob(os.path.join(patient_dir, "*.xlsx"))
+        if not os.path.basename(path).startswith("~$")
+    )
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(menu_path, mfds_path, nutrients)) as pool:
+        futures = {
+            pool.submit(
+                process_facility, path, out_dir, method, fmt, cards, ingredients, plan_days, snapshot_dir, store_path, meal_date,
+            ): path
+            for path in patient_paths
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # 한 요양원 파일이 잘못돼도 나머지는 계속 처리
+                result = {"facility": os.path.basename(futures[future]), "error": repr(e)}
+            results.append(result)
+            print(format_result(result), flush=True)
+    if ingredients:
+        write_combined_procurement(results, out_dir)
+    return results, time.perf_counter() - started
+
+def write_combined_procurement(results, out_dir):
+    # 요양원별 발주량을 한 파일로 (요양원 열 + 일차/재료별 총량)
+    tables = [
+        r["procurement"].assign(요양원=r["facility"]) for r in results
+        if r.get("procurement") is not None
+    ]
+    if tables:
+        combined = pd.concat(tables, ignore_index=True)
+        combined.insert(0, "요양원", combined.pop("요양원"))
+        me.write_procurement(combined.sort_values("요양원", kind="stable"), os.path.join(out_dir, "식자재_요양원별.csv"))
+
+def format_result(result):
+    if "error" in result:
+        return f"  ✗ {result['facility']}: {result['error']}"
+    line = (
+        f"  ✓ {result['facility']}: {result['residents']:,}명, 미달 {result['failed']:,}명, "
+        f"{result['seconds']:.2f}s (pid {result['pid']}) → {result['output']}"
+    )
+    if result["missing_rice"]:
+        line += f"  [없는 밥 메뉴: {', '.join(result['missing_rice'])}]"
+    roster = result.get("roster")
+    if roster:
+        line += f"\n      명단 추가 {roster['added']:,} · 변경 {roster['changed']:,} · 삭제 {roster['removed']:,}명"
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="요양원별 맞춤 식단 일괄 생성")
+    parser.add_argument("patient_dir", help="요양원별 어르신 정보 파일(.xlsx)이 있는 폴더")
+    parser.add_argument("--menu", default=me.MENU_PATH, help="공통 메뉴 파일 (category 시트)")
+    parser.add_argument("--mfds", default=me.MFDS_PATH, help="MFDS 질환별 기준 파일")
+    parser.add_argument("--out", default="./batch_output", help="결과 파일을 쓸 폴더")
+    parser.add_argument("--workers", type=int, default=None, help="작업 프로세스 수 (기본: CPU 수)")
+    parser.add_argument("--method", choices=me.PORTION_METHODS, default="ratio", help="밥+주찬 조정 방식")
+    parser.add_argument("--format", choices=list(me.EXPORT_FORMATS), default="xlsx", help="결과 파일 형식")
+    parser.add_argument("--cards", action="store_true", help="요양원마다 수급자별 식단 카드 ZIP도 만든다")
+    parser.add_argument("--ingredients", action="store_true", help="요양원별 식자재 발주량 CSV와 전체 합본도 만든다")
+    parser.add_argument("--plan-days", type=int, help="발주량을 이 기간 주기 식단의 일차별로 계산 (예: 7, 28)")
+    parser.add_argument("--nutrients", choices=me.NUTRIENT_SOURCES, default="category", help="메뉴 영양성분: category 시트 값 / 재료로 다시 계산")
+    parser.add_argument(
+        "--snapshots", metavar="DIR",
+        help=f"요양원별 처리한 명단을 남길 폴더 (예: {me.SNAPSHOT_DIR}). 지정하면 지난 실행 대비 추가·변경·삭제 수급자를 센다",
+    )
+    parser.add_argument("--store", help="결과를 쌓을 SQLite 결과 저장소 파일 (예: meal_results.sqlite3)")
+    parser.add_argument("--date", help="결과 저장소에 기록할 식단 날짜 (기본: 오늘, YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    results, elapsed = run_batch(
+        args.patient_dir, args.out, args.menu, args.mfds, args.workers, args.method, args.format, args.cards,
+        args.ingredients, args.plan_days, args.nutrients, args.snapshots,
+        args.store, args.date,
+    )
+    done = [r for r in results if "error" not in r]
+    residents = sum(r["residents"] for r in done)
+    print(
+        f"요양원 {len(done)}/{len(results)}곳, 수급자 {residents:,}명, 전체 {elapsed:.2f}s "
+        f"→ {len(done) / elapsed if elapsed else 0:.2f}곳/s, {residents / elapsed if elapsed else 0:,.0f}명/s"
+    )
+    rosters = [r["roster"] for r in done if r.get("roster")]
+    if rosters:
+        print(
+            f"명단 추가 {sum(r['added'] for r in rosters):,} · 변경 {sum(r['changed'] for r in rosters):,} · "
+            f"삭제 {sum(r['removed'] for r in rosters):,}명"
+        )
+    return 0 if len(done) == len(results) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
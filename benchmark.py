@@ -0,0 +1,1123 @@
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import meal_engine as me
+
+# 사용법: python benchmark.py [항목 ...]   (항목 생략 시 전체 실행)
+
+RICE_SIDE = [("일반밥", "일반찬"), ("일반밥", "다진찬"), ("일반죽", "다진찬"), ("일반죽", "갈찬"), ("갈죽", "갈찬"), ("일반밥", "갈찬")]
+
+def make_roster(n, seed=0):
+    # 어르신 정보 파일과 같은 열 구성을 가진 가상 수급자 명단
+    rng = np.random.default_rng(seed)
+    pairs = [RICE_SIDE[i] for i in rng.integers(0, len(RICE_SIDE), n)]
+    df = pd.DataFrame({
+        "수급자ID": [f"P{i:06d}" for i in range(n)],
+        "성별": rng.choice(["남", "여", "남성", "여성", "기타"], n, p=[0.3, 0.3, 0.15, 0.2, 0.05]),
+        "나이": rng.integers(65, 100, n),
+        "신장": rng.normal(158, 8, n).round(1),
+        "체중": rng.normal(55, 10, n).round(1),
+        "활동정도": rng.integers(1, 4, n),
+        "요양등급": rng.integers(1, 6, n),
+        "밥": [p[0] for p in pairs],
+        "반찬": [p[1] for p in pairs],
+    })
+    for d in me.DISEASE_COLUMNS:
+        df[d] = rng.choice([0, 1], n, p=[0.7, 0.3])
+    return df
+
+def timeit(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_classification():
+    print("[classification] 행 단위 apply vs 벡터화 분류")
+    for n in [1_000, 10_000, 100_000]:
+        roster = make_roster(n)
+
+        def legacy():
+            df = roster.copy()
+            df["대표질환"] = df.apply(me.assign_primary_disease, axis=1)
+            df["질환"] = df.apply(me.assign_all_diseases, axis=1)
+            df["식단옵션"] = df.apply(lambda row: me.get_meal_option(row["밥"], row["반찬"]), axis=1)
+            return df
+
+        expected = legacy()
+        actual = me.classify_patients(roster)
+        for col in ["대표질환", "질환", "식단옵션"]:
+            assert expected[col].tolist() == actual[col].tolist(), col
+
+        t_old = timeit(legacy, repeat=1 if n >= 100_000 else 3)
+        t_new = timeit(lambda: me.classify_patients(roster))
+        print(f"  n={n:>7,}  apply {t_old * 1000:9.1f} ms   vectorized {t_new * 1000:7.1f} ms   x{t_old / t_new:6.1f}")
+
+def legacy_nutrient_targets(patient_df):
+    # nursing_home_page에 있던 iterrows 기반 계산 (비교 기준)
+    def calculate_eer(sex, age, weight, height, pa):
+        if sex in ['남성', 'male', '남']:
+            return 662 - (9.53 * age) + pa * (15.91 * weight + 539.6 * height)
+        elif sex in ['여성', 'female', '여']:
+            return 354 - (6.91 * age) + pa * (9.36 * weight + 726 * height)
+        else:
+            raise ValueError("Invalid sex")
+
+    def calculate_daily_intake(sex, age, weight, height, pa):
+        bmi = weight / (height ** 2)
+        eer = calculate_eer(sex, age, weight, height, pa)
+        if bmi >= 25:
+            return (eer - 700, eer - 500)
+        elif 23 <= bmi < 25:
+            return (eer - 500, eer - 300)
+        elif 18.5 <= bmi < 23:
+            return (eer * 0.9, eer * 1.1)
+        else:
+            return (eer + 300, eer + 500)
+
+    rows = []
+    for _, row in patient_df.iterrows():
+        sex = row["성별"]
+        pa = {1: 1.0, 2: 1.1, 3: 1.2}.get(row["활동정도"], 1.0)
+        try:
+            lo, hi = calculate_daily_intake(sex, row["나이"], row["체중"], row["신장"] / 100, pa)
+            male = sex in ['남성', 'male', '남']
+            ranges = [
+                (lo, hi),
+                (lo * 0.55 / 4, hi * 0.65 / 4),
+                (max(50 if male else 40, lo * 0.07 / 4), hi * 0.20 / 4),
+                (lo * 0.15 / 9, hi * 0.30 / 9),
+            ]
+            rows.append([f"{a * 0.3:.0f} ~ {b * 0.3:.0f}" for a, b in ranges])
+        except:
+            rows.append(["에러"] * 4)
+    return pd.DataFrame(rows, columns=me.TARGET_COLUMNS, index=patient_df.index)
+
+def bench_nutrient_targets():
+    print("[nutrient_targets] iterrows 루프 vs 배열 연산 개인 영양 기준")
+    for n in [1_000, 10_000, 100_000]:
+        roster = make_roster(n)
+        expected = legacy_nutrient_targets(roster)
+        actual = me.render_nutrient_targets(me.compute_nutrient_targets(roster))
+        assert expected.equals(actual)
+
+        t_old = timeit(lambda: legacy_nutrient_targets(roster), repeat=1 if n >= 100_000 else 3)
+        t_new = timeit(lambda: me.compute_nutrient_targets(roster))
+        print(f"  n={n:>7,}  iterrows {t_old * 1000:9.1f} ms   vectorized {t_new * 1000:7.1f} ms   x{t_old / t_new:6.1f}")
+
+def load_category_df():
+    return me.prepare_category_df(me.load_menu_workbook()["category"])
+
+def legacy_generate_final_results(patient_df, category_df):
+    # 수급자마다 메뉴를 복사/정렬하던 기존 generate_final_results (비교 기준)
+    final_results = {}
+    for disease in me.DISEASE_TYPES:
+        menus = category_df[category_df["Disease"] == disease]
+        results = []
+        for _, row in patient_df[patient_df["대표질환"] == disease].iterrows():
+            patient_id = row["수급자ID"]
+            selected = menus[menus["Category"].isin(me.REQUIRED_CATEGORIES)].drop_duplicates("Category")
+            if set(me.REQUIRED_CATEGORIES).issubset(set(selected["Category"])):
+                customized = me.apply_meal_customization(selected, row["식단옵션"])
+                customized["Category"] = customized["Category"].astype(me.CATEGORY_ORDER)
+                customized = customized.sort_values("Category")
+                if "Disease" in customized.columns:
+                    customized = customized.drop(columns=["Disease"])
+                customized.insert(0, "수급자ID", patient_id)
+                diseases = patient_df.loc[patient_df["수급자ID"] == patient_id, "질환"].values
+                if len(diseases) > 0:
+                    customized.insert(1, "질환", diseases[0])
+                results.append(customized)
+        if results:
+            final_results[disease] = pd.concat(results, ignore_index=True)
+    return final_results
+
+def bench_final_results():
+    print("[final_results] 수급자별 메뉴 복사 vs 조합별 일괄 구성")
+    category_df = load_category_df()
+    for n in [200, 2_000]:
+        patient_df = me.classify_patients(make_roster(n))
+        expected = legacy_generate_final_results(patient_df, category_df)
+        actual = me.generate_final_results(patient_df, category_df)
+        assert expected.keys() == actual.keys()
+        for disease in expected:
+            pd.testing.assert_frame_equal(expected[disease], actual[disease])
+
+        t_old = timeit(lambda: legacy_generate_final_results(patient_df, category_df), repeat=1)
+        t_new = timeit(lambda: me.generate_final_results(patient_df, category_df))
+        print(f"  n={n:>7,}  per-patient {t_old * 1000:9.1f} ms   batch {t_new * 1000:7.1f} ms   x{t_old / t_new:6.1f}")
+
+def bench_variant_cache():
+    print("[variant_cache] 재실행 시 맞춤 메뉴 캐시 적중률")
+    category_df = load_category_df()
+    patient_df = me.classify_patients(make_roster(300))
+    cache = me.MenuVariantCache()
+    t_first = timeit(lambda: me.generate_final_results(patient_df, category_df, cache=cache), repeat=1)
+    first = cache.stats()
+    t_rerun = timeit(lambda: me.generate_final_results(patient_df, category_df, cache=cache), repeat=1)
+    print(f"  첫 실행 {t_first * 1000:7.1f} ms  {first}")
+    print(f"  재실행 {t_rerun * 1000:7.1f} ms  {cache.stats()}")
+    cache.bind(category_df.assign(**{"총 중량": category_df["총 중량"] + 1}))
+    print(f"  category 변경 후 {cache.stats()}")
+
+def bench_resident_index():
+    print("[resident_index] 선택 수급자 조회: 프레임 반복 스캔 vs 수급자ID 색인")
+    category_df = load_category_df()
+    patient_df = me.classify_patients(make_roster(10_000))
+    final_results = me.generate_final_results(patient_df, category_df)
+    selected_ids = patient_df["수급자ID"].sample(50, random_state=0).tolist()
+
+    def legacy():
+        found = []
+        for selected_id in selected_ids:
+            for disease, df in final_results.items():
+                for sid in df["수급자ID"].unique():
+                    if sid != selected_id:
+                        continue
+                    match = df[df["수급자ID"] == sid]
+                    for _ in range(4):  # 대표질환/nutrient_info/info_row/individual_info
+                        resident = patient_df[patient_df["수급자ID"] == sid].iloc[0]
+                    found.append((match, resident))
+                    break
+        return found
+
+    def indexed():
+        index = me.build_resident_index(patient_df, final_results)
+        found = []
+        for selected_id in selected_ids:
+            entry = index[selected_id]
+            for disease, rows in entry["menus"]:
+                found.append((final_results[disease].iloc[rows], patient_df.iloc[entry["pos"]]))
+        return found
+
+    for (a, ra), (b, rb) in zip(legacy(), indexed()):
+        pd.testing.assert_frame_equal(a, b)
+        pd.testing.assert_series_equal(ra, rb)
+    t_old = timeit(legacy, repeat=1)
+    t_new = timeit(indexed)
+    print(f"  residents=10,000 selected=50  scan {t_old * 1000:9.1f} ms   index(생성 포함) {t_new * 1000:7.1f} ms   x{t_old / t_new:6.1f}")
+
+def bench_upload_cache():
+    print("[upload_cache] 재실행 시 업로드 파싱: read_excel vs SHA-256 캐시")
+    buf = BytesIO()
+    make_roster(10_000).to_excel(buf, index=False)
+    patient_bytes = buf.getvalue()
+    menu_bytes = open(me.MENU_PATH, "rb").read()
+    cache = me.UploadCache()
+
+    def rerun():
+        cache.get_or_load("menu", menu_bytes, me.load_menu_upload)
+        cache.get_or_load("patient", patient_bytes, me.load_patient_upload)
+
+    t_cold = timeit(rerun, repeat=1)
+    t_warm = timeit(rerun)
+    print(f"  residents=10,000  첫 업로드 {t_cold * 1000:9.1f} ms   재실행 {t_warm * 1000:7.2f} ms   "
+          f"hits={cache.hits} misses={cache.misses} {cache.nbytes / 1e6:.1f} MB")
+
+def bench_xlsx_cache():
+    print("[xlsx_cache] 콜드 스타트: 메뉴/MFDS xlsx 파싱 vs Parquet 사본")
+    with tempfile.TemporaryDirectory() as tmp:
+        menu_path = shutil.copy(me.MENU_PATH, tmp)
+        mfds_path = shutil.copy(me.MFDS_PATH, tmp)
+
+        def startup():
+            me.load_menu_workbook(menu_path)
+            me.load_disease_standards(mfds_path)
+
+        t_xlsx = timeit(lambda: (pd.read_excel(menu_path, sheet_name=None), pd.read_excel(mfds_path, sheet_name=0, index_col=0)))
+        t_build = timeit(startup, repeat=1)
+        t_cached = timeit(startup)
+        os.utime(menu_path)
+        t_touched = timeit(startup, repeat=1)
+        print(f"  xlsx 파싱 {t_xlsx * 1000:7.1f} ms   사본 생성 {t_build * 1000:7.1f} ms   "
+              f"사본 로드 {t_cached * 1000:6.1f} ms   mtime만 변경 {t_touched * 1000:6.1f} ms")
+
+def legacy_extract_float(text):
+    # 기존 숫자 파싱 그대로 (천 단위 쉼표를 읽지 않는다). 엔진 쪽 파싱이 바뀌어도 비교 기준은 고정
+    match = re.search(r"[-+]?\d*\.?\d+", str(text))
+    return float(match.group()) if match else None
+
+def legacy_evaluate_nutrient_criteria(nutrient, value, rule, total_energy=None):
+    # 호출마다 규칙 문자열을 파싱하던 기존 판정 함수 (print 제외, 비교 기준)
+    extract_float = legacy_extract_float
+    rule = str(rule).strip()
+    if "%" in rule and total_energy:
+        if nutrient in ["포화지방(g)", "지방(g)"]:
+            ratio = (value * 9 / total_energy) * 100
+        elif nutrient in ["단백질(g)", "탄수화물(g)", "당류(g)"]:
+            ratio = (value * 4 / total_energy) * 100
+        else:
+            return ""
+        if "~" in rule:
+            parts = rule.replace("%", "").split("~")
+            low, high = extract_float(parts[0]), extract_float(parts[1])
+            return "충족" if low <= ratio <= high else "미달"
+        limit = extract_float(rule)
+        if "이하" in rule:
+            return "충족" if ratio <= limit else "미달"
+        elif "미만" in rule:
+            return "충족" if ratio < limit else "미달"
+        elif "이상" in rule:
+            return "충족" if ratio >= limit else "미달"
+        return ""
+    if rule.endswith("이하"):
+        return "충족" if value <= extract_float(rule) else "미달"
+    elif rule.endswith("이상"):
+        return "충족" if value >= extract_float(rule) else "미달"
+    elif rule.endswith("미만"):
+        return "충족" if value < extract_float(rule) else "미달"
+    elif "~" in rule:
+        parts = rule.split("~")
+        low, high = extract_float(parts[0]), extract_float(parts[1])
+        return "충족" if low <= value <= high else "미달"
+    return ""
+
+def legacy_evaluation_summary(total_nutrients, diseases, disease_standards):
+    evaluation = {}
+    standard = disease_standards.get(", ".join(sorted([d.strip() for d in diseases])), {})
+    total_energy = total_nutrients.get("에너지(kcal)", 0)
+    for nutrient in me.EVALUATION_NUTRIENTS:
+        rule = standard.get(nutrient, "")
+        evaluation[nutrient + "_기준"] = rule
+        evaluation[nutrient + "_평가"] = legacy_evaluate_nutrient_criteria(
+            nutrient, total_nutrients.get(nutrient, 0), rule, total_energy)
+    return evaluation
+
+def make_totals(n, seed=0):
+    # 수급자별 한 끼 영양소 합계 (에너지 0/NaN 행 포함)
+    rng = np.random.default_rng(seed)
+    scale = {"에너지(kcal)": 600, "당류(g)": 15, "식이섬유(g)": 10, "단백질(g)": 25, "지방(g)": 20,
+             "포화지방(g)": 6, "나트륨(mg)": 900, "칼륨(mg)": 900, "탄수화물(g)": 90}
+    totals = pd.DataFrame({k: rng.uniform(0, 2 * v, n) for k, v in scale.items()})
+    totals.loc[totals.sample(frac=0.01, random_state=seed).index, "에너지(kcal)"] = 0
+    totals.loc[totals.sample(frac=0.01, random_state=seed + 1).index, "에너지(kcal)"] = np.nan
+    return totals
+
+def bench_mfds_rules():
+    print("[mfds_rules] 호출마다 문자열 파싱 vs 미리 컴파일한 규칙의 배열 비교")
+    disease_standards = me.load_disease_standards()
+    standards = me.compile_standards(disease_standards)
+    keys = list(disease_standards) + ["질환없음"]
+    for n in [1_000, 10_000]:
+        totals = make_totals(n)
+        disease_keys = [keys[i % len(keys)] for i in range(n)]
+
+        def legacy():
+            return pd.DataFrame([
+                legacy_evaluation_summary(row, key.split(", "), disease_standards)
+                for (_, row), key in zip(totals.iterrows(), disease_keys)
+            ])
+
+        expected = legacy()
+        actual = me.evaluate_compliance(totals, disease_keys, standards)
+        pd.testing.assert_frame_equal(expected, actual)
+
+        t_old = timeit(legacy, repeat=1)
+        t_new = timeit(lambda: me.evaluate_compliance(totals, disease_keys, standards))
+        print(f"  n={n:>7,}  per-call {t_old * 1000:9.1f} ms   compiled {t_new * 1000:7.1f} ms   x{t_old / t_new:6.1f}")
+
+def bench_facility_compliance():
+    print("[facility_compliance] 수급자별 평가 루프 vs groupby 합산 + 일괄 판정")
+    category_df = load_category_df()
+    disease_standards = me.load_disease_standards()
+    standards = me.compile_standards(disease_standards)
+    for n in [1_000, 10_000]:
+        patient_df = me.classify_patients(make_roster(n))
+        adjusted_results = me.generate_final_results(patient_df, category_df)
+
+        def legacy():
+            rows = []
+            for df in adjusted_results.values():
+                for sid in df["수급자ID"].unique():
+                    target = df[df["수급자ID"] == sid]
+                    total_nutrients = target[me.MENU_NUTRIENT_COLUMNS].sum(numeric_only=True)
+                    disease_value = patient_df[patient_df["수급자ID"] == sid]["질환"].values[0]
+                    diseases = [d.strip() for d in disease_value.split(",")] if disease_value else ["질환없음"]
+                    row = {"수급자ID": sid, "질환": disease_value}
+                    row.update(legacy_evaluation_summary(total_nutrients, diseases, disease_standards))
+                    rows.append(row)
+            return pd.DataFrame(rows)
+
+        actual = me.evaluate_facility(adjusted_results, patient_df, standards)
+        if n <= 1_000:
+            pd.testing.assert_frame_equal(legacy(), actual)
+            t_old = timeit(legacy, repeat=1)
+            old = f"per-resident {t_old * 1000:9.1f} ms"
+        else:
+            old = " " * 25
+        t_new = timeit(lambda: me.evaluate_facility(adjusted_results, patient_df, standards))
+        print(f"  n={n:>7,}  {old}   bulk {t_new * 1000:7.1f} ms")
+
+def legacy_update_rice_nutrient(match, category_df):
+    rice_row = match[match["Category"] == "밥"]
+    if rice_row.empty:
+        return match
+    actual_rice = category_df[(category_df["Category"] == "밥") & (category_df["Menu"] == rice_row["Menu"].values[0])]
+    if not actual_rice.empty:
+        for col in me.PORTION_COLUMNS:
+            match.loc[rice_row.index[0], col] = actual_rice[col].values[0]
+    return match
+
+def legacy_adjust(match, resident):
+    # adjust_rice_if_nutrient_insufficient에서 화면 출력을 뺀 수급자 단위 계산 (비교 기준)
+    match = match.copy()
+    totals = match[me.PORTION_COLUMNS].sum(numeric_only=True)
+    idxs = match[match["Category"].isin(me.ADJUSTABLE_CATEGORIES)].index.tolist()
+    if not idxs:
+        return match, 1.0
+    current_vals = match.loc[idxs, me.PORTION_COLUMNS].sum(numeric_only=True)
+    ratios = []
+    for nutrient in me.TARGET_NUTRIENTS:
+        min_val, max_val = resident[list(me.target_bounds(nutrient))]
+        actual, adjust_val = totals[nutrient], current_vals[nutrient]
+        if adjust_val == 0:
+            ratios.append(1.0)
+        elif actual < min_val:
+            ratios.append((adjust_val + (min_val - actual)) / adjust_val)
+        elif actual > max_val:
+            ratios.append((adjust_val - (actual - max_val)) / adjust_val)
+        else:
+            ratios.append(1.0)
+    most_significant_ratio = max(ratios, key=lambda r: abs(r - 1.0))
+    rounded_ratio = min(me.ALLOWED_RATIOS, key=lambda x: abs(x - most_significant_ratio))
+    for col in me.PORTION_COLUMNS:
+        match.loc[idxs, col] = match.loc[idxs, col].astype(float) * rounded_ratio
+    return match, rounded_ratio
+
+def bench_facility_adjust():
+    print("[facility_adjust] 수급자별 밥 교체·비율 조정 루프 vs 전체 수급자 일괄 조정")
+    category_df = load_category_df()
+    for n in [300, 10_000]:
+        patient_df = me.prepare_patient_df(make_roster(n))
+        final_results = me.generate_final_results(patient_df, category_df)
+        index = me.build_resident_index(patient_df, final_results)
+
+        def legacy():
+            adjusted, applied = {}, {}
+            for disease, df in final_results.items():
+                parts = []
+                for sid, rows in df.groupby("수급자ID", sort=False).indices.items():
+                    match = legacy_update_rice_nutrient(df.iloc[rows].astype({c: float for c in me.PORTION_COLUMNS}), category_df)
+                    match, applied[sid] = legacy_adjust(match, patient_df.iloc[index[sid]["pos"]])
+                    parts.append(match)
+                adjusted[disease] = pd.concat(parts)
+            return adjusted, applied
+
+        rice_index = me.build_rice_index(category_df)
+        actual, ratios, _ = me.adjust_facility(final_results, patient_df, rice_index)
+        if n <= 300:
+            expected, applied = legacy()
+            for disease in expected:
+                pd.testing.assert_frame_equal(expected[disease], actual[disease])
+            assert ratios["적용비율"].to_dict() == applied, "적용비율"
+            t_old = timeit(legacy, repeat=1)
+            old = f"per-resident {t_old * 1000:9.1f} ms"
+        else:
+            old = " " * 25
+        t_new = timeit(lambda: me.adjust_facility(final_results, patient_df, rice_index))
+        print(f"  n={n:>7,}  {old}   batch {t_new * 1000:7.1f} ms")
+
+def bench_rice_index():
+    print("[rice_index] 수급자별 category_df 검색 vs 밥 메뉴 색인 조인")
+    category_df = load_category_df()
+    rice_names = set(category_df.loc[category_df["Category"] == "밥", "Menu"])
+    for n in [300, 10_000]:
+        patient_df = me.prepare_patient_df(make_roster(n))
+        final_results = me.generate_final_results(patient_df, category_df)
+
+        def legacy():
+            adjusted = {}
+            for disease, df in final_results.items():
+                df = df.astype({c: float for c in me.PORTION_COLUMNS})
+                parts = [legacy_update_rice_nutrient(df.iloc[rows], category_df)
+                         for rows in df.groupby("수급자ID", sort=False).indices.values()]
+                adjusted[disease] = pd.concat(parts)
+            return adjusted
+
+        def indexed():
+            rice_index = me.build_rice_index(category_df)
+            return {disease: me.update_rice_nutrients(df, rice_index) for disease, df in final_results.items()}
+
+        result = indexed()
+        expected_missing = sorted({
+            m for df in final_results.values()
+            for m in df.loc[df["Category"] == "밥", "Menu"] if m not in rice_names
+        })
+        assert sorted(set().union(*(missing for _, missing in result.values()))) == expected_missing
+        if n <= 300:
+            expected = legacy()
+            for disease in expected:
+                pd.testing.assert_frame_equal(expected[disease], result[disease][0])
+            t_old = timeit(legacy, repeat=1)
+            old = f"scan {t_old * 1000:9.1f} ms"
+        else:
+            old = " " * 17
+        t_new = timeit(indexed)
+        print(f"  n={n:>7,}  {old}   index {t_new * 1000:7.1f} ms   없는 밥 메뉴 {expected_missing}")
+
+def legacy_solve(match, resident, standards):
+    # 수급자 한 명씩 후보 조합을 모두 적용해 보고 위반량이 가장 작은 조합을 고르는 참조 구현
+    limit_low, limit_high = me.mfds_limits(me.disease_keys_from_labels([resident["질환"]]), standards)
+    low = np.r_[[resident[me.target_bounds(n)[0]] for n in me.TARGET_NUTRIENTS], limit_low[0]].astype(float)
+    high = np.r_[[resident[me.target_bounds(n)[1]] for n in me.TARGET_NUTRIENTS], limit_high[0]].astype(float)
+    if np.isnan(low).any() or not match["Category"].isin(me.ADJUSTABLE_CATEGORIES).any():
+        return (1.0, 1.0)
+    best, best_violation = None, None
+    for ratios in me.PORTION_GRID:
+        scale = match["Category"].map(dict(zip(me.ADJUSTABLE_CATEGORIES, ratios))).fillna(1.0)
+        totals = (match[me.TARGET_NUTRIENTS + me.LIMIT_NUTRIENTS].fillna(0).mul(scale, axis=0)).sum().to_numpy()
+        violation = me.portion_violation(totals, low, high)
+        if best_violation is None or violation < best_violation - 1e-12:
+            best, best_violation = tuple(ratios), violation
+    return best
+
+def bench_portion_solver():
+    print("[portion_solver] 밥+주찬 단일 비율 vs 밥·주찬 최적 비율 (전수 탐색)")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards(me.MFDS_PATH))
+    rice_index = me.build_rice_index(category_df)
+    for n in [200, 1_000, 10_000]:
+        patient_df = me.prepare_patient_df(make_roster(n))
+        final_results = me.generate_final_results(patient_df, category_df)
+        adjusted, diagnostics, _ = me.adjust_facility(final_results, patient_df, rice_index, method="solver", standards=standards)
+        assert (diagnostics["위반_최적"] <= diagnostics["위반_단일비율"] + 1e-9).all()
+        if n <= 200:
+            index = me.build_resident_index(patient_df, final_results)
+            for disease, df in final_results.items():
+                df, _ = me.update_rice_nutrients(df, rice_index)
+                for sid, rows in df.groupby("수급자ID", sort=False).indices.items():
+                    expected = legacy_solve(df.iloc[rows], patient_df.iloc[index[sid]["pos"]], standards)
+                    assert expected == tuple(diagnostics.loc[sid, ["밥_비율", "주찬_비율"]]), sid
+        t_ratio = timeit(lambda: me.adjust_facility(final_results, patient_df, rice_index))
+        t_solver = timeit(lambda: me.adjust_facility(final_results, patient_df, rice_index, method="solver", standards=standards))
+        violated = (diagnostics[["위반_조정전", "위반_단일비율", "위반_최적"]] > 0).sum()
+        totals = diagnostics[["위반_조정전", "위반_단일비율", "위반_최적"]].sum()
+        print(f"  n={n:>7,}  ratio {t_ratio * 1000:7.1f} ms   solver {t_solver * 1000:7.1f} ms   "
+              f"위반량 {totals['위반_조정전']:.1f} → 단일 {totals['위반_단일비율']:.1f} → 최적 {totals['위반_최적']:.1f}   "
+              f"위반 수급자 {violated['위반_조정전']:,} → {violated['위반_단일비율']:,} → {violated['위반_최적']:,}")
+
+def legacy_min_swaps(resident_menu, disease, suffix, category_df, pool, standards):
+    # 참조 구현: 모든 대체 조합을 합계 Series로 만들어 generate_evaluation_summary로 판정, 통과하는 최소 교체 수
+    base_weights = me.select_disease_menu(category_df, disease).set_index("Category")["총 중량"]
+    slots = {cat: resident_menu[resident_menu["Category"] == cat].iloc[0] for cat in me.SUBSTITUTABLE_CATEGORIES}
+    base = resident_menu[me.PORTION_COLUMNS].astype(float).fillna(0).sum()
+    diseases = resident_menu["질환"].iloc[0].split(", ")
+    best = None
+    for picks in itertools.product(*[range(len(pool[cat][0])) for cat in me.SUBSTITUTABLE_CATEGORIES]):
+        totals = base.copy()
+        swaps = 0
+        for cat, j in zip(me.SUBSTITUTABLE_CATEGORIES, picks):
+            names, matrix = pool[cat]
+            if names[j] + suffix == slots[cat]["Menu"]:
+                continue
+            multiplier = float(slots[cat]["총 중량"]) / base_weights[cat]
+            totals += multiplier * matrix[j] - slots[cat][me.PORTION_COLUMNS].astype(float).fillna(0)
+            swaps += 1
+        summary = me.generate_evaluation_summary(totals, diseases, standards)
+        if "미달" not in summary.values() and (best is None or swaps < best):
+            best = swaps
+    return best
+
+def bench_substitution():
+    print("[substitution] MFDS 미달 수급자 대체 메뉴 탐색 (범주별 후보 행렬 + 가지치기)")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards(me.MFDS_PATH))
+    rice_index = me.build_rice_index(category_df)
+    pool = me.substitution_pool(category_df)
+    for n in [60, 1_000, 10_000]:
+        patient_df = me.prepare_patient_df(make_roster(n))
+        final_results = me.generate_final_results(patient_df, category_df)
+        adjusted, _, _ = me.adjust_facility(final_results, patient_df, rice_index)
+        result, report = me.substitute_menus(adjusted, patient_df, category_df, standards, time_budget=600)
+        evaluation = me.evaluate_facility(result, patient_df, standards).set_index("수급자ID")
+        failed = (evaluation[[c for c in evaluation.columns if c.endswith("_평가")]] == "미달").any(axis=1)
+        assert not failed[report.index[report["대체상태"] == "해결"]].any()
+        assert failed[report.index[report["대체상태"] != "해결"]].all()
+        if n <= 60:
+            first = patient_df.drop_duplicates("수급자ID").set_index("수급자ID")
+            for disease, df in adjusted.items():
+                for sid in report.index.intersection(df["수급자ID"].unique()):
+                    suffix = first.loc[sid, "식단옵션"]["suffix"]
+                    expected = legacy_min_swaps(df[df["수급자ID"] == sid], disease, suffix, category_df, pool, standards)
+                    assert (expected is None) == (report.loc[sid, "대체상태"] == "불가능"), sid
+                    assert expected is None or expected == report.loc[sid, "대체수"], sid
+        t = timeit(lambda: me.substitute_menus(adjusted, patient_df, category_df, standards, time_budget=600))
+        counts = report["대체상태"].value_counts().to_dict()
+        print(f"  n={n:>7,}  {t * 1000:8.1f} ms   미달 {len(report):,}명 → {counts}")
+
+    # 범주별 후보 ~100개: 4범주 조합은 ~10⁸개라 만들지 않고 구간별로 훑다가 시간 예산에서 멈춰야 한다
+    wide = make_wide_menu(category_df, 20)
+    patient_df = me.prepare_patient_df(make_roster(200))
+    final_results = me.generate_final_results(patient_df, wide)
+    adjusted, _, _ = me.adjust_facility(final_results, patient_df, me.build_rice_index(wide))
+    budget = 5.0
+    started = time.perf_counter()
+    _, report = me.substitute_menus(adjusted, patient_df, wide, standards, time_budget=budget)
+    elapsed = time.perf_counter() - started
+    assert elapsed < budget + 2.0, elapsed
+    counts = report["대체상태"].value_counts().to_dict()
+    sizes = {category: len(names) for category, (names, _) in me.substitution_pool(wide).items()}
+    print(f"  후보 {sizes}, n=200, 예산 {budget:.0f}s  {elapsed:6.2f} s   미달 {len(report):,}명 → {counts}")
+
+def make_wide_menu(category_df, per_category, seed=0):
+    # 질환·범주마다 영양성분을 흔든 가상 메뉴를 per_category개씩 만든 category 시트
+    rng = np.random.default_rng(seed)
+    base = category_df.drop_duplicates(["Disease", "Category"])
+    frames = []
+    for k in range(per_category):
+        variant = base.copy()
+        variant["Menu"] = variant["Menu"] + ("" if k == 0 else f"_{k}")
+        if k:
+            factors = rng.uniform(0.7, 1.3, size=(len(variant), len(me.PORTION_COLUMNS)))
+            variant[me.PORTION_COLUMNS] = variant[me.PORTION_COLUMNS].astype(float).to_numpy() * factors
+        frames.append(variant)
+    return pd.concat(frames, ignore_index=True)
+
+def bench_cycle_plan():
+    print("[cycle_plan] 질환 5종 주기 식단 (반복 제한 + 매일 MFDS 기준 + 주 평균 목표)")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards(me.MFDS_PATH))
+    patient_df = me.prepare_patient_df(make_roster(1_000))
+    for label, menu in [("bundled", category_df), ("wide x20", make_wide_menu(category_df, 20))]:
+        for days in [7, 28]:
+            started = time.perf_counter()
+            plan, report = me.plan_cycle_menus(menu, standards, days=days, patient_df=patient_df)
+            elapsed = time.perf_counter() - started
+            assert (plan.groupby("Disease", observed=True)["일차"].nunique() == days).all()
+            assert not plan.duplicated(["Disease", "일차", "Menu"]).any()
+            for _, row in report.iterrows():
+                # 보고서의 반복 제한이 실제로 지켜졌는지
+                windows = dict(item.rsplit(" ", 1) for item in row["반복제한"].split(", ")) if row["반복제한"] != "없음" else {}
+                for category, window in windows.items():
+                    days_used = plan[(plan["Disease"] == row["질환"]) & (plan["Category"] == category)].groupby("Menu")["일차"]
+                    assert (days_used.diff().dropna() > int(window.rstrip("일"))).all(), (row["질환"], category)
+            relaxed = {r["질환"]: r["완화"] or "-" for _, r in report.iterrows()}
+            print(f"  {label:<9} {days:>2}일  {elapsed * 1000:8.1f} ms   기준미달일수 {report['기준미달일수'].sum()}   완화 {relaxed}")
+
+def bench_batch():
+    print("[batch] 요양원별 파일 일괄 처리 (ProcessPoolExecutor)")
+    import batch
+
+    workdir = tempfile.mkdtemp()
+    try:
+        patient_dir = os.path.join(workdir, "patients")
+        os.makedirs(patient_dir)
+        for i in range(6):
+            make_roster(300, seed=i).to_excel(os.path.join(patient_dir, f"center{i}.xlsx"), index=False)
+        for workers in sorted({1, os.cpu_count() or 1}):
+            results, elapsed = batch.run_batch(patient_dir, os.path.join(workdir, f"out{workers}"), workers=workers)
+            assert all("error" not in r for r in results)
+            residents = sum(r["residents"] for r in results)
+            print(f"  workers={workers}  {elapsed:6.2f} s   {len(results) / elapsed:5.2f}곳/s   {residents / elapsed:7,.0f}명/s")
+    finally:
+        shutil.rmtree(workdir)
+
+def bench_cli():
+    print("[cli] python -m meal_engine: import 비용과 요양원 한 곳 처리")
+    import subprocess
+
+    # 새 인터프리터에서 import만: Streamlit/엑셀 엔진을 끌어오지 않고 파일도 읽지 않아야 한다
+    probe = (
+        "import sys, time; t = time.perf_counter(); import meal_engine; "
+        "print(time.perf_counter() - t, 'streamlit' in sys.modules, 'openpyxl' in sys.modules)"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(me.__file__)))
+    for _ in range(3):
+        out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env, check=True)
+        seconds, streamlit, openpyxl = out.stdout.split()
+        assert streamlit == "False" and openpyxl == "False"
+    print(f"  import meal_engine   {float(seconds) * 1000:7.1f} ms   (streamlit {streamlit}, openpyxl {openpyxl})")
+
+    workdir = tempfile.mkdtemp()
+    try:
+        patient_path = os.path.join(workdir, "center.xlsx")
+        make_roster(300).to_excel(patient_path, index=False)
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "meal_engine", patient_path, "--menu", os.path.abspath(me.MENU_PATH),
+             "--mfds", os.path.abspath(me.MFDS_PATH), "--out", os.path.join(workdir, "out.xlsx"),
+             "--json", os.path.join(workdir, "out.json")],
+            capture_output=True, env=env, check=True,
+        )
+        print(f"  300명 → xlsx + json  {time.perf_counter() - started:7.2f} s (프로세스 시작 포함)")
+        with open(os.path.join(workdir, "out.json"), encoding="utf-8") as f:
+            assert len(json.load(f)["수급자"]) == 300
+        assert set(pd.read_excel(os.path.join(workdir, "out.xlsx"), sheet_name=None)) <= set(me.DISEASE_TYPES)
+    finally:
+        shutil.rmtree(workdir)
+
+def legacy_write_results_workbook(adjusted_results, patient_df, output):
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        for disease, df in adjusted_results.items():
+            merged = df.merge(
+                patient_df[["수급자ID"]].join(me.render_nutrient_targets(patient_df)),
+                on="수급자ID", how="left"
+            )
+            merged.to_excel(writer, sheet_name=disease, index=False)
+    return output
+
+# 입력을 읽는 동안(unpickle)의 최대 RSS가 내보내기보다 커서 ru_maxrss로는 차이가 보이지 않는다
+# → 읽은 뒤 최대치(VmHWM)를 지우고(/proc/self/clear_refs), 그 시점 RSS를 기준으로 내보내기 중 최대치를 잰다
+# tracemalloc은 할당마다 기록을 붙여 시간·RSS를 부풀리므로 따로 한 번 더 돌려 파이썬 힙 최대치만 잰다
+EXPORT_PROBE = """
+import gc, os, pickle, re, sys, tempfile, time, tracemalloc
+from io import BytesIO
+import benchmark, meal_engine as me
+with open(sys.argv[1], "rb") as f:
+    adjusted_results, patient_df = pickle.load(f)
+
+def export():
+    if sys.argv[2] == "legacy":
+        output = BytesIO()
+        benchmark.legacy_write_results_workbook(adjusted_results, patient_df, output)
+        return output.getvalue()
+    path = os.path.join(tempfile.mkdtemp(), "out.xlsx")
+    me.write_results_workbook(adjusted_results, patient_df, path)
+    with open(path, "rb") as f:
+        return f.read()
+
+def status_kb(field):
+    with open("/proc/self/status") as f:
+        return int(re.search(field + r":\\s+(\\d+)", f.read()).group(1))
+
+gc.collect()
+if sys.argv[3] == "rss":
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = status_kb("VmRSS")
+    started = time.perf_counter()
+    data = export()
+    seconds = time.perf_counter() - started
+    print(before, status_kb("VmHWM"), seconds, len(data))
+else:
+    tracemalloc.start()
+    data = export()
+    print(tracemalloc.get_traced_memory()[1])
+"""
+
+def bench_export():
+    print("[export] 결과 엑셀: merge + to_excel(BytesIO) → constant_memory 스트리밍(임시 파일)")
+    import pickle
+    import subprocess
+
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+
+    # 같은 결과인지: 작은 명단으로 두 방식의 시트를 비교
+    patient_df = me.prepare_patient_df(make_roster(300))
+    adjusted_results = me.run_facility(patient_df, category_df, standards)[0]
+    legacy = pd.read_excel(legacy_write_results_workbook(adjusted_results, patient_df, BytesIO()), sheet_name=None)
+    streamed = pd.read_excel(me.write_results_workbook(adjusted_results, patient_df, BytesIO()), sheet_name=None)
+    assert list(legacy) == list(streamed)
+    for disease in legacy:
+        pd.testing.assert_frame_equal(legacy[disease], streamed[disease])
+
+    # 변형마다 새 프로세스에서 같은 입력(pickle)을 읽은 뒤 내보내기만 잰다 (RSS·시간 한 번, tracemalloc 한 번)
+    workdir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        for n in (2_000, 10_000):
+            patient_df = me.prepare_patient_df(make_roster(n))
+            adjusted_results = me.run_facility(patient_df, category_df, standards)[0]
+            rows = sum(len(df) for df in adjusted_results.values())
+            pickle_path = os.path.join(workdir, f"results{n}.pkl")
+            with open(pickle_path, "wb") as f:
+                pickle.dump((adjusted_results, patient_df), f)
+            measured = {}
+            for variant in ("legacy", "stream"):
+                probe = lambda mode: subprocess.run(
+                    [sys.executable, "-c", EXPORT_PROBE, pickle_path, variant, mode],
+                    capture_output=True, text=True, env=env, check=True,
+                ).stdout.split()
+                before, peak, seconds, size = map(float, probe("rss"))
+                heap = float(probe("heap")[0])
+                measured[variant] = ((peak - before) / 1024, heap / 1e6)
+                print(
+                    f"  n={n:6d} ({rows:,}행) {variant:6s}  {seconds:6.2f} s   "
+                    f"RSS 내보내기 전 {before / 1024:6.1f} MB → 최대 {peak / 1024:6.1f} MB (+{(peak - before) / 1024:6.1f} MB)   "
+                    f"tracemalloc 최대 {heap / 1e6:6.1f} MB   파일 {size / 1e6:5.2f} MB"
+                )
+            (legacy_rss, legacy_heap), (stream_rss, stream_heap) = measured["legacy"], measured["stream"]
+            print(
+                f"  n={n:6d} 차이 (legacy - stream)  RSS 증가분 {legacy_rss - stream_rss:+6.1f} MB   "
+                f"tracemalloc 최대 {legacy_heap - stream_heap:+6.1f} MB"
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+def bench_formats():
+    print("[formats] 내보내기 형식별 쓰기/읽기 시간과 크기 (같은 조정 결과)")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    patient_df = me.prepare_patient_df(make_roster(10_000))
+    adjusted_results = me.run_facility(patient_df, category_df, standards)[0]
+    table = me.results_table(adjusted_results, patient_df)
+    readers = {
+        "xlsx": lambda path: pd.read_excel(path, sheet_name=None),
+        "parquet": pd.read_parquet,
+        "csv.gz": pd.read_csv,
+        "ndjson": lambda path: pd.read_json(path, lines=True),
+    }
+
+    workdir = tempfile.mkdtemp()
+    try:
+        for fmt in me.EXPORT_FORMATS:
+            path = os.path.join(workdir, me.export_file_name("bench", fmt))
+            write_time = timeit(lambda: me.write_results(adjusted_results, patient_df, path, fmt), repeat=1)
+            started = time.perf_counter()
+            loaded = readers[fmt](path)
+            read_time = time.perf_counter() - started
+            if fmt == "xlsx":
+                loaded = pd.concat(loaded.values(), ignore_index=True)
+            assert len(loaded) == len(table)
+            if fmt == "parquet":
+                pd.testing.assert_frame_equal(loaded, table)
+            print(
+                f"  {fmt:8s} 쓰기 {write_time * 1000:8.1f} ms   읽기 {read_time * 1000:8.1f} ms   "
+                f"{os.path.getsize(path) / 1e6:6.2f} MB   ({len(table):,}행)"
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+def bench_cards():
+    print("[cards] 수급자별 식단 카드 ZIP (생성기 + 스레드 풀)")
+    import tracemalloc
+    import zipfile
+
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    workdir = tempfile.mkdtemp()
+    try:
+        for n in (500, 2_000):
+            patient_df = me.prepare_patient_df(make_roster(n))
+            adjusted_results, eval_df, _, _ = me.run_facility(patient_df, category_df, standards)
+            path = os.path.join(workdir, f"cards{n}.zip")
+            for workers in sorted({1, os.cpu_count() or 1, 4}):
+                elapsed = timeit(lambda: me.write_resident_cards_zip(adjusted_results, eval_df, patient_df, path, workers=workers), repeat=1)
+                print(f"  n={n:5d} workers={workers}  {elapsed:6.2f} s   {n / elapsed:6.0f}장/s   {os.path.getsize(path) / 1e6:6.2f} MB")
+            with zipfile.ZipFile(path) as bundle:
+                assert len(bundle.namelist()) == patient_df["수급자ID"].nunique()
+
+            # 카드가 늘어도 파이썬 힙 최대치는 거의 그대로여야 한다 (미리 만들어 두는 카드는 스레드 수 × 2장)
+            tracemalloc.start()
+            me.write_resident_cards_zip(adjusted_results, eval_df, patient_df, path, workers=4)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  n={n:5d} tracemalloc 최대 {peak / 1e6:6.2f} MB")
+    finally:
+        shutil.rmtree(workdir)
+
+def legacy_ingredient_totals(usage, ingredient_df, by=()):
+    # 행마다 레시피 재료를 하나씩 더하는 중첩 루프
+    recipes = pd.Index(ingredient_df["Menu"].dropna().unique())
+    totals = {}
+    for _, row in usage.iterrows():
+        recipe = me.resolve_recipe(row["Menu"], recipes)
+        if recipe is None:
+            continue
+        key = tuple(row[c] for c in by)
+        for _, item in ingredient_df[ingredient_df["Menu"] == recipe].iterrows():
+            totals[key + (item["Ingredient"],)] = totals.get(key + (item["Ingredient"],), 0.0) + row["인분"] * item["Amount_g"]
+    return totals
+
+def bench_procurement():
+    print("[procurement] 식자재 발주량: 희소 행렬 곱(bincount) vs 행·재료 중첩 루프")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    ingredient_df = me.load_menu_workbook()["ingredient"]
+    index = me.build_ingredient_index(ingredient_df)
+
+    def check(table, expected, by):
+        got = {tuple(row[c] for c in by) + (row["Ingredient"],): row["총량(g)"] for _, row in table.iterrows()}
+        assert got.keys() == {k for k, v in expected.items() if v > 0}
+        assert all(abs(got[k] - expected[k]) < 1e-6 * max(1.0, expected[k]) for k in got)
+
+    # 오늘 한 끼: 수급자별 조정 식단(양 조절 비율 반영)
+    for n in (300, 10_000):
+        patient_df = me.prepare_patient_df(make_roster(n))
+        adjusted_results, _, ratio_table, _ = me.run_facility(patient_df, category_df, standards, method="solver")
+        usage = me.facility_usage(adjusted_results, ratio_table)
+        new_time = timeit(lambda: me.aggregate_ingredients(usage, index))
+        table, _ = me.aggregate_ingredients(usage, index)
+        line = f"  한 끼 n={n:6d} ({len(usage):,}행)  new {new_time * 1000:7.1f} ms"
+        if n <= 300:
+            legacy_time = timeit(lambda: legacy_ingredient_totals(usage, ingredient_df), repeat=1)
+            check(table, legacy_ingredient_totals(usage, ingredient_df), [])
+            line += f"   legacy {legacy_time * 1000:8.1f} ms   x{legacy_time / new_time:,.0f}"
+        print(line)
+
+    # 요양원 10곳 × 28일 주기 식단 (요양원·일차별)
+    plan, _ = me.plan_cycle_menus(category_df, standards, days=28)
+    usages = []
+    for i in range(10):
+        patient_df = me.prepare_patient_df(make_roster(450, seed=i))
+        ratio_table = me.run_facility(patient_df, category_df, standards)[2]
+        usages.append(me.plan_usage(plan, patient_df, ratio_table).assign(요양원=f"center{i}"))
+    usage = pd.concat(usages, ignore_index=True)
+    by = ["요양원", "일차"]
+    new_time = timeit(lambda: me.aggregate_ingredients(usage, index, by=by))
+    table, _ = me.aggregate_ingredients(usage, index, by=by)
+    check(table, legacy_ingredient_totals(usage, ingredient_df, by), by)
+    print(f"  요양원 10곳 × 28일 ({len(usage):,}행 → {len(table):,}행)  new {new_time * 1000:7.1f} ms")
+
+def legacy_recipe_nutrients(ingredient_df):
+    # 레시피마다 재료 행을 돌며 (g / 기준량) × 영양성분을 더하는 루프
+    totals = {}
+    for _, row in ingredient_df.iterrows():
+        per = row["Amount_g"] / row["영양성분함량기준량"]
+        recipe = totals.setdefault(row["Menu"], dict.fromkeys(me.MENU_NUTRIENT_COLUMNS, 0.0))
+        for col in me.MENU_NUTRIENT_COLUMNS:
+            if pd.notna(row[col]):
+                recipe[col] += per * row[col]
+    return pd.DataFrame.from_dict(totals, orient="index")[me.MENU_NUTRIENT_COLUMNS]
+
+def bench_nutrient_compose():
+    print("[nutrient_compose] 재료 기준 메뉴 영양성분: 밀집 행렬 곱 vs 재료 행 루프")
+    sheets = me.load_menu_workbook()
+    category_df = load_category_df()
+    ingredient_df = sheets["ingredient"]
+
+    index = me.build_ingredient_index(ingredient_df)
+    composed = me.compose_recipe_nutrients(index, sheets["nutrient"], category_df)
+    pd.testing.assert_frame_equal(
+        composed[me.MENU_NUTRIENT_COLUMNS].rename_axis(None),
+        legacy_recipe_nutrients(ingredient_df).reindex(composed.index).rename_axis(None),
+        check_exact=False,
+    )
+    legacy_time = timeit(lambda: legacy_recipe_nutrients(ingredient_df))
+    new_time = timeit(lambda: me.compose_recipe_nutrients(me.build_ingredient_index(ingredient_df), sheets["nutrient"], category_df))
+    print(f"  번들 메뉴 ({len(index.recipes)} 레시피, {len(ingredient_df)} 재료 행)  new {new_time * 1000:6.1f} ms   legacy {legacy_time * 1000:7.1f} ms")
+
+    # 레시피를 200배로 늘린 메뉴 파일
+    wide = pd.concat(
+        [ingredient_df.assign(Menu=ingredient_df["Menu"] + f"#{i}") for i in range(200)], ignore_index=True
+    )
+    legacy_time = timeit(lambda: legacy_recipe_nutrients(wide), repeat=1)
+    new_time = timeit(lambda: me.compose_recipe_nutrients(me.build_ingredient_index(wide)))
+    print(f"  x200 ({len(wide):,} 재료 행)  new {new_time * 1000:6.1f} ms   legacy {legacy_time * 1000:7.1f} ms")
+
+    # 업로드 캐시: 같은 메뉴 파일이면 두 번째부터 계산 없이 재사용
+    data = open(me.MENU_PATH, "rb").read()
+    cache = me.UploadCache()
+    loader = lambda d: me.load_menu_upload_recomputed(d)[0]
+    first = timeit(lambda: cache.get_or_load("menu_ingredient", data, loader), repeat=1)
+    again = timeit(lambda: cache.get_or_load("menu_ingredient", data, loader))
+    print(f"  업로드 캐시  첫 계산 {first * 1000:6.1f} ms   재사용 {again * 1000:6.2f} ms")
+
+def bench_incremental():
+    print("[incremental] 명단 5명·메뉴 1행 변경: FacilityPipeline 증분 계산 vs 전체 run_facility")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    rice_index = me.build_rice_index(category_df)
+
+    def full(raw, category_df, rice_index):
+        patient_df = me.prepare_patient_df(raw)
+        return me.run_facility(patient_df, category_df, standards, rice_index=rice_index)
+
+    def check(actual, expected):
+        assert actual[0].keys() == expected[0].keys()
+        for disease in expected[0]:
+            pd.testing.assert_frame_equal(actual[0][disease], expected[0][disease])
+        pd.testing.assert_frame_equal(actual[1], expected[1])
+        pd.testing.assert_frame_equal(actual[2], expected[2])
+        assert actual[3] == expected[3]
+
+    for n in (2_000, 20_000):
+        raw = make_roster(n)
+        changed = raw.copy()
+        rows = np.linspace(0, n - 1, 5).astype(int)
+        changed.loc[rows, "체중"] += 5
+
+        def incremental():
+            pipeline = me.FacilityPipeline()
+            pipeline.run(raw, category_df, standards, rice_index=rice_index)
+            t0 = time.perf_counter()
+            result = pipeline.run(changed, category_df, standards, rice_index=rice_index)
+            return result, pipeline.stats, time.perf_counter() - t0
+
+        result, stats, _ = incremental()
+        check(result, full(changed, category_df, rice_index))
+        t_full = timeit(lambda: full(changed, category_df, rice_index))
+        t_inc = min(incremental()[2] for _ in range(3))
+        print(
+            f"  n={n:>6,}  5명 변경 → 재계산 {stats['recomputed']}명 / 재사용 {stats['reused']:,}명   "
+            f"증분 {t_inc * 1000:7.1f} ms   전체 {t_full * 1000:7.1f} ms   x{t_full / t_inc:5.1f}"
+        )
+
+    # 당뇨 국 한 행의 나트륨을 고친 메뉴 파일: 당뇨 수급자만 다시 계산
+    raw = make_roster(2_000)
+    edited = category_df.copy()
+    row = edited.index[(edited["Disease"] == "당뇨") & (edited["Category"] == "국")][0]
+    edited.loc[row, "나트륨(mg)"] += 100
+    edited_rice = me.build_rice_index(edited)
+    pipeline = me.FacilityPipeline()
+    pipeline.run(raw, category_df, standards, rice_index=rice_index)
+    t0 = time.perf_counter()
+    result = pipeline.run(raw, edited, standards, rice_index=edited_rice)
+    t_inc = time.perf_counter() - t0
+    check(result, full(raw, edited, edited_rice))
+    diabetic = int((me.prepare_patient_df(raw)["대표질환"] == "당뇨").sum())
+    print(
+        f"  메뉴 1행 변경 → 재계산 {pipeline.stats['recomputed']}명 (당뇨 {diabetic}명) / 재사용 {pipeline.stats['reused']:,}명   "
+        f"증분 {t_inc * 1000:7.1f} ms"
+    )
+
+def bench_roster_diff():
+    print("[roster_diff] 주간 재업로드: 추가·변경 수급자만 계산 vs 전체 계산, 명단 기록 읽기·쓰기")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    rice_index = me.build_rice_index(category_df)
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+        for n in (2_000, 20_000):
+            raw = make_roster(n)
+            # 5명 체중 변경, 3명 퇴소, 4명 입소
+            weekly = raw.copy()
+            weekly.loc[np.linspace(0, n - 1, 5).astype(int), "체중"] += 2
+            weekly = weekly.drop(index=[1, 2, 3])
+            added = make_roster(4, seed=1)
+            added["수급자ID"] = "N" + added["수급자ID"]
+            weekly = pd.concat([weekly, added], ignore_index=True)
+
+            # 페이지처럼 빈 맞춤 메뉴 캐시에서 첫 전체 계산 → 재업로드 (전체 계산 기준에 캐시 준비 시간이 들어가면 안 된다)
+            def incremental():
+                pipeline = me.FacilityPipeline(cache=me.MenuVariantCache())
+                pipeline.run(raw, category_df, standards, rice_index=rice_index)
+                t0 = time.perf_counter()
+                result = pipeline.run(weekly, category_df, standards, rice_index=rice_index)
+                return result, pipeline, time.perf_counter() - t0
+
+            cache = me.MenuVariantCache()
+
+            def full():
+                patient_df = me.prepare_patient_df(weekly)
+                return me.run_facility(patient_df, category_df, standards, rice_index=rice_index, cache=cache)
+
+            result, pipeline, _ = incremental()
+            expected = full()
+            for disease in expected[0]:
+                pd.testing.assert_frame_equal(result[0][disease], expected[0][disease])
+            pd.testing.assert_frame_equal(result[1], expected[1])
+            stats = pipeline.stats
+            assert (stats["added"], stats["changed"], stats["removed"], stats["recomputed"]) == (4, 5, 3, 9)
+
+            t_full = timeit(full)
+            _, pipeline, t_run = min((incremental() for _ in range(3)), key=lambda r: r[2])
+            stats = pipeline.stats
+            # stats의 절약 시간(세션에서 잰 전체 계산 기준)과 이번 측정(따뜻한 캐시의 prepare + run_facility 기준)
+            print(
+                f"  n={n:>6,}  추가 {stats['added']} · 변경 {stats['changed']} · 삭제 {stats['removed']} → 재계산 {stats['recomputed']}명   "
+                f"증분 {t_run * 1000:6.1f} ms   전체 {t_full * 1000:7.1f} ms   "
+                f"절약 stats {stats['saved_seconds'] * 1000:+7.1f} ms / 측정 {(t_full - t_run) * 1000:+7.1f} ms"
+            )
+
+            # 명단 기록: 새 세션(또는 batch.py --snapshots)이 지난 실행과 비교할 때 쓰는 (수급자ID, 행 해시)만 남긴다
+            path = me.snapshot_path(f"center{n}", snapshot_dir)
+            previous = me.FacilityPipeline()
+            previous.run(raw, category_df, standards, rice_index=rice_index)
+            t_write = timeit(lambda: previous.save_roster(path))
+            t_read = timeit(lambda: me.read_roster(path))
+            session = me.FacilityPipeline()
+            assert session.load_roster(path)
+            session.run(weekly, category_df, standards, rice_index=rice_index)
+            assert (session.stats["added"], session.stats["changed"], session.stats["removed"]) == (4, 5, 3)
+            print(f"           명단 기록 쓰기 {t_write * 1000:5.1f} ms   읽기 {t_read * 1000:5.1f} ms   {os.path.getsize(path) / 1e3:6.1f} KB")
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def bench_results_store():
+    print("[results_store] SQLite 결과 저장소: 요양원 10곳 × 365일 저장 후 수급자·질환별 조회")
+    category_df = load_category_df()
+    standards = me.compile_standards(me.load_disease_standards())
+    centers = {}
+    for i in range(10):
+        patient_df = me.prepare_patient_df(make_roster(100, seed=i))
+        adjusted_results, eval_df, _, _ = me.run_facility(patient_df, category_df, standards)
+        centers[f"center{i}"] = (adjusted_results, eval_df)
+    days = pd.date_range("2025-10-01", periods=365)
+
+    db_dir = tempfile.mkdtemp()
+    try:
+        store = me.ResultsStore(os.path.join(db_dir, "results.sqlite3"))
+        t0 = time.perf_counter()
+        menu_rows = evaluation_rows = 0
+        for day in days:
+            for center, (adjusted_results, eval_df) in centers.items():
+                m, e = store.save(center, day, adjusted_results, eval_df)
+                menu_rows += m
+                evaluation_rows += e
+        t_write = time.perf_counter() - t0
+        size = sum(os.path.getsize(os.path.join(db_dir, f)) for f in os.listdir(db_dir))
+        print(
+            f"  저장 {len(days) * len(centers):,}회 (식단 {menu_rows:,}행, 판정 {evaluation_rows:,}행)  "
+            f"{t_write:6.1f} s  ({t_write / (len(days) * len(centers)) * 1000:.1f} ms/회, {menu_rows / t_write:,.0f} 식단 행/s)  {size / 1e6:,.0f} MB"
+        )
+
+        adjusted_results, eval_df = centers["center3"]
+        resident = eval_df["수급자ID"].iloc[0]
+        month = store.resident_menus("center3", resident, "2026-03-01", "2026-03-31")
+        per_day = sum(int((df["수급자ID"] == resident).sum()) for df in adjusted_results.values())
+        assert len(month) == 31 * per_day
+        failing = store.failing_residents("center3", "신장질환", "나트륨(mg)")
+        primary = pd.concat([df.assign(대표질환=d) for d, df in adjusted_results.items()]).drop_duplicates("수급자ID")
+        kidney = eval_df["수급자ID"].map(primary.set_index("수급자ID")["대표질환"]) == "신장질환"
+        assert len(failing) == len(days) * int((kidney & (eval_df["나트륨(mg)_평가"] == "미달")).sum())
+
+        queries = {
+            "수급자 한 명 한 달 식단": lambda: store.resident_menus("center3", resident, "2026-03-01", "2026-03-31"),
+            "수급자 한 명 1년 판정": lambda: store.resident_evaluations("center3", resident),
+            "신장질환 나트륨 미달 1년": lambda: store.failing_residents("center3", "신장질환", "나트륨(mg)"),
+            "당뇨 미달 한 달": lambda: store.failing_residents("center3", "당뇨", start="2026-03-01", end="2026-03-31"),
+            "저장 날짜 목록": lambda: store.dates("center3"),
+        }
+        for name, query in queries.items():
+            rows = len(query())
+            print(f"  {name:<16} {rows:>7,}행  {timeit(query) * 1000:7.2f} ms")
+        print(f"  (비교) 요양원 한 곳 하루치 다시 계산 {timeit(lambda: me.run_facility(me.prepare_patient_df(make_roster(100, seed=3)), category_df, standards)) * 1000:7.1f} ms")
+        store.close()
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+BENCHMARKS = {
+    "classification": bench_classification,
+    "nutrient_targets": bench_nutrient_targets,
+    "final_results": bench_final_results,
+    "variant_cache": bench_variant_cache,
+    "resident_index": bench_resident_index,
+    "upload_cache": bench_upload_cache,
+    "xlsx_cache": bench_xlsx_cache,
+    "mfds_rules": bench_mfds_rules,
+    "facility_compliance": bench_facility_compliance,
+    "facility_adjust": bench_facility_adjust,
+    "rice_index": bench_rice_index,
+    "portion_solver": bench_portion_solver,
+    "substitution": bench_substitution,
+    "cycle_plan": bench_cycle_plan,
+    "batch": bench_batch,
+    "cli": bench_cli,
+    "export": bench_export,
+    "formats": bench_formats,
+    "cards": bench_cards,
+    "procurement": bench_procurement,
+    "nutrient_compose": bench_nutrient_compose,
+    "incremental": bench_incremental,
+    "roster_diff": bench_roster_diff,
+    "results_store": bench_results_store,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -1,209 +1,86 @@
 import streamlit as st
 import pandas as pd
-import re
 import base64
+import datetime
+import hashlib
+import os
+import tempfile
 from io import BytesIO
 from PIL import Image
 
-standard_df = pd.read_excel("./MFDS(1).xlsx", sheet_name=0, index_col=0)
-standard_df = standard_df.T.fillna("")
-
-# 인덱스를 기준으로 정렬된 키 생성
-disease_standards = {}
-for disease, row in standard_df.iterrows():
-    sorted_key = ", ".join(sorted([d.strip() for d in disease.split(",")]))
-    disease_standards[sorted_key] = row.to_dict()
-# ========== 함수 정의 ==========
-
-def assign_primary_disease(row):
-    if row["연하곤란"] == 1:
-        return "연하곤란"
-    elif row["고혈압"] == 1 and row["신장질환"] == 1:
-        return "신장질환"
-    elif row["당뇨"] == 1 and row["신장질환"] == 1:
-        return "신장질환"
-    elif row["당뇨"] == 1 and row["고혈압"] == 1:
-        return "고혈압"
-    elif row["신장질환"] == 1:
-        return "신장질환"
-    elif row["고혈압"] == 1:
-        return "고혈압"
-    elif row["당뇨"] == 1:
-        return "당뇨"
-    return "질환없음"
-
-def assign_all_diseases(row):
-    diseases = []
-    for d in ["당뇨", "고혈압", "신장질환", "연하곤란"]:
-        if row[d] == 1:
-            diseases.append(d)
-    return ", ".join(diseases) if diseases else "질환없음"
-
-def get_meal_option(rice, side):
-    replace_rice = None
-    suffix = ""
-    soup_suffix = ""
-
-    if rice == "일반밥" and side == "일반찬":
-        suffix = ""
-    elif rice == "일반밥" and side == "다진찬":
-        suffix = "_다진찬"
-        soup_suffix = "_건더기잘게"
-    elif rice == "일반죽" and side == "다진찬":
-        suffix = "_다진찬"
-        soup_suffix = "_건더기잘게"
-        replace_rice = {"잡곡밥": "야채죽", "쌀밥": "야채죽"}
-    elif rice == "일반죽" and side == "갈찬":
-            suffix = "_갈찬"
-            soup_suffix = "_국물만"
-            replace_rice = {"잡곡밥": "야채죽", "쌀밥": "야채죽"}
-    elif rice == "갈죽" and side == "갈찬":
-        suffix = "_갈찬"
-        soup_suffix = "_국물만"
-        replace_rice = {"잡곡밥": "야채죽_갈죽", "쌀밥": "야채죽_갈죽", "야채죽": "야채죽_갈죽"}
-
-    return {"suffix": suffix, "soup_suffix": soup_suffix, "replace_rice": replace_rice}
-
-
-def apply_meal_customization(menu_df, option):
-    suffix = option["suffix"]
-    soup_suffix = option["soup_suffix"]
-    replace_rice = option["replace_rice"]
-
-    modified_df = menu_df.copy()
-
-    # 밥 대체
-    if replace_rice:
-        for old_val, new_val in replace_rice.items():
-            modified_df.loc[(modified_df["Category"] == "밥") & (modified_df["Menu"] == old_val), "Menu"] = new_val
-
-    # 국: 별도 suffix 적용
-    modified_df.loc[modified_df["Category"] == "국", "Menu"] += soup_suffix
-
-    # 부찬류: 공통 suffix 적용
-    for cat in ["주찬", "부찬1", "부찬2", "김치"]:
-        modified_df.loc[modified_df["Category"] == cat, "Menu"] += suffix
-
-    return modified_df
-
-def generate_final_results(patient_df, category_df):
-    disease_types = ["질환없음", "당뇨", "고혈압", "신장질환", "연하곤란"]
-    required_categories = ["밥", "국", "주찬", "부찬1", "부찬2", "김치"]
-    category_order = pd.CategoricalDtype(categories=required_categories, ordered=True)
-    final_results = {}
-    for disease in disease_types:
-        menus = category_df[category_df["Disease"] == disease]
-        results = []
-        for _, row in patient_df[patient_df["대표질환"] == disease].iterrows():
-            patient_id = row["수급자ID"]
-            option = row["식단옵션"]
-            selected = menus[menus["Category"].isin(required_categories)].drop_duplicates("Category")
-            if set(required_categories).issubset(set(selected["Category"])):
-                customized = apply_meal_customization(selected, option)
-                customized["Category"] = customized["Category"].astype(category_order)
-                customized = customized.sort_values("Category")
-
-                if "Disease" in customized.columns:
-                    customized = customized.drop(columns=["Disease"])
-       
-                customized.insert(0, "수급자ID", patient_id)
-                diseases = patient_df.loc[patient_df["수급자ID"] == patient_id, "질환"].values
-                if len(diseases) > 0:
-                    customized.insert(1, "질환", diseases[0])  # 수급자ID 다음 열에 삽입
-                results.append(customized)
-        if results:
-            final_results[disease] = pd.concat(results, ignore_index=True)
-    return final_results
-
-def update_rice_nutrient(match, category_df):
-    rice_row = match[match["Category"] == "밥"]
-    if rice_row.empty:
-        return match
-
-    rice_idx = rice_row.index[0]
-    rice_menu = rice_row["Menu"].values[0]
-
-    # category_df에서 같은 메뉴의 영양성분 찾기
-    actual_rice = category_df[(category_df["Category"] == "밥") & (category_df["Menu"] == rice_menu)]
-    
-    if not actual_rice.empty:
-        for col in ["총 중량", "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)", "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"]:
-            match.loc[rice_idx, col] = actual_rice[col].values[0]
-
-    return match
-
-
-def adjust_rice_if_nutrient_insufficient(match, patient_df, selected_id):
-    def parse_range(value):
-        try:
-            if isinstance(value, str) and "~" in value:
-                parts = value.split("~")
-                return [float(parts[0].strip()), float(parts[1].strip())]
-            elif isinstance(value, (float, int)):
-                return [value, value]
-        except Exception as e:
-            st.warning(f"⚠️ parse_range 오류: {value}, 에러: {e}")
-        return [0.0, 0.0]
-            
-    
-    def round_to_nearest_ratio(value, allowed_ratios=[0.25, 0.5, 1.0, 1.25, 2.0]):
-        return min(allowed_ratios, key=lambda x: abs(x - value))
-
-
-    # 수급자 기준 정보 가져오기
-    row = patient_df[patient_df["수급자ID"] == selected_id]
-    if row.empty or "개인_에너지(kcal)" not in row.columns:
-        return match
+from meal_engine import (
+    DISEASE_TYPES,
+    EVALUATION_NUTRIENTS,
+    EXPORT_FORMATS,
+    MEAL_OPTION_PAIRS,
+    PORTION_COLUMNS,
+    TARGET_NUTRIENTS,
+    FacilityPipeline,
+    MenuVariantCache,
+    ResultsStore,
+    UploadCache,
+    aggregate_ingredients,
+    build_ingredient_index,
+    build_resident_index,
+    build_rice_index,
+    compile_standards,
+    customize_plan,
+    evaluate_facility,
+    export_file_name,
+    facility_usage,
+    generate_final_results,
+    get_meal_option,
+    load_disease_standards,
+    load_ingredient_upload,
+    load_menu_upload,
+    load_menu_upload_recomputed,
+    load_patient_sheet,
+    plan_cycle_menus,
+    plan_usage,
+    render_nutrient_targets,
+    scale_portions,
+    snapshot_path,
+    solve_portions,
+    substitute_menus,
+    target_bounds,
+    update_rice_nutrients,
+    write_procurement,
+    write_resident_cards_zip,
+    write_results,
+)
 
-    # 권장 범위 파싱
-    kcal_min, kcal_max = parse_range(row["개인_에너지(kcal)"].values[0])
-    carb_min, carb_max = parse_range(row["개인_탄수화물(g)"].values[0])
-    protein_min, protein_max = parse_range(row["개인_단백질(g)"].values[0])
-    fat_min, fat_max = parse_range(row["개인_지방(g)"].values[0])
+# MFDS 기준표와 업로드 파싱 캐시는 프로세스당 한 번만 만든다 (재실행마다 다시 읽지 않음)
+@st.cache_resource(show_spinner=False)
+def get_compiled_standards():
+    return compile_standards(load_disease_standards())
 
-    nutrient_cols = ["총 중량", "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)", "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"]
-    if not set(nutrient_cols).issubset(match.columns) or "Category" not in match.columns:
-        return match
+@st.cache_resource(show_spinner=False)
+def get_upload_cache():
+    return UploadCache()
 
-    match = match.copy()  # SettingWithCopyWarning 방지
-    totals = match[nutrient_cols].sum(numeric_only=True)
+# 날짜별 결과 저장소 (SQLite 연결 하나를 세션들이 같이 쓴다)
+@st.cache_resource(show_spinner=False)
+def get_results_store():
+    return ResultsStore()
 
-    adjust_targets = match[match["Category"].isin(["밥", "주찬"])]
-    if adjust_targets.empty:
-        return match
+compiled_standards = get_compiled_standards()
+# ========== 함수 정의 ==========
 
-    idxs = adjust_targets.index.tolist()
-    
-    current_vals = match.loc[idxs, nutrient_cols].sum(numeric_only=True)
-    
-    #개인 권장 범위를 얼마나 벗어났는지에 따라 조정 비율 계산        
-    def compute_ratio(actual, min_val, max_val, adjust_val, name):
-        if adjust_val == 0:
-            return 1.0, f"✅ <b>{name}</b>: 기준 충족 → 비율 <b>1.00</b>"
-    
-        if actual < min_val:
-            needed = min_val - actual
-            ratio = (adjust_val + needed) / adjust_val
-            return ratio, f"🔻 <b>{name}</b>: 부족 {needed:.2f} → 비율 <b>{ratio:.2f}</b>"
-    
-        elif actual > max_val:
-            excess = actual - max_val
-            ratio = (adjust_val - excess) / adjust_val
-            return ratio, f"🔺 <b>{name}</b>: 초과 {excess:.2f} → 비율 <b>{ratio:.2f}</b>"
-    
-        return 1.0, f"✅ <b>{name}</b>: 기준 충족 → 비율 <b>1.00</b>"
-    
+def render_ratio_diagnostics(selected_id, ratio_info):
+    #개인 권장 범위를 얼마나 벗어났는지에 따른 조정 비율 표시 (계산은 scale_portions)
     ratio_msgs = []
-    ratios = []
-    for nutrient, min_val, max_val in zip(
-        ["에너지(kcal)", "탄수화물(g)", "단백질(g)", "지방(g)"],
-        [kcal_min, carb_min, protein_min, fat_min],
-        [kcal_max, carb_max, protein_max, fat_max]
-    ):
-        ratio, msg = compute_ratio(totals[nutrient], min_val, max_val, current_vals[nutrient], nutrient.replace("(g)", "").replace("(kcal)", "").strip())
-        ratios.append(ratio)
-        ratio_msgs.append(msg)
-        
+    for nutrient in TARGET_NUTRIENTS:
+        name = nutrient.replace("(g)", "").replace("(kcal)", "").strip()
+        status = ratio_info[f"{nutrient}_상태"]
+        gap = ratio_info[f"{nutrient}_차이"]
+        ratio = ratio_info[f"{nutrient}_비율"]
+        if status == "부족":
+            ratio_msgs.append(f"🔻 <b>{name}</b>: 부족 {gap:.2f} → 비율 <b>{ratio:.2f}</b>")
+        elif status == "초과":
+            ratio_msgs.append(f"🔺 <b>{name}</b>: 초과 {gap:.2f} → 비율 <b>{ratio:.2f}</b>")
+        else:
+            ratio_msgs.append(f"✅ <b>{name}</b>: 기준 충족 → 비율 <b>1.00</b>")
+
     st.markdown(
         f"""
         <div style="display: flex; flex-wrap: wrap; gap: 14px; margin: 10px 0;">
@@ -212,101 +89,38 @@ def adjust_rice_if_nutrient_insufficient(match, patient_df, selected_id):
         """,
         unsafe_allow_html=True
     )
+    st.write(f"🍽️ {selected_id} 밥+주찬 조절 비율: {ratio_info['적용비율']:.2f}")
 
 
-    
-    # 가장 조정이 필요한 비율 (1에서 가장 멀리 떨어진 값)
-    most_significant_ratio = max(ratios, key=lambda r: abs(r - 1.0))
-    
-    # # 0.2 ~ 1.5로 클립
-    # ratio = min(max(most_significant_ratio, 0.2), 1.5)
-
-    rounded_ratio = round_to_nearest_ratio(most_significant_ratio)
-
-    # if ratio != 1.0:
-    #     st.write(f"🍚 {selected_id} 밥+주찬 조절 비율: {ratio:.2f}")
-    #     for col in nutrient_cols:
-    #         match.loc[idxs, col] = match.loc[idxs, col] * ratio
-
-    # if rounded_ratio != 1.0:
-    #     st.write(f"🍽️ {selected_id} 밥+주찬 조절 비율: {rounded_ratio:.2f}")
-    #     for col in nutrient_cols:
-    #         match.loc[idxs, col] = match.loc[idxs, col] * rounded_ratio
-
-    st.write(f"🍽️ {selected_id} 밥+주찬 조절 비율: {rounded_ratio:.2f}")
-    for col in nutrient_cols:
-        match.loc[idxs, col] = match.loc[idxs, col] * rounded_ratio
-
-    return match
-
-def extract_float(text):
-    match = re.search(r"[-+]?\d*\.?\d+", str(text))
-    return float(match.group()) if match else None
+def render_solver_diagnostics(selected_id, solver_info):
+    # 밥·주찬 범주별 최적 비율과 기준 위반량 변화 표시 (계산은 solve_portions)
+    st.write(
+        f"🍽️ {selected_id} 밥 {solver_info['밥_비율']:.2f} / 주찬 {solver_info['주찬_비율']:.2f} "
+        f"(기준 위반량 단일 비율 {solver_info['위반_단일비율']:.2f} → 최적 {solver_info['위반_최적']:.2f})"
+    )
 
-def evaluate_nutrient_criteria(nutrient, value, rule, total_energy=None):
-    rule = str(rule).strip()
-    print(f"🔍 기준 판별 → nutrient: {nutrient}, value: {value}, rule: {rule}")
 
+def adjust_rice_if_nutrient_insufficient(match, resident, method="ratio"):
+    # 수급자 기준 정보 (resident_index로 찾은 수급자 행)
+    if resident is None or target_bounds("에너지(kcal)")[0] not in resident.index:
+        return match
+    if not set(PORTION_COLUMNS).issubset(match.columns) or "Category" not in match.columns:
+        return match
 
-    if "%" in rule and total_energy:
-        if nutrient in ["포화지방(g)", "지방(g)"]:
-            ratio = (value * 9 / total_energy) * 100
-        elif nutrient in ["단백질(g)", "탄수화물(g)", "당류(g)"]:
-            ratio = (value * 4 / total_energy) * 100
-        else:
-            return ""
+    # 밥+주찬 비율 계산·적용은 화면 출력 없는 scale_portions / solve_portions가 담당
+    if method == "solver":
+        scaled, diagnostics = solve_portions(match, resident.to_frame().T, compiled_standards)
+    else:
+        scaled, diagnostics = scale_portions(match, resident.to_frame().T)
+    ratio_info = diagnostics.iloc[0]
+    if not ratio_info["조정대상있음"]:
+        return match
 
-        if "~" in rule:
-            parts = rule.replace("%", "").split("~")
-            low, high = extract_float(parts[0]), extract_float(parts[1])
-            return "충족" if low <= ratio <= high else "미달"
-            
-        limit = extract_float(rule)
-        if "이하" in rule:
-            return "충족" if ratio <= limit else "미달"
-        elif "미만" in rule:
-            return "충족" if ratio < limit else "미달"
-        elif "이상" in rule:
-            return "충족" if ratio >= limit else "미달"
-        return ""
-
-    # 일반 수치 기준 처리
-    if rule.endswith("이하"):
-        limit = extract_float(rule)
-        return "충족" if value <= limit else "미달"
-    elif rule.endswith("이상"):
-        limit = extract_float(rule)
-        return "충족" if value >= limit else "미달"
-    elif rule.endswith("미만"):
-        limit = extract_float(rule)
-        return "충족" if value < limit else "미달"
-    elif "~" in rule:
-        parts = rule.split("~")
-        low, high = extract_float(parts[0]), extract_float(parts[1])
-        return "충족" if low <= value <= high else "미달"
-
-    return ""
-
-
-def generate_evaluation_summary(total_nutrients, diseases):
-    evaluation = {}
-    disease_key = ", ".join(sorted([d.strip() for d in diseases]))  # 질환명을 알파벳 순서로 정렬하여 키 생성
-    standard = disease_standards.get(disease_key, {})
-    #st.write("📋 현재 기준표에 등록된 키 목록:", list(disease_standards.keys()))
-
-    total_energy = total_nutrients.get("에너지(kcal)", 0)
-
-    for nutrient in [
-        "에너지(kcal)", "당류(g)", "식이섬유(g)", "단백질(g)",
-        "지방(g)", "포화지방(g)", "나트륨(mg)", "칼륨(mg)"
-    ]:
-        rule = standard.get(nutrient, "")
-        value = total_nutrients.get(nutrient, 0)
-
-        evaluation[nutrient + "_기준"] = rule
-        evaluation[nutrient + "_평가"] = evaluate_nutrient_criteria(nutrient, value, rule, total_energy)
-
-    return evaluation
+    if method == "solver":
+        render_solver_diagnostics(resident["수급자ID"], ratio_info)
+    else:
+        render_ratio_diagnostics(resident["수급자ID"], ratio_info)
+    return scaled
 
 # ========== Streamlit 앱 시작 ==========
 
@@ -459,6 +273,21 @@ st.sidebar.markdown("""
 if 'message_list' not in st.session_state:
     st.session_state.message_list = []
 
+# 질환·식단옵션별 맞춤 메뉴 캐시 (category 시트가 바뀌면 자동 무효화)
+if "menu_variant_cache" not in st.session_state:
+    st.session_state.menu_variant_cache = MenuVariantCache()
+
+# 요양원별 증분 계산기: 명단/메뉴에서 바뀐 수급자만 다시 계산 (요양원을 오가도 각자 결과 유지)
+if "facility_pipelines" not in st.session_state:
+    st.session_state.facility_pipelines = {}
+# 기록해 둔 명단(roster_snapshots/)을 이미 비교 기준으로 읽은 요양원 (세션마다 한 번)
+if "roster_records" not in st.session_state:
+    st.session_state.roster_records = set()
+
+# 요양원별 마지막 대체 메뉴 탐색 결과 (업로드·조정 방식·영양성분 기준이 같으면 재사용)
+if "substitutions" not in st.session_state:
+    st.session_state.substitutions = {}
+
 # 초기화 (처음 접속했을 때 페이지 상태 설정)
 if "page" not in st.session_state:
     st.session_state.page = "main"
@@ -498,6 +327,182 @@ def main_page():
         if st.button("🍱 SNU CareFit-Home  \n(가정용 맞춤 푸드 솔루션)", use_container_width=True):
             switch_page("hyodocook")
             
+FACILITY_PAGE_SIZE = 50
+
+def render_roster_changes(stats):
+    # 지난 처리 명단 대비 추가/변경/삭제 수급자와 다시 계산한 인원
+    # 절약 시간: 이 세션에서 잰 전체 계산 시간 대비 (더 오래 걸렸으면 그만큼 표시)
+    saved = stats["saved_seconds"]
+    if saved is None:
+        delta = None
+    elif saved >= 0:
+        delta = f"{saved:.2f}초 절약"
+    else:
+        delta = f"전체 계산보다 {-saved:.2f}초 더 걸림"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("추가된 수급자", f"{stats['added']:,}명")
+    col2.metric("변경된 수급자", f"{stats['changed']:,}명")
+    col3.metric("삭제된 수급자", f"{stats['removed']:,}명")
+    col4.metric("다시 계산", f"{stats['recomputed']:,}명", delta=delta, delta_color="off")
+    st.caption(
+        f"♻️ 수급자 {stats['residents']:,}명 중 {stats['reused']:,}명은 이전 결과 재사용 "
+        f"(계산 {stats['seconds']:.2f}초)"
+    )
+
+def render_facility_summary(eval_df, ratio_table):
+    # 전체 수급자 모드 요약: 충족 현황 + 페이지 단위 평가표 (수급자별 식단표는 그리지 않음)
+    eval_cols = [c for c in eval_df.columns if c.endswith("_평가")]
+    failed = (eval_df[eval_cols] == "미달")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("전체 수급자", f"{len(eval_df):,}명")
+    col2.metric("MFDS 기준 모두 충족", f"{int((~failed.any(axis=1)).sum()):,}명")
+    col3.metric("미달 항목 있음", f"{int(failed.any(axis=1).sum()):,}명")
+
+    st.markdown("#### 📊 영양소별 미달 인원")
+    st.dataframe(
+        failed.sum().rename(lambda c: c.replace("_평가", "")).to_frame("미달 인원").T,
+        use_container_width=True,
+    )
+
+    if "위반_최적" in ratio_table.columns:
+        # 최적 비율 모드: 단일 비율 방식 대비 기준 위반량이 얼마나 줄었는지
+        col1, col2, col3 = st.columns(3)
+        col1.metric("기준 위반량 (단일 비율)", f"{ratio_table['위반_단일비율'].sum():,.1f}")
+        col2.metric(
+            "기준 위반량 (최적 비율)", f"{ratio_table['위반_최적'].sum():,.1f}",
+            delta=f"{ratio_table['위반_최적'].sum() - ratio_table['위반_단일비율'].sum():,.1f}", delta_color="inverse",
+        )
+        col3.metric("위반 수급자 (단일 → 최적)", f"{int((ratio_table['위반_단일비율'] > 0).sum()):,} → {int((ratio_table['위반_최적'] > 0).sum()):,}명")
+        ratio_columns = ratio_table[["밥_비율", "주찬_비율", "위반_단일비율", "위반_최적"]]
+    else:
+        ratio_columns = ratio_table[["적용비율"]].rename(columns={"적용비율": "밥+주찬 조절 비율"})
+    summary = eval_df.merge(ratio_columns, left_on="수급자ID", right_index=True, how="left")
+    pages = max(1, -(-len(summary) // FACILITY_PAGE_SIZE))
+    page = st.number_input(f"페이지 (총 {pages}쪽)", min_value=1, max_value=pages, value=1, step=1)
+    start = (page - 1) * FACILITY_PAGE_SIZE
+    st.dataframe(summary.iloc[start:start + FACILITY_PAGE_SIZE], use_container_width=True, hide_index=True)
+
+def cached_substitution(key, adjusted_results, patient_df, category_df):
+    # 대체 메뉴 탐색은 최대 SUBSTITUTION_TIME_BUDGET초 걸리므로 다시 그릴 때마다 하지 않는다
+    # key: (요양원, 메뉴·명단 파일 SHA-256, 조정 방식, 영양성분 기준). 같으면 세션에 보관한 결과를 쓴다 (요양원마다 마지막 하나)
+    cached = st.session_state.substitutions.get(key[0])
+    if cached is None or cached[0] != key:
+        with st.spinner("MFDS 기준 미달 수급자의 대체 메뉴를 찾는 중..."):
+            cached = (key, substitute_menus(adjusted_results, patient_df, category_df, compiled_standards))
+        st.session_state.substitutions[key[0]] = cached
+    return cached[1]
+
+def render_substitution_report(report):
+    # 대체 메뉴 탐색 결과: 해결/불가능/시간초과 인원 + 수급자별 대체 내역
+    st.markdown("#### 🔄 MFDS 미달 수급자 대체 메뉴")
+    counts = report["대체상태"].value_counts()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("대체로 해결", f"{int(counts.get('해결', 0)):,}명")
+    col2.metric("대체로 해결 불가", f"{int(counts.get('불가능', 0)):,}명")
+    col3.metric("시간 초과", f"{int(counts.get('시간초과', 0)):,}명")
+    unresolved = report[report["대체상태"] != "해결"]
+    if not unresolved.empty:
+        st.dataframe(unresolved.drop(columns=["대체수", "대체내역"]).reset_index(), use_container_width=True, hide_index=True)
+    resolved = report[report["대체상태"] == "해결"]
+    if not resolved.empty:
+        with st.expander(f"대체 내역 ({len(resolved):,}명)"):
+            st.dataframe(resolved[["질환", "대체수", "대체내역"]].reset_index(), use_container_width=True, hide_index=True)
+
+def load_ingredient_index(menu_bytes):
+    # 메뉴 파일의 ingredient 시트 → 레시피 × 재료 색인 (시트가 없으면 None)
+    try:
+        ingredient_df = get_upload_cache().get_or_load("ingredient", menu_bytes, load_ingredient_upload)
+    except ValueError:
+        return None
+    return build_ingredient_index(ingredient_df)
+
+def render_procurement(usage, ingredient_index, by, file_name, key):
+    # 재료 총량 표 + 발주용 CSV 다운로드
+    if ingredient_index is None:
+        st.info("메뉴 파일에 ingredient 시트가 없어 식자재 발주량을 계산할 수 없습니다.")
+        return
+    table, missing = aggregate_ingredients(usage, ingredient_index, by=by)
+    if missing:
+        st.warning(f"⚠️ ingredient 시트에 레시피가 없어 발주량에서 빠진 메뉴: {', '.join(missing)}")
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ 식자재 발주량 다운로드 (CSV)",
+        data=write_procurement(table, BytesIO()).getvalue(),
+        file_name=file_name,
+        mime="text/csv",
+        key=key,
+    )
+
+def render_results_save(center, adjusted_results, eval_df):
+    # 전체 수급자 결과를 날짜별로 저장 (같은 날짜를 다시 저장하면 바꿔 쓴다)
+    meal_date = st.date_input("식단 날짜", value=datetime.date.today(), key=f"store_date_{center}")
+    if st.button("💾 이 날짜 결과로 저장", key=f"store_button_{center}"):
+        menu_rows, evaluation_rows = get_results_store().save(center, meal_date, adjusted_results, eval_df)
+        st.success(f"✅ {meal_date} 결과를 저장했습니다 (수급자 {evaluation_rows:,}명, 식단 {menu_rows:,}행)")
+
+def render_results_history(center):
+    # 저장된 결과 조회: 파일 업로드·재계산 없이 수급자별 식단, 질환별 MFDS 미달 수급자
+    with st.expander("🗂 저장된 식단·판정 조회"):
+        store = get_results_store()
+        dates = store.dates(center)
+        if not dates:
+            st.info("이 요양원에 저장된 결과가 없습니다. 전체 수급자 모드에서 결과를 저장하세요.")
+            return
+        col1, col2 = st.columns(2)
+        last = datetime.date.fromisoformat(dates[-1])
+        start = col1.date_input("시작 날짜", value=max(datetime.date.fromisoformat(dates[0]), last - datetime.timedelta(days=30)), key=f"history_start_{center}")
+        end = col2.date_input("끝 날짜", value=last, key=f"history_end_{center}")
+
+        resident_id = st.text_input("🔍 수급자ID", key=f"history_resident_{center}").strip()
+        if resident_id:
+            st.dataframe(store.resident_menus(center, resident_id, start, end), use_container_width=True, hide_index=True)
+
+        col1, col2 = st.columns(2)
+        disease = col1.selectbox("대표질환", DISEASE_TYPES, key=f"history_disease_{center}")
+        nutrient = col2.selectbox("미달 영양소", ["전체"] + EVALUATION_NUTRIENTS, key=f"history_nutrient_{center}")
+        failing = store.failing_residents(center, disease, None if nutrient == "전체" else nutrient, start, end)
+        st.markdown(f"**{disease} 수급자 MFDS 기준 미달: {failing['수급자ID'].nunique():,}명 ({len(failing):,}건)**")
+        st.dataframe(failing, use_container_width=True, hide_index=True)
+
+def render_cycle_planner(category_df, patient_df, ingredient_index=None):
+    # 질환별 7/28일 주기 식단: 버튼을 누를 때만 계산하고 결과는 세션에 보관
+    with st.expander("📅 주기 식단 계획"):
+        plan_days = st.selectbox("계획 기간", [7, 28], format_func=lambda d: f"{d}일 ({d // 7}주)")
+        if st.button("주기 식단 만들기"):
+            with st.spinner("주기 식단을 계획하는 중입니다..."):
+                st.session_state.cycle_plan = plan_cycle_menus(category_df, compiled_standards, days=plan_days, patient_df=patient_df)
+        if "cycle_plan" not in st.session_state:
+            return
+        plan, plan_report = st.session_state.cycle_plan
+        st.dataframe(plan_report, use_container_width=True, hide_index=True)
+
+        texture = st.selectbox("식단 형태", [f"{rice} · {side}" for rice, side in MEAL_OPTION_PAIRS])
+        customized = customize_plan(plan, get_meal_option(*texture.split(" · ")))
+        tables = {
+            disease: group.pivot(index="일차", columns="Category", values="Menu").rename(columns=str).rename_axis(columns=None)
+            for disease, group in customized.groupby("Disease", sort=False)
+        }
+        disease = st.selectbox("질환", list(tables))
+        st.dataframe(tables[disease], use_container_width=True)
+
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+            for name, table in tables.items():
+                table.to_excel(writer, sheet_name=name)
+        st.download_button(
+            "⬇️ 주기 식단 다운로드",
+            data=output.getvalue(),
+            file_name=f"주기식단_{plan_days}일_{texture.replace(' · ', '_')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+
+        # 계획 기간 전체의 일차별 식자재 (명단 인원 기준, 식단옵션별 메뉴명 적용)
+        st.markdown("##### 🧺 일차별 식자재 발주량")
+        render_procurement(
+            plan_usage(plan, patient_df), ingredient_index, ["일차"],
+            f"주기식단_{plan_days}일_식자재.csv", key="plan_procurement",
+        )
+
 def nursing_home_page():
     st.markdown("<h1 style='color:#226f54;'>SNU CareFit</h1>", unsafe_allow_html=True)
     st.markdown("<p class='description'>건강한 한 끼로 어르신의 일상을 더 따뜻하게, 서울대와 사랑과선행이 함께합니다.</p>", unsafe_allow_html=True)
@@ -534,202 +539,126 @@ def nursing_home_page():
         # st.markdown("##### 🧓 어르신 정보 파일 업로드")
         # patient_file = st.file_uploader("Drag and drop or browse 어르신 파일 (.xlsx)", type=["xlsx"])
         # st.markdown("</div>", unsafe_allow_html=True)
-    
+
+    render_results_history(selected_center)
+
     if menu_file and patient_file:
-        category_df = pd.read_excel(menu_file, sheet_name="category")
-        category_df = category_df[category_df["Category"].isin(["밥", "국", "주찬", "부찬1", "부찬2", "김치"])]  #간식 메뉴 제외하고 한 끼 식사 구성 요소만 남김
-        category_df = category_df[category_df["Disease"] != "저작곤란"]
-        
-        patient_df = pd.read_excel(patient_file, sheet_name=0)
-    
-        patient_df["대표질환"] = patient_df.apply(assign_primary_disease, axis=1)
-        patient_df["질환"] = patient_df.apply(assign_all_diseases, axis=1)
-        patient_df["식단옵션"] = patient_df.apply(lambda row: get_meal_option(row["밥"], row["반찬"]), axis=1)
-        
-        final_results = generate_final_results(patient_df, category_df)
-
-        # 점심 영양소 계산을 위한 함수 정의
-        def convert_height_pa(row):
-            height_m = row["신장"] / 100  # cm → m
-            pa_map = {1: 1.0, 2: 1.1, 3: 1.2}
-            pa = pa_map.get(row["활동정도"], 1.0)
-            return height_m, pa
-        
-        def calculate_eer(sex, age, weight, height, pa):
-            if sex in ['남성', 'male', '남']:
-                return 662 - (9.53 * age) + pa * (15.91 * weight + 539.6 * height)
-            elif sex in ['여성', 'female', '여']:
-                return 354 - (6.91 * age) + pa * (9.36 * weight + 726 * height)
-            else:
-                raise ValueError("Invalid sex")
-
-        #체질량지수(BMI)에 따른 하루 권장 섭취 칼로리 도출
-        def calculate_daily_intake(sex, age, weight, height, pa):
-            bmi = weight / (height ** 2)
-            eer = calculate_eer(sex, age, weight, height, pa)
-            #비만 -> 500~700kcal 줄임
-            if bmi >= 25:
-                return (eer - 700, eer - 500)
-            #비만전단계 -> 300~700kcal 줄임
-            elif 23 <= bmi < 25:
-                return (eer - 500, eer - 300)
-            #정상 -> 범위를 위해 +-10%
-            elif 18.5 <= bmi < 23:
-                return (eer * 0.9, eer * 1.1)
-            #저체중 -> 300~500kcal 보충
-            else:
-                return (eer + 300, eer + 500)
-        
-        def calculate_meal_distribution(daily_intake_range):
-            min_intake, max_intake = daily_intake_range
-            return (min_intake * 0.3, max_intake * 0.3)  # 점심 기준 30%
-        
-        #점심 기준 영양소 계산 및 컬럼 추가
-        energy_list, carbs_list, protein_list, fat_list = [], [], [], []
-        
-        for _, row in patient_df.iterrows():
-            sex = row["성별"]
-            age = row["나이"]
-            weight = row["체중"]
-            height_m, pa = convert_height_pa(row)
-            
+        # 파일 내용(SHA-256)이 같으면 파싱·분류·개인 영양 기준 계산을 건너뛴다
+        upload_cache = get_upload_cache()
+        category_df = upload_cache.get_or_load("menu", menu_file.getvalue(), load_menu_upload)
+        # 분류·개인 영양 기준은 명단 행 단위로 캐시해 새 파일에서도 바뀐 행만 다시 계산한다
+        patient_raw = upload_cache.get_or_load("patient_raw", patient_file.getvalue(), load_patient_sheet)
+        if selected_center not in st.session_state.facility_pipelines:
+            st.session_state.facility_pipelines[selected_center] = FacilityPipeline(
+                cache=st.session_state.menu_variant_cache
+            )
+        pipeline = st.session_state.facility_pipelines[selected_center]
+        patient_df = pipeline.prepare(patient_raw)
+        # 메뉴 영양성분: category 시트에 적힌 값 / ingredient 시트 재료로 다시 계산한 값 (메뉴 파일마다 한 번만 계산)
+        nutrient_source = st.radio("메뉴 영양성분", ["메뉴 시트 값", "재료로 다시 계산"], horizontal=True)
+        nutrient_source = "ingredient" if nutrient_source == "재료로 다시 계산" else "category"
+        if nutrient_source == "ingredient":
             try:
-                daily_range = calculate_daily_intake(sex, age, weight, height_m, pa)
-                lunch_kcal = calculate_meal_distribution(daily_range)
-                
-                carbs_min = daily_range[0] * 0.55 / 4
-                carbs_max = daily_range[1] * 0.65 / 4
-                protein_min = max(50, daily_range[0] * 0.07 / 4) if sex in ['남성', 'male', '남'] else max(40, daily_range[0] * 0.07 / 4)
-                protein_max = daily_range[1] * 0.20 / 4
-                fat_min = daily_range[0] * 0.15 / 9
-                fat_max = daily_range[1] * 0.30 / 9
-        
-                lunch_carbs = calculate_meal_distribution((carbs_min, carbs_max))
-                lunch_protein = calculate_meal_distribution((protein_min, protein_max))
-                lunch_fat = calculate_meal_distribution((fat_min, fat_max))
-        
-                energy_list.append(f"{lunch_kcal[0]:.0f} ~ {lunch_kcal[1]:.0f}")
-                carbs_list.append(f"{lunch_carbs[0]:.0f} ~ {lunch_carbs[1]:.0f}")
-                protein_list.append(f"{lunch_protein[0]:.0f} ~ {lunch_protein[1]:.0f}")
-                fat_list.append(f"{lunch_fat[0]:.0f} ~ {lunch_fat[1]:.0f}")
-        
-            except:
-                energy_list.append("에러")
-                carbs_list.append("에러")
-                protein_list.append("에러")
-                fat_list.append("에러")
-        
-        patient_df["개인_에너지(kcal)"] = energy_list
-        patient_df["개인_탄수화물(g)"] = carbs_list
-        patient_df["개인_단백질(g)"] = protein_list
-        patient_df["개인_지방(g)"] = fat_list
+                category_df, nutrient_report = upload_cache.get_or_load("menu_ingredient", menu_file.getvalue(), load_menu_upload_recomputed)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}. 메뉴 시트 값을 사용합니다.")
+                nutrient_source = "category"
+            else:
+                with st.expander("🧪 재료 기준 영양성분과 메뉴 시트 값 비교"):
+                    st.dataframe(nutrient_report, use_container_width=True, hide_index=True)
+        # 밥 메뉴명 → 영양성분 색인도 메뉴 파일(과 영양성분 기준) 단위로 한 번만 만든다
+        rice_index = upload_cache.get_or_load(f"rice_{nutrient_source}", menu_file.getvalue(), lambda _: build_rice_index(category_df))
+        ingredient_index = load_ingredient_index(menu_file.getvalue())
 
         # 여러 명의 수급자ID 입력 가능하도록 수정
-        selected_ids_input = st.text_area("🔍 수급자ID를 입력하세요 (여러 명은 쉼표 또는 줄바꿈으로 구분)")
-        selected_ids = [s.strip() for s in selected_ids_input.replace("\n", ",").split(",") if s.strip()]
-        
+        # 전체 수급자 모드는 ID 입력 없이 명단 전체를 일괄 처리하고 요약만 표시
+        run_mode = st.radio("처리 대상", ["선택 수급자", "전체 수급자"], horizontal=True)
+        # 단일 비율: 밥+주찬에 같은 비율 / 최적 비율: 밥·주찬 비율을 따로 골라 개인 기준·나트륨·칼륨 위반량 최소화
+        adjust_method = st.radio("밥+주찬 조정 방식", ["단일 비율", "최적 비율"], horizontal=True)
+        portion_method = "solver" if adjust_method == "최적 비율" else "ratio"
+        # 전체 수급자 모드에서만: MFDS 기준 미달 수급자의 주찬/부찬/김치를 같은 종류의 다른 메뉴로 대체
+        substitute_failed = run_mode == "전체 수급자" and st.checkbox("MFDS 기준 미달 수급자는 대체 메뉴 찾기")
+        # 전체 수급자 모드에서만: 처리한 명단(수급자ID, 행 해시)을 roster_snapshots/<요양원>.parquet 에 남겨
+        # 다음 업로드(새 세션 포함)의 추가/변경/삭제를 센다. 식단·판정 결과는 남기지 않는다
+        keep_roster = run_mode == "전체 수급자" and st.checkbox("처리한 명단을 기록해 다음 업로드와 비교")
+        selected_ids = []
+        if run_mode == "선택 수급자":
+            selected_ids_input = st.text_area("🔍 수급자ID를 입력하세요 (여러 명은 쉼표 또는 줄바꿈으로 구분)")
+            selected_ids = [s.strip() for s in selected_ids_input.replace("\n", ",").split(",") if s.strip()]
+
         adjusted_results = {}
+        missing_rice = set()
+        eval_df = None
         if selected_ids:
+            # 선택 수급자 모드에서만 전체 식단과 수급자ID → 수급자 정보/식단 위치 색인을 만든다
+            final_results = generate_final_results(patient_df, category_df, cache=st.session_state.menu_variant_cache)
+            resident_index = build_resident_index(patient_df, final_results)
             for selected_id in selected_ids:
                 found = False
-                for disease, df in final_results.items():
+                entry = resident_index.get(selected_id)
+                for disease, rows in (entry["menus"] if entry else []):
                     results = []
-                    for sid in df["수급자ID"].unique():  # ✅ 여기 변수명 sid 등으로 변경
-                        if sid != selected_id:
-                            continue
-                        match = df[df["수급자ID"] == sid]
-                        if not match.empty:
-                            match = update_rice_nutrient(match, category_df)
-                            match = adjust_rice_if_nutrient_insufficient(match, patient_df, sid)
-            
-                            disease_label = patient_df[patient_df["수급자ID"] == sid]["대표질환"].values[0]
-                            nutrient_info = patient_df[patient_df["수급자ID"] == sid][
-                                ["개인_에너지(kcal)", "개인_탄수화물(g)", "개인_단백질(g)", "개인_지방(g)"]
-                            ].iloc[0].to_dict()
-                            for key, val in nutrient_info.items():
-                                match.loc[:, key] = val
-
-                            nutrient_cols = [
-                                                "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)",
-                                                "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"
-                                            ]
-
-                            st.markdown(f"### 👩🏻‍⚕️ {sid}님의 추천 식단")
-                            table_with_total = match.copy()
-                            nutrient_cols = [
-                                "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)",
-                                "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"
-                            ]
-                            totals = table_with_total[nutrient_cols].sum(numeric_only=True)
-                            
-                            # 마지막 줄에 총합 row 추가
-                            total_row = {col: totals[col] for col in nutrient_cols}
-                            total_row.update({
-                                "Category": "총 합계"  # 메뉴/카테고리엔 빈칸 or 총합계
-                            })
-                            table_with_total = pd.concat([table_with_total, pd.DataFrame([total_row])], ignore_index=True)
-                            
-                            # 표 출력
-                            st.dataframe(table_with_total)
-
-                            # if set(nutrient_cols).issubset(match.columns):
-                            #     st.markdown("#### 👩🏻‍⚕️ 메뉴 영양성분 정보")
-                            #     total_nutrients = match[nutrient_cols].sum(numeric_only=True)
-                            #     for col in nutrient_cols:
-                            #         st.write(f"- 총 {col}: **{total_nutrients[col]:.1f}**")
-            
-                            results.append(match)
-
-                            info_row = patient_df[patient_df["수급자ID"] == sid].iloc[0]
-                            # 기본 정보 + 개인 영양 기준
-                            # st.markdown(
-                            #     f"""
-                            #     <div style='font-size:16px; line-height:1.6'>
-                            #     🧓 <b>{sid}님의 정보</b>:
-                            #     <b>성별:{info_row['성별']}</b> /
-                            #     <b>나이:{info_row['나이']}세</b> /
-                            #     <b>키:{info_row['신장']}cm</b> /
-                            #     <b>체중:{info_row['체중']}kg</b> /
-                            #     <b>활동수준:{info_row['활동정도']}</b> /
-                            #     <b>요양등급:{info_row['요양등급']}</b> /
-                            #     <b>밥 종류:{info_row['밥']}</b> /
-                            #     <b>반찬 종류:{info_row['반찬']}</b>
-                            #     </div>
-                            #     """,
-                            #     unsafe_allow_html=True
-                            # )
-
-                            label_display = "일반" if disease_label == "질환없음" else disease_label
-                            
-                            st.markdown(
-                                f"""
-                                <div style='font-size:18px; line-height:1.6'>
-                                🥗 <b>{sid}님의 추천 메뉴:</b>
-                                <b>{label_display}식</b>
-                                """,
-                                unsafe_allow_html=True
-                            )
+                    sid = selected_id
+                    resident = patient_df.iloc[entry["pos"]]
+                    match = final_results[disease].iloc[rows]
+                    if not match.empty:
+                        match, missing = update_rice_nutrients(match, rice_index)
+                        missing_rice.update(missing)
+                        match = adjust_rice_if_nutrient_insufficient(match, resident, portion_method)
+        
+                        disease_label = resident["대표질환"]
+                        nutrient_info = render_nutrient_targets(resident.to_frame().T).iloc[0].to_dict()
+                        for key, val in nutrient_info.items():
+                            match.loc[:, key] = val
+
+                        st.markdown(f"### 👩🏻‍⚕️ {sid}님의 추천 식단")
+                        table_with_total = match.copy()
+                        nutrient_cols = [
+                            "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)",
+                            "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"
+                        ]
+                        totals = table_with_total[nutrient_cols].sum(numeric_only=True)
+                        
+                        # 마지막 줄에 총합 row 추가
+                        total_row = {col: totals[col] for col in nutrient_cols}
+                        total_row.update({
+                            "Category": "총 합계"  # 메뉴/카테고리엔 빈칸 or 총합계
+                        })
+                        table_with_total = pd.concat([table_with_total, pd.DataFrame([total_row])], ignore_index=True)
+                        
+                        # 표 출력
+                        st.dataframe(table_with_total)
+
+                        results.append(match)
+
+                        label_display = "일반" if disease_label == "질환없음" else disease_label
+                        
+                        st.markdown(
+                            f"""
+                            <div style='font-size:18px; line-height:1.6'>
+                            🥗 <b>{sid}님의 추천 메뉴:</b>
+                            <b>{label_display}식</b>
+                            """,
+                            unsafe_allow_html=True
+                        )
 
-                            
-                            individual_info = patient_df[patient_df["수급자ID"] == sid][[
-                                "개인_에너지(kcal)", "개인_탄수화물(g)", "개인_단백질(g)", "개인_지방(g)"
-                            ]].iloc[0]
-
-                            st.markdown(
-                                f"""
-                                <div style='font-size:18px;'>
-                                💡 <b>{sid}님의 한 끼 영양 기준:</b>
-                                <b>에너지:{individual_info['개인_에너지(kcal)']} kcal</b> |
-                                <b>탄수화물:{individual_info['개인_탄수화물(g)']} g</b> |
-                                <b>단백질:{individual_info['개인_단백질(g)']} g</b> |
-                                <b>지방:{individual_info['개인_지방(g)']} g</b>
-                                </div>
-                                """,
-                                unsafe_allow_html=True
-                            )
-                            st.markdown("---")
-                            found = True
-                            break
+                        
+                        individual_info = nutrient_info
+
+                        st.markdown(
+                            f"""
+                            <div style='font-size:18px;'>
+                            💡 <b>{sid}님의 한 끼 영양 기준:</b>
+                            <b>에너지:{individual_info['개인_에너지(kcal)']} kcal</b> |
+                            <b>탄수화물:{individual_info['개인_탄수화물(g)']} g</b> |
+                            <b>단백질:{individual_info['개인_단백질(g)']} g</b> |
+                            <b>지방:{individual_info['개인_지방(g)']} g</b>
+                            </div>
+                            """,
+                            unsafe_allow_html=True
+                        )
+                        st.markdown("---")
+                        found = True
                             
                     if results:
                         if disease not in adjusted_results:
@@ -743,29 +672,51 @@ def nursing_home_page():
                 if not found:
                     st.warning(f"❌ {selected_id} 수급자ID에 대한 식단을 찾을 수 없습니다.")
 
-    
-                    #results = []
-                    #match = df[df["수급자ID"] == selected_id]
-                    #for selected_id in df["수급자ID"].unique():
-                        #match = df[df["수급자ID"] == selected_id]
-                    
-                    # if not match.empty:
-                    #     match = adjust_rice_if_nutrient_insufficient(match, patient_df, selected_id)
-                    #     disease_label = patient_df[patient_df["수급자ID"] == selected_id]["표시질환"].values[0]
-        
-        evaluation_results = []
-        for disease, df in adjusted_results.items():
-            for sid in df["수급자ID"].unique():
-                target = df[df["수급자ID"] == sid]
-                total_nutrients = target[[
-                    "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)", "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"
-                ]].sum(numeric_only=True)
-                disease_value = patient_df[patient_df["수급자ID"] == sid]["질환"].values[0]
-                diseases = [d.strip() for d in disease_value.split(",")] if disease_value else ["질환없음"]
-                evaluation = generate_evaluation_summary(total_nutrients, diseases)
-                row = {"수급자ID": sid, "질환": disease_value}
-                row.update(evaluation)
-                evaluation_results.append(row)
+        if run_mode == "전체 수급자":
+            # 명단 기록을 켠 뒤 처음 계산할 때 기록해 둔 명단을 비교 기준으로 읽는다 (없으면 세션의 지난 실행과 비교)
+            if keep_roster and selected_center not in st.session_state.roster_records:
+                pipeline.load_roster(snapshot_path(selected_center))
+                st.session_state.roster_records.add(selected_center)
+            # 식단 생성 → 밥 교체·양 조절 → MFDS 판정을 지난 실행에서 바뀐 수급자만 다시 계산
+            adjusted_results, eval_df, ratio_table, missing = pipeline.run(
+                patient_raw, category_df, compiled_standards, rice_index=rice_index, method=portion_method
+            )
+            missing_rice.update(missing)
+            # 명단이 바뀌었거나 아직 기록이 없을 때만 쓴다
+            roster_changed = pipeline.stats["added"] or pipeline.stats["changed"] or pipeline.stats["removed"]
+            if keep_roster and (roster_changed or not os.path.exists(snapshot_path(selected_center))):
+                pipeline.save_roster(snapshot_path(selected_center))
+            render_roster_changes(pipeline.stats)
+            if substitute_failed:
+                substitution_key = (
+                    selected_center, hashlib.sha256(menu_file.getvalue()).hexdigest(),
+                    hashlib.sha256(patient_file.getvalue()).hexdigest(), portion_method, nutrient_source,
+                )
+                adjusted_results, substitution_report = cached_substitution(
+                    substitution_key, adjusted_results, patient_df, category_df
+                )
+                eval_df = None
+
+        if missing_rice:
+            st.warning(f"⚠️ 메뉴 파일 category 시트에 없는 밥 메뉴라 영양성분을 교체하지 못했습니다: {', '.join(sorted(missing_rice))}")
+
+        # 수급자별 영양소 합계와 MFDS 기준 판정을 한 번에 계산
+        if eval_df is None:
+            eval_df = evaluate_facility(adjusted_results, patient_df, compiled_standards)
+
+        if run_mode == "전체 수급자" and not eval_df.empty:
+            render_facility_summary(eval_df, ratio_table)
+            if substitute_failed:
+                render_substitution_report(substitution_report)
+            # 오늘 한 끼 식자재: 수급자별 조정 식단을 양 조절 비율까지 반영해 재료 g으로 합산
+            with st.expander("🧺 식자재 발주량"):
+                render_procurement(
+                    facility_usage(adjusted_results, ratio_table), ingredient_index, [],
+                    f"{selected_center}_식자재.csv", key=f"procurement_{selected_center}",
+                )
+            # 날짜별 결과 저장소: 나중에 수급자·질환별로 재계산 없이 조회
+            with st.expander("💾 결과 저장"):
+                render_results_save(selected_center, adjusted_results, eval_df)
 
 
         if not adjusted_results:
@@ -773,46 +724,40 @@ def nursing_home_page():
         else:
             st.success("✅ 맞춤 식단 데이터가 도출되었습니다.")
 
-        # 엑셀 다운로드
-        output = BytesIO()
-        eval_df = pd.DataFrame(evaluation_results)
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            for disease, df in adjusted_results.items():
-                # 💡 수급자별 영양소 정보 병합
-                merged = df.merge(
-                    patient_df[["수급자ID", "개인_에너지(kcal)", "개인_탄수화물(g)", "개인_단백질(g)", "개인_지방(g)"]],
-                    on="수급자ID", how="left"
-                )
-                merged.to_excel(writer, sheet_name=disease, index=False)
-            # eval_df.to_excel(writer, sheet_name="영양기준_충족여부", index=False)
-            # workbook  = writer.book
-            # worksheet = writer.sheets["영양기준_충족여부"]
-        
-            # # '미달' 텍스트가 있는 셀에 빨간 글씨 적용
-            # red_format = workbook.add_format({
-            #     'font_color': 'red',
-            #     'bold': True
-            # })
-        
-            # # 전체 DataFrame 크기에 맞춰 범위 계산
-            # nrows, ncols = eval_df.shape
-            # for col_idx in range(ncols):
-            #     col_letter = chr(65 + col_idx) if col_idx < 26 else f"{chr(64 + col_idx // 26)}{chr(65 + col_idx % 26)}"
-            #     cell_range = f"{col_letter}2:{col_letter}{nrows+1}"
-            #     worksheet.conditional_format(cell_range, {
-            #         'type': 'text',
-            #         'criteria': 'containing',
-            #         'value': '미달',
-            #         'format': red_format
-            #     })
-        output.seek(0)
-        st.download_button(
-            "⬇️ 맞춤 식단 데이터 다운로드", 
-            data=output, 
-            file_name=f"{selected_center}_맞춤식단.xlsx", 
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key=f"download_button_{selected_center}"
-        )
+        # 결과 다운로드 (일괄 처리 batch.py와 같은 함수)
+        # 엑셀 외에 급식 시스템 연동용 Parquet / CSV(gzip) / NDJSON (한 표 + 대표질환 열)
+        export_format = st.selectbox("다운로드 형식", list(EXPORT_FORMATS), key=f"export_format_{selected_center}")
+        # 내보내기 파일(1만 명 xlsx 약 8.5초)은 다시 그릴 때마다(페이지 넘김 등) 만들지 않고 버튼을 눌렀을 때만 만든다
+        # 만드는 동안은 BytesIO 대신 디스크 임시 파일에 흘려 쓴다 (DataFrame 사본·셀 객체를 메모리에 쌓지 않음)
+        # st.download_button은 다 쓴 파일을 통째로 읽어 미디어 저장소에 올리므로, 내려보낼 때는 파일 크기만큼 메모리를 쓴다
+        if adjusted_results and st.button("📦 맞춤 식단 다운로드 파일 만들기", key=f"export_button_{selected_center}"):
+            with st.spinner("다운로드 파일을 만드는 중..."), tempfile.TemporaryDirectory() as export_dir:
+                export_path = os.path.join(export_dir, export_file_name("export", export_format))
+                write_results(adjusted_results, patient_df, export_path, export_format)
+                with open(export_path, "rb") as output:
+                    st.download_button(
+                        "⬇️ 맞춤 식단 데이터 다운로드",
+                        data=output,
+                        file_name=export_file_name(selected_center, export_format),
+                        mime=EXPORT_FORMATS[export_format][1],
+                        key=f"download_button_{selected_center}"
+                    )
+
+        # 출력용 수급자별 식단 카드: 다시 그릴 때마다 만들지 않고 버튼을 눌렀을 때만 ZIP을 만든다
+        if adjusted_results and st.button("🗂 수급자별 식단 카드 만들기 (ZIP)", key=f"cards_button_{selected_center}"):
+            with st.spinner("수급자별 식단 카드를 만드는 중..."), tempfile.TemporaryDirectory() as export_dir:
+                cards_path = os.path.join(export_dir, "식단카드.zip")
+                write_resident_cards_zip(adjusted_results, eval_df, patient_df, cards_path)
+                with open(cards_path, "rb") as cards:
+                    st.download_button(
+                        "⬇️ 수급자별 식단 카드 다운로드",
+                        data=cards,
+                        file_name=f"{selected_center}_식단카드.zip",
+                        mime="application/zip",
+                        key=f"cards_download_{selected_center}"
+                    )
+
+        render_cycle_planner(category_df, patient_df, ingredient_index)
     # st.write("category_df['Disease']에 존재하는 질환들:", category_df["Disease"].unique())
     # st.write("patient_df['대표질환'] 값:", patient_df["대표질환"].unique())
     # st.write("patient_df['대표질환'] 유형:", patient_df["대표질환"].dtype)
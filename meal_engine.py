@@ -0,0 +1,2315 @@
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# ========== 질환 분류 ==========
+
+DISEASE_COLUMNS = ["당뇨", "고혈압", "신장질환", "연하곤란"]
+
+def assign_primary_disease(row):
+    if row["연하곤란"] == 1:
+        return "연하곤란"
+    elif row["고혈압"] == 1 and row["신장질환"] == 1:
+        return "신장질환"
+    elif row["당뇨"] == 1 and row["신장질환"] == 1:
+        return "신장질환"
+    elif row["당뇨"] == 1 and row["고혈압"] == 1:
+        return "고혈압"
+    elif row["신장질환"] == 1:
+        return "신장질환"
+    elif row["고혈압"] == 1:
+        return "고혈압"
+    elif row["당뇨"] == 1:
+        return "당뇨"
+    return "질환없음"
+
+def assign_all_diseases(row):
+    diseases = []
+    for d in DISEASE_COLUMNS:
+        if row[d] == 1:
+            diseases.append(d)
+    return ", ".join(diseases) if diseases else "질환없음"
+
+def get_meal_option(rice, side):
+    replace_rice = None
+    suffix = ""
+    soup_suffix = ""
+
+    if rice == "일반밥" and side == "일반찬":
+        suffix = ""
+    elif rice == "일반밥" and side == "다진찬":
+        suffix = "_다진찬"
+        soup_suffix = "_건더기잘게"
+    elif rice == "일반죽" and side == "다진찬":
+        suffix = "_다진찬"
+        soup_suffix = "_건더기잘게"
+        replace_rice = {"잡곡밥": "야채죽", "쌀밥": "야채죽"}
+    elif rice == "일반죽" and side == "갈찬":
+            suffix = "_갈찬"
+            soup_suffix = "_국물만"
+            replace_rice = {"잡곡밥": "야채죽", "쌀밥": "야채죽"}
+    elif rice == "갈죽" and side == "갈찬":
+        suffix = "_갈찬"
+        soup_suffix = "_국물만"
+        replace_rice = {"잡곡밥": "야채죽_갈죽", "쌀밥": "야채죽_갈죽", "야채죽": "야채죽_갈죽"}
+
+    return {"suffix": suffix, "soup_suffix": soup_suffix, "replace_rice": replace_rice}
+
+
+# 질환 플래그(당뇨=1, 고혈압=2, 신장질환=4, 연하곤란=8) 비트 조합 → 질환 문자열
+_ALL_DISEASE_LABELS = np.array([
+    ", ".join(d for bit, d in enumerate(DISEASE_COLUMNS) if code >> bit & 1) or "질환없음"
+    for code in range(1 << len(DISEASE_COLUMNS))
+], dtype=object)
+
+# get_meal_option이 구분하는 (밥, 반찬) 조합. 목록에 없는 조합은 0번(일반밥/일반찬)과 같은 옵션을 받는다.
+MEAL_OPTION_PAIRS = [
+    ("일반밥", "일반찬"),
+    ("일반밥", "다진찬"),
+    ("일반죽", "다진찬"),
+    ("일반죽", "갈찬"),
+    ("갈죽", "갈찬"),
+]
+
+def _disease_flags(patient_df):
+    return {d: (patient_df[d] == 1).to_numpy(dtype=bool) for d in DISEASE_COLUMNS}
+
+def classify_primary_disease(patient_df):
+    f = _disease_flags(patient_df)
+    # assign_primary_disease와 같은 우선순위로 마스크를 나열
+    conditions = [
+        f["연하곤란"],
+        f["고혈압"] & f["신장질환"],
+        f["당뇨"] & f["신장질환"],
+        f["당뇨"] & f["고혈압"],
+        f["신장질환"],
+        f["고혈압"],
+        f["당뇨"],
+    ]
+    choices = ["연하곤란", "신장질환", "신장질환", "고혈압", "신장질환", "고혈압", "당뇨"]
+    return pd.Series(np.select(conditions, choices, default="질환없음").astype(object), index=patient_df.index)
+
+def classify_all_diseases(patient_df):
+    f = _disease_flags(patient_df)
+    codes = np.zeros(len(patient_df), dtype=np.intp)
+    for bit, d in enumerate(DISEASE_COLUMNS):
+        codes |= f[d].astype(np.intp) << bit
+    return pd.Series(_ALL_DISEASE_LABELS[codes], index=patient_df.index)
+
+def classify_meal_options(patient_df):
+    rice = patient_df["밥"].to_numpy(dtype=object)
+    side = patient_df["반찬"].to_numpy(dtype=object)
+    conditions = [(rice == r) & (side == s) for r, s in MEAL_OPTION_PAIRS]
+    codes = np.select(conditions, range(len(MEAL_OPTION_PAIRS)), default=0)
+    # 수급자마다 dict를 새로 만들지 않고 옵션별 dict를 공유한다 (읽기 전용으로 사용)
+    options = np.empty(len(MEAL_OPTION_PAIRS), dtype=object)
+    options[:] = [get_meal_option(r, s) for r, s in MEAL_OPTION_PAIRS]
+    return pd.Series(options[codes], index=patient_df.index)
+
+def classify_patients(patient_df):
+    # 대표질환/질환/식단옵션 열을 한 번에 계산 (행 단위 apply 대체)
+    patient_df = patient_df.copy()
+    patient_df["대표질환"] = classify_primary_disease(patient_df)
+    patient_df["질환"] = classify_all_diseases(patient_df)
+    patient_df["식단옵션"] = classify_meal_options(patient_df)
+    return patient_df
+
+
+# ========== 개인 한 끼(점심) 영양 기준 ==========
+
+TARGET_NUTRIENTS = ["에너지(kcal)", "탄수화물(g)", "단백질(g)", "지방(g)"]
+TARGET_COLUMNS = ["개인_" + n for n in TARGET_NUTRIENTS]
+
+MALE_LABELS = ['남성', 'male', '남']
+FEMALE_LABELS = ['여성', 'female', '여']
+PA_MAP = {1: 1.0, 2: 1.1, 3: 1.2}
+LUNCH_SHARE = 0.3  # 점심 기준 30%
+
+def target_bounds(nutrient):
+    return f"개인_{nutrient}_min", f"개인_{nutrient}_max"
+
+def compute_nutrient_targets(patient_df):
+    # 전체 수급자의 점심 영양 기준(min/max)을 배열 연산으로 계산
+    # 성별 오류/신체정보 결측 행은 NaN으로 두고 마스크 열로 표시한다
+    sex = patient_df["성별"].to_numpy(dtype=object)
+    male = np.isin(sex, MALE_LABELS)
+    female = np.isin(sex, FEMALE_LABELS)
+    invalid_sex = ~(male | female)
+
+    age = pd.to_numeric(patient_df["나이"], errors="coerce").to_numpy(dtype=float)
+    weight = pd.to_numeric(patient_df["체중"], errors="coerce").to_numpy(dtype=float)
+    height = pd.to_numeric(patient_df["신장"], errors="coerce").to_numpy(dtype=float) / 100  # cm → m
+    pa = patient_df["활동정도"].map(PA_MAP).fillna(1.0).to_numpy(dtype=float)
+    missing = np.isnan(age) | np.isnan(weight) | np.isnan(height)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eer = np.where(
+            male,
+            662 - (9.53 * age) + pa * (15.91 * weight + 539.6 * height),
+            354 - (6.91 * age) + pa * (9.36 * weight + 726 * height),
+        )
+        eer[invalid_sex] = np.nan
+
+        #체질량지수(BMI)에 따른 하루 권장 섭취 칼로리 도출
+        bmi = weight / (height ** 2)
+        conditions = [bmi >= 25, (23 <= bmi) & (bmi < 25), (18.5 <= bmi) & (bmi < 23)]
+        daily_min = np.select(conditions, [eer - 700, eer - 500, eer * 0.9], default=eer + 300)
+        daily_max = np.select(conditions, [eer - 500, eer - 300, eer * 1.1], default=eer + 500)
+
+    protein_floor = np.where(male, 50, 40).astype(float)
+    protein_floor[invalid_sex | missing] = np.nan
+    bounds = {
+        "에너지(kcal)": (daily_min, daily_max),
+        "탄수화물(g)": (daily_min * 0.55 / 4, daily_max * 0.65 / 4),
+        "단백질(g)": (np.fmax(protein_floor, daily_min * 0.07 / 4), daily_max * 0.20 / 4),
+        "지방(g)": (daily_min * 0.15 / 9, daily_max * 0.30 / 9),
+    }
+
+    targets = pd.DataFrame(index=patient_df.index)
+    for nutrient, (low, high) in bounds.items():
+        min_col, max_col = target_bounds(nutrient)
+        targets[min_col] = low * LUNCH_SHARE
+        targets[max_col] = high * LUNCH_SHARE
+    targets["개인기준_성별오류"] = invalid_sex
+    targets["개인기준_결측"] = missing
+    return targets
+
+def add_nutrient_targets(patient_df):
+    targets = compute_nutrient_targets(patient_df)
+    patient_df = patient_df.drop(columns=targets.columns, errors="ignore")
+    return pd.concat([patient_df, targets], axis=1)
+
+def render_nutrient_targets(patient_df):
+    # 화면/엑셀 출력용 "450 ~ 600" 문자열. 기준을 계산할 수 없는 행은 "에러"
+    invalid = (patient_df["개인기준_성별오류"] | patient_df["개인기준_결측"]).to_numpy()
+    rendered = pd.DataFrame(index=patient_df.index)
+    for nutrient, col in zip(TARGET_NUTRIENTS, TARGET_COLUMNS):
+        min_col, max_col = target_bounds(nutrient)
+        labels = [f"{lo:.0f} ~ {hi:.0f}" for lo, hi in zip(patient_df[min_col], patient_df[max_col])]
+        rendered[col] = np.where(invalid, "에러", np.array(labels, dtype=object))
+    return rendered
+
+
+# ========== 식단 구성 ==========
+
+DISEASE_TYPES = ["질환없음", "당뇨", "고혈압", "신장질환", "연하곤란"]
+REQUIRED_CATEGORIES = ["밥", "국", "주찬", "부찬1", "부찬2", "김치"]
+CATEGORY_ORDER = pd.CategoricalDtype(categories=REQUIRED_CATEGORIES, ordered=True)
+
+def apply_meal_customization(menu_df, option):
+    suffix = option["suffix"]
+    soup_suffix = option["soup_suffix"]
+    replace_rice = option["replace_rice"]
+
+    modified_df = menu_df.copy()
+
+    # 밥 대체
+    if replace_rice:
+        for old_val, new_val in replace_rice.items():
+            modified_df.loc[(modified_df["Category"] == "밥") & (modified_df["Menu"] == old_val), "Menu"] = new_val
+
+    # 국: 별도 suffix 적용
+    modified_df.loc[modified_df["Category"] == "국", "Menu"] += soup_suffix
+
+    # 부찬류: 공통 suffix 적용
+    for cat in ["주찬", "부찬1", "부찬2", "김치"]:
+        modified_df.loc[modified_df["Category"] == cat, "Menu"] += suffix
+
+    return modified_df
+
+def meal_option_key(option):
+    # 식단옵션 dict → 해시 가능한 키 (같은 키면 같은 맞춤 메뉴)
+    replace_rice = option["replace_rice"]
+    return (option["suffix"], option["soup_suffix"], tuple(replace_rice.items()) if replace_rice else None)
+
+def select_disease_menu(category_df, disease):
+    # 질환별 한 끼 구성(카테고리별 첫 메뉴). 필수 카테고리가 빠지면 None
+    menus = category_df[category_df["Disease"] == disease]
+    selected = menus[menus["Category"].isin(REQUIRED_CATEGORIES)].drop_duplicates("Category")
+    if not set(REQUIRED_CATEGORIES).issubset(set(selected["Category"])):
+        return None
+    return selected
+
+def build_menu_variant(selected, option):
+    customized = apply_meal_customization(selected, option)
+    customized["Category"] = customized["Category"].astype(CATEGORY_ORDER)
+    customized = customized.sort_values("Category")
+    if "Disease" in customized.columns:
+        customized = customized.drop(columns=["Disease"])
+    return customized
+
+def frame_fingerprint(df):
+    # 업로드된 시트 내용이 바뀌었는지 판별하는 해시 (열 이름 + 값)
+    digest = hashlib.sha256("|".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class MenuVariantCache:
+    # (Disease, suffix, soup_suffix, replace_rice) → 맞춤·정렬된 메뉴 프레임 LRU 캐시
+    # 반환되는 프레임은 캐시 원본이므로 읽기 전용으로 사용한다
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # 메뉴를 새로 만드는 데 쓴 누적 시간 (FacilityPipeline이 전체 계산 시간에서 뺀다)
+        self.build_seconds = 0.0
+        self._variants = OrderedDict()
+        self._source = None
+
+    def bind(self, category_df):
+        # 다른 category 시트가 들어오면 기존 메뉴를 모두 버린다
+        source = frame_fingerprint(category_df)
+        if source != self._source:
+            self.invalidate()
+            self._source = source
+
+    def invalidate(self):
+        self._variants.clear()
+        self._source = None
+
+    def get(self, disease, option, selected):
+        key = (disease,) + meal_option_key(option)
+        if key in self._variants:
+            self.hits += 1
+            self._variants.move_to_end(key)
+            return self._variants[key]
+        self.misses += 1
+        started = time.perf_counter()
+        variant = build_menu_variant(selected, option)
+        self.build_seconds += time.perf_counter() - started
+        self._variants[key] = variant
+        if len(self._variants) > self.maxsize:
+            self._variants.popitem(last=False)
+        return variant
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._variants), "maxsize": self.maxsize}
+
+def generate_final_results(patient_df, category_df, cache=None):
+    # (질환, 식단옵션) 조합별 메뉴를 한 번만 만들고, 수급자와는 merge 한 번으로 연결
+    if cache is None:
+        cache = MenuVariantCache()
+    cache.bind(category_df)
+    first_diseases = patient_df.drop_duplicates("수급자ID").set_index("수급자ID")["질환"]
+    final_results = {}
+    for disease in DISEASE_TYPES:
+        patients = patient_df.loc[patient_df["대표질환"] == disease, ["수급자ID", "식단옵션"]]
+        if patients.empty:
+            continue
+        selected = select_disease_menu(category_df, disease)
+        if selected is None:
+            continue
+
+        option_keys = patients["식단옵션"].map(meal_option_key)
+        variant_ids = {}
+        variant_frames = []
+        for pos in np.flatnonzero(~option_keys.duplicated().to_numpy()):
+            variant_ids[option_keys.iat[pos]] = len(variant_frames)
+            variant = cache.get(disease, patients["식단옵션"].iat[pos], selected)
+            variant_frames.append(variant.assign(_variant=len(variant_frames)))
+        variant_df = pd.concat(variant_frames, ignore_index=True)
+
+        residents = pd.DataFrame({
+            "수급자ID": patients["수급자ID"].to_numpy(),
+            "질환": patients["수급자ID"].map(first_diseases).to_numpy(),
+            "_variant": [variant_ids[key] for key in option_keys],
+        })
+        joined = residents.merge(variant_df, on="_variant", how="left", sort=False).drop(columns="_variant")
+        joined["Category"] = joined["Category"].astype(CATEGORY_ORDER)
+        final_results[disease] = joined
+    return final_results
+
+
+# ========== 수급자 색인 ==========
+
+def build_resident_index(patient_df, final_results):
+    # 수급자ID → {"pos": patient_df 행 위치, "menus": [(질환 프레임 키, 식단 행 위치), ...]}
+    # 업로드마다 한 번 만들어 두고, 선택된 수급자 조회는 dict 조회로 끝낸다
+    ids = patient_df["수급자ID"].to_numpy()
+    index = {}
+    for pos in np.flatnonzero(~patient_df["수급자ID"].duplicated().to_numpy()):
+        index[ids[pos]] = {"pos": int(pos), "menus": []}
+    for disease, df in final_results.items():
+        for sid, rows in df.groupby("수급자ID", sort=False).indices.items():
+            index[sid]["menus"].append((disease, rows))
+    return index
+
+
+# ========== 기준표/메뉴 파일 로딩 ==========
+
+MFDS_PATH = "./MFDS(1).xlsx"
+MENU_PATH = "./sarang_menu.xlsx"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_parquet_sheets(cache_dir, manifest):
+    return {
+        name: pd.read_parquet(os.path.join(cache_dir, f"sheet{i}.parquet"), memory_map=True)
+        for i, name in enumerate(manifest["sheets"])
+    }
+
+def _write_parquet_sheets(cache_dir, sheets, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    for i, df in enumerate(sheets.values()):
+        tmp_path = os.path.join(cache_dir, f"sheet{i}.parquet.tmp")
+        df.to_parquet(tmp_path, engine="pyarrow")
+        os.replace(tmp_path, os.path.join(cache_dir, f"sheet{i}.parquet"))
+    _write_manifest(cache_dir, manifest)
+
+def _write_manifest(cache_dir, manifest):
+    tmp_path = os.path.join(cache_dir, "manifest.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(cache_dir, "manifest.json"))
+
+def load_workbook_cached(path, index_col=None):
+    # xlsx의 모든 시트를 {시트명: DataFrame}으로 읽는다
+    # 원본 옆 <파일명>.cache/ 에 Parquet 사본을 두고, 원본 mtime/크기가 같으면 사본을 memory-map으로 읽는다
+    # mtime만 바뀌고 내용(SHA-256)이 같으면 사본을 그대로 쓰고, 내용이 바뀌면 다시 만든다
+    cache_dir = path + ".cache"
+    stat = os.stat(path)
+    signature = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    manifest = None
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    sha256 = None
+    if manifest and manifest.get("index_col") == index_col:
+        fresh = all(manifest.get(k) == v for k, v in signature.items())
+        if not fresh:
+            sha256 = file_sha256(path)
+            fresh = manifest.get("sha256") == sha256
+            if fresh:
+                manifest.update(signature)
+                try:
+                    _write_manifest(cache_dir, manifest)
+                except OSError:
+                    pass
+        if fresh:
+            try:
+                return _read_parquet_sheets(cache_dir, manifest)
+            except (ImportError, OSError, ValueError):
+                pass
+
+    sheets = pd.read_excel(path, sheet_name=None, index_col=index_col)
+    manifest = dict(signature, sha256=sha256 or file_sha256(path), index_col=index_col, sheets=list(sheets))
+    try:
+        _write_parquet_sheets(cache_dir, sheets, manifest)
+    except (ImportError, OSError, ValueError, TypeError):
+        # pyarrow가 없거나 쓰기 권한이 없으면 캐시 없이 동작
+        pass
+    return sheets
+
+def load_menu_workbook(path=MENU_PATH):
+    # nutrient / category / ingredient 시트
+    return load_workbook_cached(path)
+
+def load_disease_standards(path=MFDS_PATH):
+    standard_df = next(iter(load_workbook_cached(path, index_col=0).values()))
+    standard_df = standard_df.T.fillna("")
+
+    # 인덱스를 기준으로 정렬된 키 생성
+    disease_standards = {}
+    for disease, row in standard_df.iterrows():
+        sorted_key = ", ".join(sorted([d.strip() for d in disease.split(",")]))
+        disease_standards[sorted_key] = row.to_dict()
+    return disease_standards
+
+# ========== 업로드 파일 파싱 ==========
+
+def prepare_category_df(category_df):
+    category_df = category_df[category_df["Category"].isin(REQUIRED_CATEGORIES)]  #간식 메뉴 제외하고 한 끼 식사 구성 요소만 남김
+    return category_df[category_df["Disease"] != "저작곤란"]
+
+def prepare_patient_df(patient_df):
+    # 대표질환/질환/식단옵션 + 개인 영양 기준 열까지 붙인 수급자 표
+    return add_nutrient_targets(classify_patients(patient_df))
+
+def load_menu_upload(data):
+    return prepare_category_df(pd.read_excel(BytesIO(data), sheet_name="category"))
+
+def load_patient_sheet(data):
+    # 전처리 전 어르신 정보 원본 (FacilityPipeline이 행 단위로 전처리)
+    return pd.read_excel(BytesIO(data), sheet_name=0)
+
+def load_patient_upload(data):
+    return prepare_patient_df(load_patient_sheet(data))
+
+def frame_nbytes(df):
+    # 여러 프레임을 함께 캐시하는 경우 (예: (category_df, 차이 표)) 각각의 합
+    if isinstance(df, tuple):
+        return sum(frame_nbytes(part) for part in df)
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class UploadCache:
+    # 업로드 원본 바이트의 SHA-256 → 파싱/전처리된 DataFrame (또는 DataFrame 튜플)
+    # 전체 메모리 사용량이 max_bytes를 넘으면 오래 쓰지 않은 항목부터 버린다
+    # 반환되는 프레임은 세션 간에 공유되므로 읽기 전용으로 사용한다
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, kind, data, loader):
+        key = (kind, hashlib.sha256(data).hexdigest())
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        df = loader(data)
+        size = frame_nbytes(df)
+        with self._lock:
+            self.misses += 1
+            if key not in self._entries:
+                self._entries[key] = (df, size)
+                self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# ========== MFDS 기준 판정 ==========
+
+EVALUATION_NUTRIENTS = [
+    "에너지(kcal)", "당류(g)", "식이섬유(g)", "단백질(g)",
+    "지방(g)", "포화지방(g)", "나트륨(mg)", "칼륨(mg)"
+]
+# 총 열량 대비 % 기준을 g → kcal로 환산하는 계수
+ENERGY_FACTORS = {"포화지방(g)": 9, "지방(g)": 9, "단백질(g)": 4, "탄수화물(g)": 4, "당류(g)": 4}
+
+# op: "이하" / "미만" / "이상" / "범위"(low 이상 high 이하), None이면 판정하지 않음("")
+Comparison = namedtuple("Comparison", ["op", "low", "high"])
+# percent: 총 열량이 있을 때 적용하는 % 기준 (규칙에 %가 없으면 None)
+# absolute: 그 외 수치 기준. energy_factor가 None인 영양소는 % 기준일 때 판정하지 않음
+NutrientRule = namedtuple("NutrientRule", ["nutrient", "text", "energy_factor", "percent", "absolute"])
+
+NO_COMPARISON = Comparison(None, None, None)
+
+def extract_float(text):
+    # 주의: 천 단위 쉼표는 인식하지 않는다 ("1,350mg이하" → 1.0)
+    match = re.search(r"[-+]?\d*\.?\d+", str(text))
+    return float(match.group()) if match else None
+
+def _comparison(op, low=None, high=None):
+    # 숫자를 읽지 못한 규칙은 판정하지 않는다
+    if (op in ("범위", "이상") and low is None) or (op in ("범위", "이하", "미만") and high is None):
+        return NO_COMPARISON
+    return Comparison(op, low, high)
+
+def compile_rule(nutrient, rule):
+    text = str(rule).strip()
+
+    percent = None
+    if "%" in text:
+        if "~" in text:
+            parts = text.replace("%", "").split("~")
+            percent = _comparison("범위", extract_float(parts[0]), extract_float(parts[1]))
+        else:
+            limit = extract_float(text)
+            if "이하" in text:
+                percent = _comparison("이하", high=limit)
+            elif "미만" in text:
+                percent = _comparison("미만", high=limit)
+            elif "이상" in text:
+                percent = _comparison("이상", low=limit)
+            else:
+                percent = NO_COMPARISON
+
+    # 일반 수치 기준 (총 열량이 0이면 % 규칙도 이 경로로 판정된다)
+    if text.endswith("이하"):
+        absolute = _comparison("이하", high=extract_float(text))
+    elif text.endswith("이상"):
+        absolute = _comparison("이상", low=extract_float(text))
+    elif text.endswith("미만"):
+        absolute = _comparison("미만", high=extract_float(text))
+    elif "~" in text:
+        parts = text.split("~")
+        absolute = _comparison("범위", extract_float(parts[0]), extract_float(parts[1]))
+    else:
+        absolute = NO_COMPARISON
+
+    return NutrientRule(nutrient, rule, ENERGY_FACTORS.get(nutrient), percent, absolute)
+
+def compile_standards(disease_standards):
+    # {질환 키: {영양소: NutrientRule}} — 기준표를 읽을 때 한 번만 만든다
+    return {
+        key: {nutrient: compile_rule(nutrient, standard.get(nutrient, "")) for nutrient in EVALUATION_NUTRIENTS}
+        for key, standard in disease_standards.items()
+    }
+
+def _compare(comparison, x):
+    if comparison.op == "이하":
+        return x <= comparison.high
+    if comparison.op == "미만":
+        return x < comparison.high
+    if comparison.op == "이상":
+        return x >= comparison.low
+    return (comparison.low <= x) & (x <= comparison.high)
+
+def _label(comparison, x):
+    if comparison.op is None:
+        return np.full(x.shape, "", dtype=object)
+    return np.where(_compare(comparison, x), "충족", "미달").astype(object)
+
+def evaluate_rule(rule, values, total_energy):
+    # values, total_energy: 수급자별 배열 → "충족"/"미달"/"" 배열
+    values = np.asarray(values, dtype=float)
+    total_energy = np.broadcast_to(np.asarray(total_energy, dtype=float), values.shape)
+    logger.debug("기준 판별 → nutrient: %s, rule: %s, n=%d", rule.nutrient, rule.text, values.size)
+
+    result = _label(rule.absolute, values)
+    if rule.percent is None:
+        return result
+    use_percent = total_energy != 0  # NaN도 참 (기존 `if total_energy` 판정과 동일)
+    if not use_percent.any():
+        return result
+    if rule.energy_factor is None:
+        result[use_percent] = ""
+        return result
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (values * rule.energy_factor / total_energy) * 100
+    result[use_percent] = _label(rule.percent, ratio)[use_percent]
+    return result
+
+def _passes(comparison, x):
+    if comparison.op is None:
+        return np.ones(np.shape(x), dtype=bool)
+    return _compare(comparison, x)
+
+def rule_passes(rule, values, total_energy):
+    # evaluate_rule의 불리언 버전: "미달"이 아니면 True (판정하지 않는 규칙("")도 True)
+    values = np.asarray(values, dtype=float)
+    total_energy = np.broadcast_to(np.asarray(total_energy, dtype=float), values.shape)
+    result = _passes(rule.absolute, values)
+    if rule.percent is None:
+        return result
+    use_percent = total_energy != 0
+    if rule.energy_factor is None:
+        return result | use_percent
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (values * rule.energy_factor / total_energy) * 100
+    return np.where(use_percent, _passes(rule.percent, ratio), result)
+
+def evaluate_nutrient_criteria(nutrient, value, rule, total_energy=None):
+    if not isinstance(rule, NutrientRule):
+        rule = compile_rule(nutrient, rule)
+    return evaluate_rule(rule, [value], [total_energy or 0])[0]
+
+def disease_key_of(diseases):
+    return ", ".join(sorted([d.strip() for d in diseases]))  # 질환명을 알파벳 순서로 정렬하여 키 생성
+
+def evaluate_compliance(totals, disease_keys, standards):
+    # totals: 수급자 × 영양소 합계 DataFrame, disease_keys: 같은 길이의 질환 키
+    # 같은 질환 키끼리 묶어 규칙마다 한 번의 배열 비교로 _기준/_평가 열을 채운다
+    disease_keys = np.asarray(disease_keys, dtype=object)
+    n = len(totals)
+    columns = {}
+    for nutrient in EVALUATION_NUTRIENTS:
+        columns[nutrient + "_기준"] = np.full(n, "", dtype=object)
+        columns[nutrient + "_평가"] = np.full(n, "", dtype=object)
+
+    def column_values(name):
+        if name in totals.columns:
+            return totals[name].to_numpy(dtype=float)
+        return np.zeros(n)
+
+    total_energy = column_values("에너지(kcal)")
+    keys, codes = np.unique(disease_keys.astype(str), return_inverse=True)
+    for code, key in enumerate(keys):
+        rules = standards.get(key)
+        if not rules:
+            continue
+        rows = codes == code
+        for nutrient, rule in rules.items():
+            columns[nutrient + "_기준"][rows] = rule.text
+            columns[nutrient + "_평가"][rows] = evaluate_rule(rule, column_values(nutrient)[rows], total_energy[rows])
+    return pd.DataFrame(columns, index=totals.index)
+
+def generate_evaluation_summary(total_nutrients, diseases, standards):
+    totals = pd.DataFrame([total_nutrients])
+    return evaluate_compliance(totals, [disease_key_of(diseases)], standards).iloc[0].to_dict()
+
+# 식단 행을 수급자별로 합산할 영양소 (총 중량 제외)
+MENU_NUTRIENT_COLUMNS = [
+    "에너지(kcal)", "탄수화물(g)", "당류(g)", "식이섬유(g)", "단백질(g)",
+    "지방(g)", "포화지방(g)", "나트륨(mg)", "칼슘(mg)", "콜레스테롤", "칼륨(mg)"
+]
+
+def disease_keys_from_labels(labels):
+    # "고혈압, 당뇨" 같은 질환 문자열 → 기준표 키 (빈 값은 질환없음)
+    labels = pd.Series(labels, dtype=object)
+    keys = {}
+    for label in labels.unique():
+        diseases = [d.strip() for d in label.split(",")] if isinstance(label, str) and label else ["질환없음"]
+        keys[label] = disease_key_of(diseases)
+    return labels.map(keys).to_numpy(dtype=object)
+
+def evaluate_facility(adjusted_results, patient_df, standards):
+    # 질환별 조정 식단 → 수급자별 영양소 합계(groupby 한 번) → 수급자ID, 질환, _기준/_평가 행렬
+    frames = [df for df in adjusted_results.values() if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat([df[["수급자ID"] + MENU_NUTRIENT_COLUMNS] for df in frames], ignore_index=True)
+    totals = combined.groupby("수급자ID", sort=False)[MENU_NUTRIENT_COLUMNS].sum()
+
+    first_diseases = patient_df.drop_duplicates("수급자ID").set_index("수급자ID")["질환"]
+    disease_values = totals.index.map(first_diseases)
+    evaluation = evaluate_compliance(totals, disease_keys_from_labels(disease_values), standards)
+    evaluation.insert(0, "질환", disease_values)
+    return evaluation.rename_axis("수급자ID").reset_index()
+
+
+# ========== 전체 수급자 일괄 조정 ==========
+
+PORTION_COLUMNS = ["총 중량"] + MENU_NUTRIENT_COLUMNS
+ADJUSTABLE_CATEGORIES = ["밥", "주찬"]
+ALLOWED_RATIOS = [0.25, 0.5, 1.0, 1.25, 2.0]
+
+def build_rice_index(category_df):
+    # 밥 메뉴명 → 영양성분 벡터 (같은 이름이 여러 번 나오면 첫 행). 메뉴 파일당 한 번만 만든다
+    rice = category_df[category_df["Category"] == "밥"].drop_duplicates("Menu")
+    return rice.set_index("Menu")[PORTION_COLUMNS].astype(float)
+
+def update_rice_nutrients(menu_df, rice_index):
+    # update_rice_nutrient의 일괄 버전: 수급자별 첫 밥 행을 rice_index의 같은 밥 메뉴 영양성분으로 교체
+    # 반환: (교체된 식단, rice_index에 없는 밥 메뉴명 목록)
+    menu_df = menu_df.copy()
+    menu_df[PORTION_COLUMNS] = menu_df[PORTION_COLUMNS].astype(float)
+    rice_rows = np.flatnonzero((menu_df["Category"] == "밥").to_numpy())
+    rice_rows = rice_rows[~menu_df["수급자ID"].iloc[rice_rows].duplicated().to_numpy()]
+    rice_menus = menu_df["Menu"].iloc[rice_rows]
+    positions = rice_index.index.get_indexer(rice_menus)
+    found = positions >= 0
+    cols = [menu_df.columns.get_loc(c) for c in PORTION_COLUMNS]
+    menu_df.iloc[rice_rows[found], cols] = rice_index.to_numpy()[positions[found]]
+    missing = sorted(set(rice_menus[~found].astype(str)))
+    return menu_df, missing
+
+def snap_ratio(values, allowed_ratios=ALLOWED_RATIOS):
+    # 가장 가까운 허용 비율 (같은 거리면 목록 앞쪽 값)
+    allowed = np.asarray(allowed_ratios, dtype=float)
+    values = np.asarray(values, dtype=float)
+    return allowed[np.argmin(np.abs(values[..., None] - allowed), axis=-1)]
+
+def stack_menu(menu_df):
+    # 식단 행 → (수급자 × 메뉴 × 영양소) 배열. 메뉴 수가 다른 수급자는 NaN으로 채운다
+    # 반환: (수급자ID 배열, 값 배열, 조정 대상(밥·주찬) 마스크, 행별 (수급자, 메뉴) 위치)
+    codes, resident_ids = pd.factorize(menu_df["수급자ID"], use_na_sentinel=False)
+    slots = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    n_items = int(slots.max()) + 1 if len(slots) else 0
+    values = np.full((len(resident_ids), n_items, len(PORTION_COLUMNS)), np.nan)
+    values[codes, slots] = menu_df[PORTION_COLUMNS].to_numpy(dtype=float)
+    adjustable = np.zeros((len(resident_ids), n_items), dtype=bool)
+    adjustable[codes, slots] = menu_df["Category"].isin(ADJUSTABLE_CATEGORIES).to_numpy()
+    return np.asarray(resident_ids), values, adjustable, (codes, slots)
+
+def compute_portion_ratios(values, adjustable, low, high):
+    # values: (수급자 × 메뉴 × PORTION_COLUMNS), low/high: (수급자 × TARGET_NUTRIENTS)
+    # 영양소별 비율과 적용 비율(1에서 가장 먼 비율을 허용 비율로 반올림)을 수급자 단위로 계산
+    cols = [PORTION_COLUMNS.index(n) for n in TARGET_NUTRIENTS]
+    actual = np.nansum(values[:, :, cols], axis=1)
+    adjust = np.nansum(np.where(adjustable[:, :, None], values[:, :, cols], np.nan), axis=1)
+    has_targets = adjustable.any(axis=1)
+
+    short = actual < low
+    over = ~short & (actual > high)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(short, (adjust + (low - actual)) / adjust, np.where(over, (adjust - (actual - high)) / adjust, 1.0))
+    met = adjust == 0
+    ratios = np.where(met, 1.0, ratios)
+
+    picked = ratios[np.arange(len(ratios)), np.argmax(np.abs(ratios - 1.0), axis=1)] if len(ratios) else np.ones(0)
+    applied = np.where(has_targets, snap_ratio(picked), 1.0)
+    status = np.select([met, short, over], ["충족", "부족", "초과"], default="충족")
+    gap = np.where(short, low - actual, np.where(over, actual - high, 0.0))
+    return {
+        "actual": actual, "adjust": adjust, "ratios": ratios, "status": status, "gap": gap,
+        "most_significant": picked, "applied": applied, "has_targets": has_targets,
+    }
+
+def _resident_targets(patient_df, resident_ids):
+    # stack_menu 순서의 수급자 행과 개인 기준 하한/상한 배열 (수급자 × TARGET_NUTRIENTS)
+    residents = patient_df.drop_duplicates("수급자ID").set_index("수급자ID").reindex(resident_ids)
+    low = residents.reindex(columns=[target_bounds(n)[0] for n in TARGET_NUTRIENTS]).to_numpy(dtype=float)
+    high = residents.reindex(columns=[target_bounds(n)[1] for n in TARGET_NUTRIENTS]).to_numpy(dtype=float)
+    return residents, low, high
+
+def apply_portion_scaling(values, adjustable, applied):
+    # 밥·주찬 행에만 수급자별 적용 비율을 곱한다 (브로드캐스트 곱셈 한 번)
+    return values * np.where(adjustable, applied[:, None], 1.0)[:, :, None]
+
+def scale_portions(menu_df, patient_df):
+    # adjust_rice_if_nutrient_insufficient의 화면 출력 없는 계산부 (수급자 여러 명을 한 번에)
+    # 반환: (조정된 식단, 수급자ID 색인의 비율 진단표)
+    resident_ids, values, adjustable, (codes, slots) = stack_menu(menu_df)
+    residents, low, high = _resident_targets(patient_df, resident_ids)
+
+    result = compute_portion_ratios(values, adjustable, low, high)
+    scaled = apply_portion_scaling(values, adjustable, result["applied"])
+
+    menu_df = menu_df.copy()
+    menu_df[PORTION_COLUMNS] = scaled[codes, slots]
+
+    diagnostics = pd.DataFrame(index=pd.Index(resident_ids, name="수급자ID"))
+    for i, nutrient in enumerate(TARGET_NUTRIENTS):
+        diagnostics[f"{nutrient}_상태"] = result["status"][:, i]
+        diagnostics[f"{nutrient}_차이"] = result["gap"][:, i]
+        diagnostics[f"{nutrient}_비율"] = result["ratios"][:, i]
+    diagnostics["조정대상있음"] = result["has_targets"]
+    diagnostics["적용비율"] = result["applied"]
+    return menu_df, diagnostics
+
+# ========== 밥·주찬 최적 비율 탐색 ==========
+
+# 개인 기준과 함께 위반량에 넣는 MFDS 기준 영양소
+LIMIT_NUTRIENTS = ["나트륨(mg)", "칼륨(mg)"]
+# ADJUSTABLE_CATEGORIES 순서의 비율 조합 후보. 1.0에서 덜 벗어난 조합이 앞에 와서 위반량이 같으면 덜 바꾸는 쪽을 고른다
+PORTION_GRID = np.array(sorted(
+    itertools.product(ALLOWED_RATIOS, repeat=len(ADJUSTABLE_CATEGORIES)),
+    key=lambda ratios: (sum(abs(r - 1.0) for r in ratios), ratios),
+))
+PORTION_METHODS = ["ratio", "solver"]
+
+def mfds_limits(disease_keys, standards):
+    # 수급자별 LIMIT_NUTRIENTS 하한/상한 (기준이 없으면 -inf/inf)
+    # 판정표(extract_float)와 달리 천 단위 쉼표를 읽는다 ("1,350mg이하" → 1350)
+    keys = np.asarray(disease_keys, dtype=object).astype(str)
+    low = np.full((len(keys), len(LIMIT_NUTRIENTS)), -np.inf)
+    high = np.full((len(keys), len(LIMIT_NUTRIENTS)), np.inf)
+    for key in np.unique(keys):
+        rules = standards.get(key)
+        if not rules:
+            continue
+        rows = keys == key
+        for j, nutrient in enumerate(LIMIT_NUTRIENTS):
+            if nutrient not in rules:
+                continue
+            comparison = compile_rule(nutrient, str(rules[nutrient].text).replace(",", "")).absolute
+            if comparison.low is not None:
+                low[rows, j] = comparison.low
+            if comparison.high is not None:
+                high[rows, j] = comparison.high
+    return low, high
+
+def portion_violation(totals, low, high):
+    # 범위를 벗어난 양을 경계값 대비 비율로 바꿔 영양소별로 합한다 (경계가 NaN/무한대면 0)
+    def scale(bound):
+        return np.where(np.isfinite(bound) & (bound != 0), np.abs(bound), 1.0)
+    below = np.fmax(low - totals, 0) / scale(low)
+    above = np.fmax(totals - high, 0) / scale(high)
+    return np.nansum(below + above, axis=-1)
+
+def solve_portions(menu_df, patient_df, standards):
+    # 밥·주찬에 허용 비율을 각각 골라 개인 열량·3대 영양소 범위와 MFDS 나트륨·칼륨 기준의 위반량 합을 최소화
+    # 후보가 len(ALLOWED_RATIOS)² 개뿐이라 수급자 × 후보 전체를 배열 한 번으로 계산해 고른다 (전수 탐색)
+    # 반환: (조정된 식단, 수급자ID 색인의 진단표: 범주별 비율, 조정 전/단일 비율/최적 위반량)
+    resident_ids, values, adjustable, (codes, slots) = stack_menu(menu_df)
+    residents, low, high = _resident_targets(patient_df, resident_ids)
+    limit_low, limit_high = mfds_limits(disease_keys_from_labels(residents["질환"]), standards)
+    bound_low = np.hstack([low, limit_low])[:, None, :]
+    bound_high = np.hstack([high, limit_high])[:, None, :]
+
+    category = np.full(adjustable.shape, -1)
+    category[codes, slots] = pd.Categorical(menu_df["Category"], categories=ADJUSTABLE_CATEGORIES).codes
+    cols = [PORTION_COLUMNS.index(n) for n in TARGET_NUTRIENTS + LIMIT_NUTRIENTS]
+    nutrients = np.nan_to_num(values[:, :, cols])
+    fixed = (nutrients * (category == -1)[:, :, None]).sum(axis=1)
+    parts = np.stack([(nutrients * (category == c)[:, :, None]).sum(axis=1) for c in range(len(ADJUSTABLE_CATEGORIES))], axis=1)
+
+    # 수급자 × 후보 × 영양소 합계
+    totals = fixed[:, None, :] + np.einsum("gc,rcn->rgn", PORTION_GRID, parts)
+    violation = portion_violation(totals, bound_low, bound_high)
+    # 개인 기준이 없거나 조정할 메뉴가 없는 수급자는 1.0 유지 (단일 비율 방식과 같음)
+    solvable = adjustable.any(axis=1) & ~np.isnan(low).any(axis=1)
+    best = np.where(solvable, np.argmin(violation, axis=1), 0)
+    chosen = PORTION_GRID[best]
+
+    heuristic = compute_portion_ratios(values, adjustable, low, high)["applied"]
+    heuristic_totals = fixed + heuristic[:, None] * parts.sum(axis=1)
+    before = portion_violation(fixed + parts.sum(axis=1), bound_low[:, 0], bound_high[:, 0])
+
+    scale = np.where(category >= 0, np.take_along_axis(chosen, np.clip(category, 0, None), axis=1), 1.0)
+    menu_df = menu_df.copy()
+    menu_df[PORTION_COLUMNS] = (values * scale[:, :, None])[codes, slots]
+
+    diagnostics = pd.DataFrame(index=pd.Index(resident_ids, name="수급자ID"))
+    for c, name in enumerate(ADJUSTABLE_CATEGORIES):
+        diagnostics[f"{name}_비율"] = chosen[:, c]
+    diagnostics["조정대상있음"] = adjustable.any(axis=1)
+    diagnostics["위반_조정전"] = before
+    diagnostics["위반_단일비율"] = portion_violation(heuristic_totals, bound_low[:, 0], bound_high[:, 0])
+    diagnostics["위반_최적"] = violation[np.arange(len(best)), best]
+    return menu_df, diagnostics
+
+def adjust_facility(final_results, patient_df, rice_index, method="ratio", standards=None):
+    # 전체 수급자 모드: 밥 영양성분 교체 → 밥+주찬 비율 조정을 질환별 프레임 단위로 일괄 수행
+    # method: "ratio"(단일 비율, scale_portions) / "solver"(범주별 최적 비율, solve_portions — standards 필요)
+    # 반환: (조정된 식단, 수급자별 비율 진단, rice_index에 없는 밥 메뉴명 목록)
+    adjusted_results = {}
+    ratio_tables = []
+    missing_rice = set()
+    for disease, df in final_results.items():
+        df, missing = update_rice_nutrients(df, rice_index)
+        missing_rice.update(missing)
+        if method == "solver":
+            df, ratio_table = solve_portions(df, patient_df, standards)
+        else:
+            df, ratio_table = scale_portions(df, patient_df)
+        adjusted_results[disease] = df
+        ratio_tables.append(ratio_table)
+    ratios = pd.concat(ratio_tables) if ratio_tables else pd.DataFrame()
+    return adjusted_results, ratios, sorted(missing_rice)
+
+
+# ========== MFDS 미달 대체 메뉴 탐색 ==========
+
+SUBSTITUTABLE_CATEGORIES = ["주찬", "부찬1", "부찬2", "김치"]
+# 한 번에 평가하는 (수급자 × 후보 조합) 칸 수 상한 — 배열 메모리 제한
+SUBSTITUTION_CHUNK = 200_000
+SUBSTITUTION_TIME_BUDGET = 10.0
+
+def substitution_pool(category_df):
+    # 범주별 대체 후보 (메뉴명 배열, 후보 × PORTION_COLUMNS 영양성분 행렬). 이름·영양성분이 같은 행은 하나만 남긴다
+    pool = {}
+    for category in SUBSTITUTABLE_CATEGORIES:
+        rows = category_df[category_df["Category"] == category].drop_duplicates(["Menu"] + PORTION_COLUMNS)
+        pool[category] = (rows["Menu"].to_numpy(dtype=object), np.nan_to_num(rows[PORTION_COLUMNS].to_numpy(dtype=float)))
+    return pool
+
+def _failed_nutrients(rules, totals, energy_col):
+    # totals: (... × PORTION_COLUMNS) → 영양소별 통과 여부 (... × 규칙 수)
+    return np.stack([
+        ~rule_passes(rule, totals[..., PORTION_COLUMNS.index(nutrient)], totals[..., energy_col])
+        for nutrient, rule in rules.items()
+    ], axis=-1)
+
+def _infeasible_nutrients(rules, totals, low_delta, high_delta):
+    # 가지치기: 대체로 만들 수 있는 최소/최대 합계로도 수치 기준(% 기준 없는 규칙)을 못 맞추는 영양소
+    infeasible = []
+    for nutrient, rule in rules.items():
+        comparison = rule.absolute
+        if rule.percent is not None or comparison.op is None:
+            continue
+        j = PORTION_COLUMNS.index(nutrient)
+        lowest, highest = totals[:, j] + low_delta[:, j], totals[:, j] + high_delta[:, j]
+        if comparison.op == "이하":
+            bad = lowest > comparison.high
+        elif comparison.op == "미만":
+            bad = lowest >= comparison.high
+        elif comparison.op == "이상":
+            bad = highest < comparison.low
+        else:
+            bad = (lowest > comparison.high) | (highest < comparison.low)
+        infeasible.append(np.where(bad, nutrient, ""))
+    if not infeasible:
+        return np.full(len(totals), "", dtype=object)
+    return np.array([", ".join(n for n in row if n) for row in np.stack(infeasible, axis=1)], dtype=object)
+
+def _swap_deltas(matrix, multiplier, current, present):
+    # 한 범주를 후보로 바꿀 때 합계 변화량 (수급자 × 후보 × PORTION_COLUMNS). 해당 범주 메뉴가 없는 수급자는 0
+    delta = multiplier[:, None, None] * matrix[None] - current[:, None]
+    delta[~present] = 0.0
+    return delta
+
+def _swap_delta_bounds(matrix, multiplier, current, present):
+    # _swap_deltas의 후보별 최소/최대를 배열을 만들지 않고 구한다 (지금 메뉴를 그대로 두는 변화량 0 포함)
+    if not len(matrix):
+        return np.zeros_like(current), np.zeros_like(current)
+    scaled_min = multiplier[:, None] * matrix.min(axis=0)
+    scaled_max = multiplier[:, None] * matrix.max(axis=0)
+    low = np.where(present[:, None], np.minimum(scaled_min, scaled_max) - current, 0.0)
+    high = np.where(present[:, None], np.maximum(scaled_min, scaled_max) - current, 0.0)
+    return np.minimum(low, 0), np.maximum(high, 0)
+
+def substitute_menus(adjusted_results, patient_df, category_df, standards, time_budget=SUBSTITUTION_TIME_BUDGET):
+    # MFDS 기준 미달 수급자의 주찬/부찬1/부찬2/김치를 같은 Category 다른 메뉴로 바꿔 모든 기준을 통과시킨다
+    # 바꾸는 범주 수가 적은 조합부터(1개 → 2개 → …) 수급자 × 후보 조합 배열로 한꺼번에 판정하고,
+    # 같은 수라면 열량 변화가 가장 작은 조합을 고른다. 바뀐 메뉴는 원래 메뉴의 양 조절 비율을 그대로 따른다
+    # 반환: (대체된 식단, 처음 미달이던 수급자의 대체 보고서 — 대체상태 해결/불가능/시간초과)
+    started = time.perf_counter()
+    report_columns = ["질환", "대체상태", "대체수", "대체내역", "미달영양소"]
+    frames = [(disease, df) for disease, df in adjusted_results.items() if not df.empty]
+    if not frames:
+        return adjusted_results, pd.DataFrame(columns=report_columns).rename_axis("수급자ID")
+    pool = substitution_pool(category_df)
+    energy_col = PORTION_COLUMNS.index("에너지(kcal)")
+
+    # 수급자 × PORTION_COLUMNS 합계, 범주별 현재 메뉴 (행 위치, 영양성분, 양 조절 배수)
+    combined = pd.concat([df.assign(_frame=i, _row=np.arange(len(df))) for i, (_, df) in enumerate(frames)], ignore_index=True)
+    codes, resident_ids = pd.factorize(combined["수급자ID"], use_na_sentinel=False)
+    n_residents = len(resident_ids)
+    totals = np.zeros((n_residents, len(PORTION_COLUMNS)))
+    np.add.at(totals, codes, np.nan_to_num(combined[PORTION_COLUMNS].to_numpy(dtype=float)))
+
+    n_categories = len(SUBSTITUTABLE_CATEGORIES)
+    slot_row = np.full((n_residents, n_categories), -1)
+    current = np.zeros((n_residents, n_categories, len(PORTION_COLUMNS)))
+    multiplier = np.ones((n_residents, n_categories))
+    base_weights = {}
+    for disease, _ in frames:
+        selected = select_disease_menu(category_df, disease)
+        if selected is not None:
+            base_weights[disease] = selected.set_index("Category")["총 중량"].astype(float)
+    frame_diseases = np.array([disease for disease, _ in frames], dtype=object)
+    for c, category in enumerate(SUBSTITUTABLE_CATEGORIES):
+        rows = np.flatnonzero((combined["Category"] == category).to_numpy())
+        rows = rows[~pd.Series(codes[rows]).duplicated().to_numpy()]
+        slot_row[codes[rows], c] = rows
+        current[codes[rows], c] = np.nan_to_num(combined[PORTION_COLUMNS].to_numpy(dtype=float)[rows])
+        base = np.array([
+            base_weights.get(disease, pd.Series(dtype=float)).get(category, np.nan)
+            for disease in frame_diseases[combined["_frame"].to_numpy()[rows]]
+        ], dtype=float)
+        weight = combined["총 중량"].to_numpy(dtype=float)[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            multiplier[codes[rows], c] = np.where(np.isfinite(base) & (base > 0) & np.isfinite(weight), weight / base, 1.0)
+
+    present = slot_row >= 0
+    first = patient_df.drop_duplicates("수급자ID").set_index("수급자ID").reindex(resident_ids)
+    diseases = first["질환"].to_numpy(dtype=object)
+    disease_keys = disease_keys_from_labels(diseases)
+    status = np.full(n_residents, "", dtype=object)
+    remaining = np.full(n_residents, "", dtype=object)
+    choice = {}
+
+    pending = []
+    for key in np.unique(disease_keys.astype(str)):
+        rules = standards.get(key)
+        if not rules:
+            continue
+        rows = np.flatnonzero(disease_keys.astype(str) == key)
+        failed = _failed_nutrients(rules, totals[rows], energy_col)
+        rows, failed = rows[failed.any(axis=1)], failed[failed.any(axis=1)]
+        if not len(rows):
+            continue
+        names = np.array(list(rules), dtype=object)
+        remaining[rows] = [", ".join(names[f]) for f in failed]
+        status[rows] = "불가능"
+        bounds = [
+            _swap_delta_bounds(pool[category][1], multiplier[rows, c], current[rows, c], present[rows, c])
+            for c, category in enumerate(SUBSTITUTABLE_CATEGORIES)
+        ]
+        low_delta = sum(low for low, _ in bounds)
+        high_delta = sum(high for _, high in bounds)
+        infeasible = _infeasible_nutrients(rules, totals[rows], low_delta, high_delta)
+        remaining[rows[infeasible != ""]] = infeasible[infeasible != ""]
+        pending.append((rules, rows[infeasible == ""]))
+
+    timed_out = False
+    for k in range(1, n_categories + 1):
+        for combo in itertools.combinations(range(n_categories), k):
+            # 후보 조합(범주별 후보 수의 곱)은 만들지 않고 평면 번호 구간으로 나눠 훑는다
+            # 한 번에 만드는 배열은 (수급자 묶음 × 조합 구간) ≤ SUBSTITUTION_CHUNK 칸, 배열을 만들기 전마다 시간 예산을 확인
+            sizes = [len(pool[SUBSTITUTABLE_CATEGORIES[c]][0]) for c in combo]
+            n_grid = math.prod(sizes)
+            if not n_grid:
+                continue
+            block = min(n_grid, SUBSTITUTION_CHUNK)
+            chunk = max(1, SUBSTITUTION_CHUNK // block)
+            for rules, rows in pending:
+                unsolved = rows[status[rows] == "불가능"]
+                for start in range(0, len(unsolved), chunk):
+                    if time.perf_counter() - started > time_budget:
+                        timed_out = True
+                        break
+                    batch = unsolved[start:start + chunk]
+                    deltas = [
+                        _swap_deltas(pool[SUBSTITUTABLE_CATEGORIES[c]][1], multiplier[batch, c], current[batch, c], present[batch, c])
+                        for c in combo
+                    ]
+                    best_change = np.full(len(batch), np.inf)
+                    best_index = np.zeros(len(batch), dtype=np.int64)
+                    for offset in range(0, n_grid, block):
+                        if time.perf_counter() - started > time_budget:
+                            timed_out = True
+                            break
+                        picks = np.unravel_index(np.arange(offset, min(offset + block, n_grid)), sizes)
+                        candidate = totals[batch, None, :] + sum(delta[:, pick] for delta, pick in zip(deltas, picks))
+                        passes = ~_failed_nutrients(rules, candidate, energy_col).any(axis=-1)
+                        energy_change = np.where(passes, np.abs(candidate[..., energy_col] - totals[batch, None, energy_col]), np.inf)
+                        best = np.argmin(energy_change, axis=1)
+                        change = energy_change[np.arange(len(batch)), best]
+                        # 같은 열량 변화면 앞 구간(먼저 나온 조합)을 유지
+                        better = change < best_change
+                        best_change[better] = change[better]
+                        best_index[better] = offset + best[better]
+                    if timed_out:
+                        # 끝까지 훑지 못한 묶음은 결과를 버리고 시간초과로 남긴다
+                        break
+                    solved = np.isfinite(best_change)
+                    for r, b in zip(batch[solved], best_index[solved]):
+                        choice[r] = list(zip(combo, (int(j) for j in np.unravel_index(b, sizes))))
+                    status[batch[solved]] = "해결"
+                    remaining[batch[solved]] = ""
+                if timed_out:
+                    break
+            if timed_out:
+                break
+        if timed_out:
+            break
+    if timed_out:
+        # 탐색을 끝내지 못한 수급자 (가지치기로 불가능이 확정된 수급자는 그대로)
+        for rules, rows in pending:
+            status[rows[status[rows] == "불가능"]] = "시간초과"
+
+    # 선택한 대체 메뉴를 식단에 반영 (메뉴명은 수급자 식단옵션의 suffix를 붙인다)
+    suffixes = first["식단옵션"].map(lambda option: option["suffix"] if isinstance(option, dict) else "").to_numpy(dtype=object)
+    results = dict(adjusted_results)
+    copies = {}
+    details = np.full(n_residents, "", dtype=object)
+    swap_counts = np.zeros(n_residents, dtype=int)
+    frame_ids = combined["_frame"].to_numpy()
+    frame_rows = combined["_row"].to_numpy()
+    for r, swaps in choice.items():
+        parts = []
+        for c, j in swaps:
+            category = SUBSTITUTABLE_CATEGORIES[c]
+            names, matrix = pool[category]
+            row = slot_row[r, c]
+            frame = frame_ids[row]
+            if frame not in copies:
+                copies[frame] = frames[frame][1].copy()
+                copies[frame][PORTION_COLUMNS] = copies[frame][PORTION_COLUMNS].astype(float)
+            df = copies[frame]
+            old_name = df["Menu"].iat[frame_rows[row]]
+            new_name = names[j] + suffixes[r]
+            df.iloc[frame_rows[row], df.columns.get_loc("Menu")] = new_name
+            df.iloc[frame_rows[row], [df.columns.get_loc(col) for col in PORTION_COLUMNS]] = multiplier[r, c] * matrix[j]
+            if new_name != old_name:
+                parts.append(f"{category}: {old_name} → {new_name}")
+        details[r] = "; ".join(parts)
+        swap_counts[r] = len(parts)
+    for frame, df in copies.items():
+        results[frames[frame][0]] = df
+
+    reported = status != ""
+    report = pd.DataFrame({
+        "질환": diseases[reported],
+        "대체상태": status[reported],
+        "대체수": swap_counts[reported],
+        "대체내역": details[reported],
+        "미달영양소": remaining[reported],
+    }, index=pd.Index(resident_ids[reported], name="수급자ID"))
+    logger.debug("대체 메뉴 탐색 → 미달 %d명, %.2fs", int(reported.sum()), time.perf_counter() - started)
+    return results, report
+
+
+# ========== 주기 식단 계획 ==========
+
+# 같은 메뉴를 다시 내기까지 비워 둘 일수 (밥·김치는 매일 같아도 된다)
+PLAN_NO_REPEAT_DAYS = {"국": 3, "주찬": 5, "부찬1": 3, "부찬2": 3}
+# 하루 조합을 만들 때 범주별로 고려할 후보 수 (오래 쉬었던 메뉴부터). 조합 수가 PLAN_COMBO_LIMIT를 넘으면 더 줄인다
+PLAN_MAX_CANDIDATES = 8
+PLAN_COMBO_LIMIT = 20_000
+# 하루마다 남겨 두는 순위 상위 조합 수와 전체 되돌림 허용 횟수
+PLAN_BRANCHES = 8
+PLAN_BACKTRACK_LIMIT = 2000
+# 질환 하나에서 완화 전 조건으로 탐색하는 시간 (초과하면 다음 완화 단계로)
+PLAN_TIME_BUDGET = 8.0
+
+def plan_candidates(category_df, disease):
+    # 질환별 범주 후보: 밥은 그 질환 메뉴만, 나머지는 같은 Category 전체 (그 질환 메뉴가 앞, 이름이 같으면 앞의 것)
+    own = category_df[category_df["Disease"] == disease]
+    others = category_df[category_df["Disease"] != disease]
+    candidates = {}
+    for category in REQUIRED_CATEGORIES:
+        rows = own[own["Category"] == category]
+        if category != "밥":
+            rows = pd.concat([rows, others[others["Category"] == category]])
+        candidates[category] = rows.drop_duplicates("Menu").reset_index(drop=True)
+    return candidates
+
+def weekly_targets_from_roster(patient_df, disease):
+    # 대표질환이 같은 수급자 개인 기준(하한/상한)의 중앙값 → 주 평균 목표 (계산 가능한 수급자가 없으면 None)
+    residents = patient_df[patient_df["대표질환"] == disease]
+    low = residents[[target_bounds(n)[0] for n in TARGET_NUTRIENTS]].median().to_numpy(dtype=float)
+    high = residents[[target_bounds(n)[1] for n in TARGET_NUTRIENTS]].median().to_numpy(dtype=float)
+    if np.isnan(low).any() or np.isnan(high).any():
+        return None
+    return low, high
+
+def _plan_day_options(candidates, menu_ids, last_used, day, windows, rules, strict, week_sum, week_day, week_length, targets):
+    # 하루 조합 후보: 반복 제한으로 범주별 후보를 거른 뒤 전 조합을 배열로 만들어
+    # 같은 날 같은 메뉴 중복 제외 → MFDS 기준 통과(strict가 아니면 미달 항목이 가장 적은 조합)
+    # → 남은 날을 하루 최소/최대 합계(day_bounds)로 채워도 주 평균 목표에 닿는 조합만 (전방 검사)
+    # → 주 평균이 목표 중앙에 가까운 순으로 정렬
+    energy_col = PORTION_COLUMNS.index("에너지(kcal)")
+    target_cols = [PORTION_COLUMNS.index(n) for n in TARGET_NUTRIENTS]
+    domains = []
+    for category in REQUIRED_CATEGORIES:
+        rest = day - last_used[category]
+        allowed = np.flatnonzero(rest > windows.get(category, 0))
+        if not len(allowed):
+            return np.empty((0, len(REQUIRED_CATEGORIES)), dtype=int)
+        domains.append(allowed[np.argsort(-rest[allowed], kind="stable")])
+    sizes = [min(len(d), PLAN_MAX_CANDIDATES) for d in domains]
+    while np.prod(sizes) > PLAN_COMBO_LIMIT:
+        sizes[int(np.argmax(sizes))] -= 1
+    domains = [d[:size] for d, size in zip(domains, sizes)]
+    combos = np.stack([grid.ravel() for grid in np.meshgrid(*domains, indexing="ij")], axis=1)
+    ids = np.stack([menu_ids[c][combos[:, i]] for i, c in enumerate(REQUIRED_CATEGORIES)], axis=1)
+    ids = np.sort(ids, axis=1)
+    distinct = (ids[:, 1:] != ids[:, :-1]).all(axis=1)
+    if distinct.any() or strict:
+        combos = combos[distinct]
+    totals = sum(candidates[c][combos[:, i]] for i, c in enumerate(REQUIRED_CATEGORIES))
+    if rules:
+        failures = _failed_nutrients(rules, totals, energy_col).sum(axis=1)
+        keep = failures == 0 if strict else failures == (failures.min() if len(failures) else 0)
+        combos, totals = combos[keep], totals[keep]
+    if targets is None:
+        score = np.zeros(len(combos))
+    else:
+        low, high, day_low, day_high = targets
+        remaining = week_length - week_day - 1
+        so_far = week_sum[target_cols] + totals[:, target_cols]
+        reachable = (
+            ((so_far + remaining * day_low) / week_length <= high) & ((so_far + remaining * day_high) / week_length >= low)
+        ).all(axis=1)
+        combos, totals, so_far = combos[reachable], totals[reachable], so_far[reachable]
+        projected = (so_far + remaining * (low + high) / 2) / week_length
+        score = (np.abs(projected - (low + high) / 2) / np.maximum(high - low, 1e-9)).sum(axis=1)
+    # 같은 점수면 오래 쉰 메뉴가 많은 조합
+    rest_total = sum(np.minimum(day - last_used[c][combos[:, i]], 28) for i, c in enumerate(REQUIRED_CATEGORIES))
+    order = np.lexsort((-rest_total, np.round(score, 6)))
+    return combos[order[:PLAN_BRANCHES]]
+
+def _plan_disease(candidates, days, windows, rules, strict, targets, deadline=np.inf):
+    # 하루씩 조합을 고르고, 막히면 전날로 돌아가 다음 순위 조합을 시도 (깊이 우선 탐색)
+    # 되돌림이 PLAN_BACKTRACK_LIMIT를 넘거나 deadline(perf_counter)이 지나면 (None, 되돌림 수)
+    matrices = {c: np.nan_to_num(candidates[c][PORTION_COLUMNS].to_numpy(dtype=float)) for c in REQUIRED_CATEGORIES}
+    names = pd.concat([candidates[c]["Menu"] for c in REQUIRED_CATEGORIES]).unique()
+    menu_ids = {c: pd.Index(names).get_indexer(candidates[c]["Menu"]) for c in REQUIRED_CATEGORIES}
+    schedule, stack = [], []
+    last_used = {c: np.full(len(candidates[c]), -10_000) for c in REQUIRED_CATEGORIES}
+    history = []
+    backtracks = 0
+    while len(schedule) < days:
+        day = len(schedule)
+        if len(stack) == day:
+            week_start = day - day % 7
+            week_sum = sum((sum(matrices[c][combo[i]] for i, c in enumerate(REQUIRED_CATEGORIES)) for combo in schedule[week_start:]), np.zeros(len(PORTION_COLUMNS)))
+            week_length = min(7, days - week_start)
+            options = _plan_day_options(
+                matrices, menu_ids, last_used, day, windows, rules, strict, week_sum, day - week_start, week_length, targets
+            )
+            stack.append([options, 0])
+        options, pointer = stack[-1]
+        if pointer >= len(options):
+            stack.pop()
+            if not schedule or backtracks >= PLAN_BACKTRACK_LIMIT or time.perf_counter() > deadline:
+                return None, backtracks
+            backtracks += 1
+            schedule.pop()
+            for c, previous in history.pop():
+                last_used[c][previous[0]] = previous[1]
+            stack[-1][1] += 1
+            continue
+        combo = options[pointer]
+        history.append([(c, (combo[i], last_used[c][combo[i]])) for i, c in enumerate(REQUIRED_CATEGORIES)])
+        for i, c in enumerate(REQUIRED_CATEGORIES):
+            last_used[c][combo[i]] = day
+        schedule.append(combo)
+    return schedule, backtracks
+
+def plan_cycle_menus(category_df, standards, days=28, patient_df=None, no_repeat=PLAN_NO_REPEAT_DAYS):
+    # 질환별 days일 점심 주기 식단. 매일 MFDS 질환 기준을 지키고, 같은 메뉴는 no_repeat 일수 안에 다시 쓰지 않으며,
+    # patient_df가 있으면 주 평균 열량·3대 영양소가 해당 질환 수급자 개인 기준 중앙값 범위에 들도록 고른다
+    # 풀리지 않으면 반복 제한을 하루씩 줄이고 → 주 평균 목표를 빼고 다시 → 마지막으로 MFDS 기준을
+    # 미달 항목 최소화로 완화한다. 적용된 조건은 보고서에 남긴다
+    # 반환: (일차·질환·Category별 메뉴 행, 질환별 계획 보고서)
+    plans, report = [], []
+    for disease in DISEASE_TYPES:
+        started = time.perf_counter()
+        candidates = plan_candidates(category_df, disease)
+        if any(candidates[c].empty for c in REQUIRED_CATEGORIES):
+            continue
+        rules = standards.get(disease_key_of([disease]))
+        targets = weekly_targets_from_roster(patient_df, disease) if patient_df is not None else None
+        # 메뉴 종류가 적은 범주는 반복 제한을 (종류 수 - 1)일로 줄인다
+        windows = {c: min(w, len(candidates[c]) - 1) for c, w in no_repeat.items() if c in candidates}
+
+        def narrowed(windows):
+            # 반복 제한을 하루씩 줄인 목록 (처음 값 포함, 모두 0일 때까지)
+            steps = [windows]
+            while any(steps[-1].values()):
+                steps.append({c: max(w - 1, 0) for c, w in steps[-1].items()})
+            return steps
+
+        # 가지치기: 범주별 최소/최대 영양성분 합으로도 못 맞추는 수치 기준이 있으면 엄격한 탐색은 건너뛴다
+        # 주 평균 목표도 하루 최소/최대 합계가 범위를 벗어나면 처음부터 빼고 탐색한다
+        matrices = [np.nan_to_num(candidates[c][PORTION_COLUMNS].to_numpy(dtype=float)) for c in REQUIRED_CATEGORIES]
+        lowest = sum(m.min(axis=0) for m in matrices)[None]
+        highest = sum(m.max(axis=0) for m in matrices)[None]
+        infeasible = _infeasible_nutrients(rules, np.zeros_like(lowest), lowest, highest)[0] if rules else ""
+        target_cols = [PORTION_COLUMNS.index(n) for n in TARGET_NUTRIENTS]
+        if targets is not None and ((highest[0, target_cols] < targets[0]) | (lowest[0, target_cols] > targets[1])).any():
+            targets_reachable = False
+        else:
+            targets_reachable = targets is not None
+        if targets_reachable:
+            targets = (targets[0], targets[1], lowest[0, target_cols], highest[0, target_cols])
+
+        # (반복 제한, MFDS 기준 엄격 적용 여부, 주 평균 목표) 순서대로 시도. 마지막 단계는 항상 풀린다
+        attempts = []
+        if not infeasible:
+            attempts += [(w, True, targets) for w in narrowed(windows)] if targets_reachable else []
+            attempts += [(w, True, None) for w in narrowed(windows)]
+        attempts.append(({c: 0 for c in windows}, False, None))
+        total_backtracks = 0
+        for attempt_windows, strict, attempt_targets in attempts:
+            # 엄격한 단계마다 남은 시간의 절반까지만 쓴다
+            deadline = time.perf_counter() + (started + PLAN_TIME_BUDGET - time.perf_counter()) / 2 if strict else np.inf
+            schedule, backtracks = _plan_disease(candidates, days, attempt_windows, rules, strict, attempt_targets, deadline)
+            total_backtracks += backtracks
+            if schedule is not None:
+                break
+        relaxed = []
+        if attempt_windows != windows:
+            relaxed.append("반복 제한")
+        if targets is not None and attempt_targets is None:
+            relaxed.append("주 평균 목표")
+        if rules and not strict:
+            relaxed.append("MFDS 기준")
+
+        day_frames = []
+        for day, combo in enumerate(schedule):
+            rows = pd.concat([candidates[c].iloc[[combo[i]]] for i, c in enumerate(REQUIRED_CATEGORIES)], ignore_index=True)
+            rows.insert(0, "일차", day + 1)
+            rows.insert(1, "주차", day // 7 + 1)
+            rows["Disease"] = disease
+            day_frames.append(rows)
+        plans.extend(day_frames)
+        failed_days = 0
+        if rules:
+            day_totals = np.stack([np.nan_to_num(rows[PORTION_COLUMNS].to_numpy(dtype=float)).sum(axis=0) for rows in day_frames])
+            failed_days = int(_failed_nutrients(rules, day_totals, PORTION_COLUMNS.index("에너지(kcal)")).any(axis=1).sum())
+        report.append({
+            "질환": disease,
+            "일수": days,
+            "반복제한": ", ".join(f"{c} {w}일" for c, w in attempt_windows.items() if w) or "없음",
+            "주평균목표": "적용" if attempt_targets is not None else ("완화" if targets is not None else "없음"),
+            "MFDS기준": ("적용" if strict else "완화") if rules else "없음",
+            "기준미달일수": failed_days,
+            "충족불가영양소": infeasible,
+            "완화": ", ".join(relaxed),
+            "되돌림": total_backtracks,
+            "소요(ms)": round((time.perf_counter() - started) * 1000, 1),
+        })
+    plan = pd.concat(plans, ignore_index=True) if plans else pd.DataFrame(columns=["일차", "주차", "Menu", "Category", "Disease"])
+    plan["Category"] = plan["Category"].astype(CATEGORY_ORDER)
+    return plan, pd.DataFrame(report)
+
+def customize_plan(plan, option):
+    # 주기 식단에 식단옵션(다진찬·갈찬·죽 대체 등) 메뉴명 적용
+    return apply_meal_customization(plan, option)
+
+
+# ========== 시설 단위 실행·내보내기 ==========
+
+def run_facility(patient_df, category_df, standards, rice_index=None, method="ratio", cache=None):
+    # 전체 수급자 모드와 같은 순서: 질환별 식단 → 밥 교체·밥+주찬 양 조절 → MFDS 판정
+    # 반환: (조정된 식단, 판정표, 비율 진단, rice_index에 없는 밥 메뉴명 목록)
+    if rice_index is None:
+        rice_index = build_rice_index(category_df)
+    final_results = generate_final_results(patient_df, category_df, cache=cache)
+    adjusted_results, ratio_table, missing_rice = adjust_facility(
+        final_results, patient_df, rice_index, method=method, standards=standards
+    )
+    eval_df = evaluate_facility(adjusted_results, patient_df, standards)
+    return adjusted_results, eval_df, ratio_table, missing_rice
+
+def count_failed(eval_df):
+    # MFDS 기준 "미달" 항목이 하나라도 있는 수급자 수
+    if eval_df.empty:
+        return 0
+    return int((eval_df[[c for c in eval_df.columns if c.endswith("_평가")]] == "미달").any(axis=1).sum())
+
+EXPORT_BATCH_RESIDENTS = 1000
+
+def export_targets(patient_df):
+    # 내보내기용 개인 기준 문자열, 수급자ID 색인 (ID가 중복되면 첫 행)
+    patients = patient_df.drop_duplicates("수급자ID")
+    return render_nutrient_targets(patients).set_axis(patients["수급자ID"].to_numpy())
+
+def _resident_batches(ids, size=EXPORT_BATCH_RESIDENTS):
+    # 수급자ID가 바뀌는 행 위치로 size명씩 끊은 (시작, 끝) 행 구간
+    ids = np.asarray(ids)
+    starts = np.concatenate([[0], np.flatnonzero(ids[1:] != ids[:-1]) + 1])[::size]
+    return zip(starts, np.append(starts[1:], len(ids)))
+
+def _cell_rows(df):
+    # NaN/None → 빈 칸, numpy 스칼라 → 파이썬 값
+    block = df.to_numpy(dtype=object)
+    block[pd.isna(block)] = None
+    return block.tolist()
+
+def write_results_workbook(adjusted_results, patient_df, output):
+    # 질환별 시트: 맞춤 식단 + 수급자별 개인 영양 기준 (output은 경로나 파일 객체)
+    # xlsxwriter constant_memory: 시트 내용을 행 순서대로 임시 파일에 흘려 쓰고, 한 번에 EXPORT_BATCH_RESIDENTS명씩만 파이썬 값으로 바꾼다
+    # 개인 기준 열은 merge 사본 없이 수급자ID로 찾아 옆에 붙인다 (ID가 중복되면 첫 행 기준)
+    # 선택 수급자 모드처럼 식단에 이미 개인 기준 열이 있으면 다시 붙이지 않는다 (예전 merge의 _x/_y 중복 열)
+    import xlsxwriter
+
+    targets = export_targets(patient_df)
+
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    # pandas to_excel과 같은 머리글 서식
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    for disease, df in adjusted_results.items():
+        extra = targets.drop(columns=df.columns, errors="ignore")
+        worksheet = workbook.add_worksheet(disease)
+        worksheet.write_row(0, 0, list(df.columns) + list(extra.columns), header_format)
+        row = 1
+        for start, end in _resident_batches(df["수급자ID"].to_numpy()):
+            batch = df.iloc[start:end]
+            for values, target_values in zip(_cell_rows(batch), _cell_rows(extra.reindex(batch["수급자ID"]))):
+                worksheet.write_row(row, 0, values + target_values)
+                row += 1
+    workbook.close()
+    return output
+
+
+# 엑셀 외 내보내기 형식: 형식 → (확장자, MIME)
+# 질환별 시트 대신 한 표에 "대표질환" 열을 두고, 개인 기준 열은 엑셀과 같다
+EXPORT_FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+}
+
+def results_table(adjusted_results, patient_df):
+    # 질환별 조정 식단 → 대표질환 열이 붙은 한 표 (행 순서는 엑셀 시트를 차례로 이은 것과 같다)
+    frames = [df.assign(대표질환=disease) for disease, df in adjusted_results.items()]
+    if not frames:
+        return pd.DataFrame(columns=["대표질환", "수급자ID"])
+    table = pd.concat(frames, ignore_index=True)
+    table.insert(0, "대표질환", table.pop("대표질환"))
+    targets = export_targets(patient_df).drop(columns=table.columns, errors="ignore")
+    for col in targets.columns:
+        # 선택 수급자 모드 식단은 개인 기준 열을 이미 갖고 있다
+        table[col] = targets[col].reindex(table["수급자ID"]).to_numpy()
+    return table
+
+def write_results(adjusted_results, patient_df, output, fmt="xlsx"):
+    # output은 경로나 바이너리 파일 객체
+    if fmt == "xlsx":
+        return write_results_workbook(adjusted_results, patient_df, output)
+    table = results_table(adjusted_results, patient_df)
+    if fmt == "parquet":
+        table.to_parquet(output, engine="pyarrow", index=False)
+    elif fmt == "csv.gz":
+        table.to_csv(output, index=False, compression={"method": "gzip", "mtime": 0})
+    elif fmt == "ndjson":
+        table.to_json(output, orient="records", lines=True, force_ascii=False)
+    else:
+        raise ValueError(f"지원하지 않는 내보내기 형식: {fmt}")
+    return output
+
+def export_file_name(name, fmt="xlsx"):
+    return f"{name}_맞춤식단.{EXPORT_FORMATS[fmt][0]}"
+
+# 수급자별 식단 카드 ZIP: 한 명당 xlsx 한 개 (식단 + 총 합계, 개인 영양 기준, MFDS 판정)
+# 카드는 생성기로 한 장씩 만들어 zipfile에 바로 쓰고, 미리 만들어 두는 카드는 스레드 수 × 2장까지만
+CARD_COLUMNS = ["Category", "Menu", "총 중량"] + MENU_NUTRIENT_COLUMNS
+
+def iter_resident_cards(adjusted_results, eval_df, patient_df):
+    # (ZIP 항목 이름, resident_card 인자) — 수급자 한 명 분량만 파이썬 값으로 바꾼다
+    targets = export_targets(patient_df)
+    evaluations = eval_df.set_index("수급자ID") if not eval_df.empty else pd.DataFrame()
+    eval_columns = [c for c in evaluations.columns if c.endswith(("_기준", "_평가"))]
+    for disease, df in adjusted_results.items():
+        menus = df[CARD_COLUMNS].to_numpy(dtype=object)
+        nutrients = df[MENU_NUTRIENT_COLUMNS].to_numpy(dtype=float)
+        for sid, rows in df.groupby("수급자ID", sort=False).indices.items():
+            menu = menus[rows]
+            menu[pd.isna(menu)] = None
+            yield f"{disease}/{sid}.xlsx", (
+                sid, disease, menu.tolist(),
+                np.nansum(nutrients[rows], axis=0).tolist(),
+                targets.loc[sid].to_dict() if sid in targets.index else {},
+                evaluations.loc[sid, eval_columns].to_dict() if sid in evaluations.index else {},
+            )
+
+def resident_card(sid, disease, menu, totals, targets, evaluation):
+    # 수급자 한 명의 식단 카드 xlsx 바이트 (xlsxwriter가 압축하는 동안 GIL을 놓으므로 스레드로 나눠 만든다)
+    import xlsxwriter
+
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": True})
+    bold = workbook.add_format({"bold": True})
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    red_format = workbook.add_format({"font_color": "red", "bold": True})
+    worksheet = workbook.add_worksheet("식단")
+
+    worksheet.write_row(0, 0, ["수급자ID", sid, "대표질환", disease], bold)
+    worksheet.write_row(2, 0, CARD_COLUMNS, header_format)
+    row = 3
+    for values in menu:
+        worksheet.write_row(row, 0, values)
+        row += 1
+    worksheet.write_row(row, 0, ["총 합계", None, None] + totals, bold)
+
+    row += 2
+    worksheet.write(row, 0, "개인 영양 기준", bold)
+    for nutrient, col in zip(TARGET_NUTRIENTS, TARGET_COLUMNS):
+        row += 1
+        worksheet.write_row(row, 0, [nutrient, targets.get(col)])
+
+    row += 2
+    worksheet.write(row, 0, "MFDS 기준 충족 여부", bold)
+    row += 1
+    worksheet.write_row(row, 0, ["영양소", "기준", "평가"], header_format)
+    judged = [
+        (col[:-len("_기준")], criterion) for col, criterion in evaluation.items()
+        if col.endswith("_기준") and isinstance(criterion, str) and criterion
+    ]
+    for nutrient, criterion in judged:
+        verdict = evaluation.get(nutrient + "_평가")
+        row += 1
+        worksheet.write_row(row, 0, [nutrient, criterion])
+        worksheet.write(row, 2, verdict, red_format if verdict == "미달" else None)
+    if not judged:
+        worksheet.write(row + 1, 0, "기준 없음")
+
+    worksheet.set_column(0, 1, 16)
+    workbook.close()
+    return output.getvalue()
+
+def write_resident_cards_zip(adjusted_results, eval_df, patient_df, output, workers=None):
+    # output은 경로나 바이너리 파일 객체. 카드는 이미 압축된 xlsx라 ZIP에는 그대로(STORED) 넣는다
+    workers = workers or min(8, os.cpu_count() or 1)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool, zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as bundle:
+        for name, args in iter_resident_cards(adjusted_results, eval_df, patient_df):
+            pending.append((name, pool.submit(resident_card, *args)))
+            if len(pending) >= workers * 2:
+                name, future = pending.popleft()
+                bundle.writestr(name, future.result())
+        while pending:
+            name, future = pending.popleft()
+            bundle.writestr(name, future.result())
+    return output
+
+
+# ========== 식자재 발주량 집계 ==========
+# ingredient 시트(레시피별 1인분 재료 g)로 조정 식단·주기 식단을 재료 총량으로 펼친다
+# (묶음 × 레시피 1인분 수) 희소 행렬 × (레시피 × 재료 g) 희소 행렬 곱을 CSR 배열과 bincount로 계산한다
+
+# 식단 메뉴명 접미사 → ingredient 시트에서 같은 조리 형태를 뜻하는 접미사
+INGREDIENT_SUFFIX_ALIASES = {"_다진찬": "_다지기", "_갈찬": "_갈아서", "_갈죽": "_갈아서"}
+
+# recipes/ingredients: 레시피명·재료명 Index, codes: 재료별 식품코드, nutrients: 재료 × MENU_NUTRIENT_COLUMNS 1g당 값(없으면 NaN)
+# 레시피 k의 재료 위치는 indices[indptr[k]:indptr[k + 1]], 1인분 g은 같은 구간의 data
+IngredientIndex = namedtuple("IngredientIndex", ["recipes", "ingredients", "codes", "nutrients", "indptr", "indices", "data"])
+
+def load_ingredient_upload(data):
+    return pd.read_excel(BytesIO(data), sheet_name="ingredient")
+
+def build_ingredient_index(ingredient_df):
+    df = ingredient_df.dropna(subset=["Menu", "Ingredient"])
+    recipe_codes, recipes = pd.factorize(df["Menu"])
+    ingredient_codes, ingredients = pd.factorize(df["Ingredient"])
+    amounts = pd.to_numeric(df["Amount_g"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    order = np.argsort(recipe_codes, kind="stable")
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(recipe_codes, minlength=len(recipes)))])
+    if "식품코드" in df.columns:
+        codes = df.groupby(ingredient_codes)["식품코드"].first().to_numpy(dtype=object)
+    else:
+        codes = np.full(len(ingredients), None, dtype=object)
+    # 재료별 영양성분은 영양성분함량기준량(보통 100g)당 값 → 1g당
+    per_gram = df.reindex(columns=MENU_NUTRIENT_COLUMNS).apply(pd.to_numeric, errors="coerce")
+    if "영양성분함량기준량" in df.columns:
+        per_gram = per_gram.div(pd.to_numeric(df["영양성분함량기준량"], errors="coerce"), axis=0)
+    else:
+        per_gram = per_gram / 100.0
+    nutrients = per_gram.groupby(ingredient_codes).first().to_numpy(dtype=float)
+    return IngredientIndex(recipes, ingredients, codes, nutrients, indptr, ingredient_codes[order], amounts[order])
+
+def resolve_recipe(menu, recipes):
+    # 식단 메뉴명 → ingredient 시트 레시피명 (없으면 None)
+    # 그대로 → 마지막 접미사를 같은 조리 형태로 바꿔서 → 접미사를 떼고 다시 → 같은 메뉴의 다른 조리 형태 순
+    #   제육볶음_갈찬 → 제육볶음_갈아서, 백김치_국물만_갈찬 → 백김치_국물만, 연두부*간장만 → 연두부*간장만_그대로
+    name = menu
+    while True:
+        if name in recipes:
+            return name
+        base, sep, suffix = name.rpartition("_")
+        if not sep:
+            break
+        alias = INGREDIENT_SUFFIX_ALIASES.get(sep + suffix)
+        if alias and base + alias in recipes:
+            return base + alias
+        name = base
+    return next((r for r in recipes if r.startswith(name + "_")), None)
+
+def resident_portions(ratio_table, resident_ids):
+    # 수급자 × ADJUSTABLE_CATEGORIES 양 조절 비율 (최적 비율: 밥_비율·주찬_비율, 단일 비율: 적용비율, 없으면 1)
+    portions = pd.DataFrame(1.0, index=pd.Index(resident_ids, name="수급자ID"), columns=ADJUSTABLE_CATEGORIES)
+    if ratio_table is None or ratio_table.empty:
+        return portions
+    ratios = ratio_table[~ratio_table.index.duplicated()]
+    for category in ADJUSTABLE_CATEGORIES:
+        col = f"{category}_비율" if f"{category}_비율" in ratios.columns else "적용비율"
+        if col in ratios.columns:
+            portions[category] = ratios[col].reindex(portions.index).fillna(1.0).to_numpy(dtype=float)
+    return portions
+
+def facility_usage(adjusted_results, ratio_table=None):
+    # 조정 식단 행마다 Menu, 인분(1인분 대비 양). 밥·주찬은 수급자의 양 조절 비율, 나머지는 1
+    frames = [df[["수급자ID", "Category", "Menu"]] for df in adjusted_results.values() if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=["Menu", "인분"])
+    usage = pd.concat(frames, ignore_index=True)
+    portions = resident_portions(ratio_table, usage["수급자ID"].unique())
+    rows = portions.index.get_indexer(usage["수급자ID"])
+    cols = pd.Index(ADJUSTABLE_CATEGORIES).get_indexer(usage["Category"].astype(object))
+    values = portions.to_numpy()
+    usage["인분"] = np.where(cols >= 0, values[rows, np.clip(cols, 0, None)], 1.0)
+    usage["Category"] = usage["Category"].astype(object)
+    return usage
+
+def plan_usage(plan, patient_df, ratio_table=None):
+    # 주기 식단 × 수급자 명단 → 일차·Menu별 인분. (대표질환, 식단옵션)마다 맞춤 메뉴명을 한 번만 만들고
+    # 인원 수(밥·주찬은 수급자 양 조절 비율의 합)를 인분으로 쓴다
+    residents = patient_df.drop_duplicates("수급자ID")
+    portions = resident_portions(ratio_table, residents["수급자ID"].to_numpy())
+    residents = residents.assign(
+        _key=residents["식단옵션"].map(meal_option_key),
+        **{f"_{c}": portions[c].to_numpy() for c in ADJUSTABLE_CATEGORIES},
+    )
+    frames = []
+    for (disease, _), group in residents.groupby(["대표질환", "_key"], sort=False):
+        menus = plan[plan["Disease"] == disease]
+        if menus.empty:
+            continue
+        menus = customize_plan(menus, group["식단옵션"].iat[0])[["일차", "Category", "Menu"]].copy()
+        servings = {c: group[f"_{c}"].sum() for c in ADJUSTABLE_CATEGORIES}
+        menus["인분"] = menus["Category"].astype(object).map(servings).fillna(len(group)).astype(float)
+        frames.append(menus)
+    if not frames:
+        return pd.DataFrame(columns=["일차", "Category", "Menu", "인분"])
+    usage = pd.concat(frames, ignore_index=True)
+    usage["Category"] = usage["Category"].astype(object)
+    return usage
+
+def aggregate_ingredients(usage, index, by=()):
+    # usage(Menu, 인분 + by 열) → by별 재료 총량(g) 긴 표, 레시피를 찾지 못한 메뉴명 목록
+    by = list(by)
+    columns = by + ["Ingredient", "식품코드", "총량(g)"]
+    menu_codes, menus = pd.factorize(usage["Menu"])
+    recipe_of = np.array([index.recipes.get_loc(r) if (r := resolve_recipe(m, index.recipes)) is not None else -1 for m in menus], dtype=int)
+    recipe = recipe_of[menu_codes] if len(menu_codes) else np.zeros(0, dtype=int)
+    servings = usage["인분"].to_numpy(dtype=float)
+    missing = sorted(str(menus[i]) for i in np.flatnonzero(recipe_of < 0) if servings[menu_codes == i].sum() > 0)
+
+    if by:
+        grouper = usage.groupby(by, sort=True, observed=True)
+        group_ids = grouper.ngroup().to_numpy()
+        keys = grouper.size().index.to_frame(index=False)
+    else:
+        group_ids = np.zeros(len(usage), dtype=int)
+        keys = pd.DataFrame(index=[0])
+    valid = (recipe >= 0) & (servings > 0)
+
+    # 1) 묶음 × 레시피 인분 합계 (희소: 실제로 나온 조합만)
+    n_recipes = len(index.recipes)
+    pair = group_ids[valid] * n_recipes + recipe[valid]
+    pairs, pair_codes = np.unique(pair, return_inverse=True)
+    pair_servings = np.bincount(pair_codes, weights=servings[valid], minlength=len(pairs))
+    pair_group, pair_recipe = np.divmod(pairs, n_recipes)
+
+    # 2) 조합마다 레시피의 재료 구간을 펼쳐 (묶음, 재료)별로 g을 더한다
+    starts = index.indptr[pair_recipe]
+    lengths = index.indptr[pair_recipe + 1] - starts
+    offsets = np.cumsum(lengths) - lengths
+    pos = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    n_ingredients = len(index.ingredients)
+    cell = np.repeat(pair_group, lengths) * n_ingredients + index.indices[pos]
+    cells, cell_codes = np.unique(cell, return_inverse=True)
+    grams = np.bincount(cell_codes, weights=np.repeat(pair_servings, lengths) * index.data[pos], minlength=len(cells))
+
+    cell_group, cell_ingredient = np.divmod(cells, n_ingredients)
+    table = keys.iloc[cell_group].reset_index(drop=True) if by else pd.DataFrame(index=range(len(cells)))
+    table["Ingredient"] = index.ingredients[cell_ingredient]
+    table["식품코드"] = index.codes[cell_ingredient]
+    table["총량(g)"] = grams
+    return table[grams > 0].reset_index(drop=True)[columns], missing
+
+def facility_procurement(adjusted_results, ratio_table, patient_df, index, category_df=None, standards=None, plan_days=None):
+    # 요양원 한 곳의 발주량: plan_days가 없으면 오늘 조정 식단 한 끼, 있으면 그 기간 주기 식단의 일차별 합계
+    if plan_days:
+        plan, _ = plan_cycle_menus(category_df, standards, days=plan_days, patient_df=patient_df)
+        return aggregate_ingredients(plan_usage(plan, patient_df, ratio_table), index, by=["일차"])
+    return aggregate_ingredients(facility_usage(adjusted_results, ratio_table), index)
+
+def write_procurement(table, output):
+    # 발주용 재료 총량 표: .xlsx면 엑셀, 그 밖(.csv, .csv.gz 등)은 엑셀에서 바로 열리는 UTF-8(BOM) CSV
+    if isinstance(output, str) and output.endswith(".xlsx"):
+        table.to_excel(output, sheet_name="식자재", index=False, engine="xlsxwriter")
+    else:
+        table.to_csv(output, index=False, encoding="utf-8-sig")
+    return output
+
+
+# ========== 재료 기준 영양성분 계산 ==========
+# category 시트에 옮겨 적은 영양성분 대신 ingredient 시트의 재료 g × 재료 1g당 영양성분으로 메뉴 영양성분을 만든다
+# 총 중량은 원재료 g × 수율. 수율은 메뉴의 기준 중량(nutrient → category 시트 총 중량)에서 구하고,
+# 기준 중량이 없는 조리 형태(_갈아서, _국물만 등)는 기본 메뉴의 수율을 물려받는다
+
+NUTRIENT_SOURCES = ["category", "ingredient"]
+
+def _known_weights(nutrient_df=None, category_df=None):
+    # 메뉴명 → 1인분 기준 중량(g). nutrient 시트가 먼저, 없으면 category 시트
+    weights = {}
+    for df in (category_df, nutrient_df):
+        if df is None or "총 중량" not in df.columns:
+            continue
+        known = df.dropna(subset=["총 중량"]).drop_duplicates("Menu")
+        weights.update(zip(known["Menu"], known["총 중량"].astype(float)))
+    return weights
+
+def compose_recipe_nutrients(index, nutrient_df=None, category_df=None):
+    # 레시피 × (PORTION_COLUMNS + 진단 열). 영양소는 (레시피 × 재료 g) @ (재료 × 1g당 영양소) 밀집 행렬 곱 한 번
+    n_recipes = len(index.recipes)
+    amounts = np.zeros((n_recipes, len(index.ingredients)))
+    np.add.at(amounts, (np.repeat(np.arange(n_recipes), np.diff(index.indptr)), index.indices), index.data)
+    nutrients = amounts @ np.nan_to_num(index.nutrients)
+    raw = amounts.sum(axis=1)
+
+    known = _known_weights(nutrient_df, category_df)
+    yields = np.ones(n_recipes)
+    basis = np.full(n_recipes, "원재료", dtype=object)
+    for k, recipe in enumerate(index.recipes):
+        base = recipe.rpartition("_")[0]
+        if recipe in known and raw[k] > 0:
+            yields[k], basis[k] = known[recipe] / raw[k], "기준중량"
+        elif base in index.recipes and base in known and raw[index.recipes.get_loc(base)] > 0:
+            yields[k], basis[k] = known[base] / raw[index.recipes.get_loc(base)], f"기본메뉴({base})"
+        elif base in known and raw[k] > 0:
+            yields[k], basis[k] = known[base] / raw[k], f"기본메뉴({base})"
+
+    no_data = np.isnan(index.nutrients).all(axis=1)
+    composed = pd.DataFrame(nutrients, index=pd.Index(index.recipes, name="레시피"), columns=MENU_NUTRIENT_COLUMNS)
+    composed.insert(0, "총 중량", raw * yields)
+    composed["원재료(g)"] = raw
+    composed["수율"] = yields
+    composed["수율근거"] = basis
+    composed["영양정보없는재료"] = [
+        ", ".join(index.ingredients[(amounts[k] > 0) & no_data]) for k in range(n_recipes)
+    ]
+    return composed
+
+def apply_recipe_nutrients(category_df, composed):
+    # category 시트 행의 영양소를 레시피 계산값으로 바꾼다 (행 총 중량 / 레시피 총 중량 비율로 맞춤, 총 중량은 그대로)
+    # 레시피를 찾지 못한 메뉴는 시트 값을 유지. 반환: (바뀐 category_df, 메뉴별 시트 값 대비 차이 표)
+    menus = category_df["Menu"].drop_duplicates()
+    recipe_of = {menu: resolve_recipe(menu, composed.index) for menu in menus}
+    recipes = category_df["Menu"].map(recipe_of)
+    found = recipes.notna().to_numpy()
+
+    rows = composed.reindex(recipes[found])
+    scale = category_df.loc[found, "총 중량"].to_numpy(dtype=float) / rows["총 중량"].to_numpy(dtype=float)
+    recomputed = rows[MENU_NUTRIENT_COLUMNS].to_numpy() * scale[:, None]
+
+    category_df = category_df.copy()
+    before = category_df.loc[found, MENU_NUTRIENT_COLUMNS].astype(float)
+    category_df[MENU_NUTRIENT_COLUMNS] = category_df[MENU_NUTRIENT_COLUMNS].astype(float)
+    category_df.loc[found, MENU_NUTRIENT_COLUMNS] = recomputed
+
+    report = pd.DataFrame({
+        "Menu": np.repeat(category_df.loc[found, "Menu"].to_numpy(), len(MENU_NUTRIENT_COLUMNS)),
+        "레시피": np.repeat(recipes[found].to_numpy(), len(MENU_NUTRIENT_COLUMNS)),
+        "영양소": np.tile(MENU_NUTRIENT_COLUMNS, int(found.sum())),
+        "시트값": before.to_numpy().ravel(),
+        "재료계산값": recomputed.ravel(),
+    }).drop_duplicates(["Menu", "영양소"])
+    report["차이"] = report["재료계산값"] - report["시트값"]
+    missing = pd.DataFrame({"Menu": [m for m, r in recipe_of.items() if r is None], "영양소": "레시피 없음"})
+    return category_df, pd.concat([report, missing], ignore_index=True)
+
+def recompute_category_nutrients(category_df, menu_sheets):
+    # 메뉴 파일 시트들(ingredient 필수, nutrient 선택) → 재료 기준 영양성분의 category_df와 차이 표
+    index = build_ingredient_index(menu_sheets["ingredient"])
+    composed = compose_recipe_nutrients(index, menu_sheets.get("nutrient"), category_df)
+    return apply_recipe_nutrients(category_df, composed)
+
+def load_menu_upload_recomputed(data):
+    # 업로드한 메뉴 파일 → (재료 기준 영양성분의 category_df, 차이 표). ingredient 시트가 없으면 ValueError
+    sheets = pd.read_excel(BytesIO(data), sheet_name=None)
+    if "ingredient" not in sheets:
+        raise ValueError("메뉴 파일에 ingredient 시트가 없습니다")
+    return recompute_category_nutrients(prepare_category_df(sheets["category"]), sheets)
+
+
+# ========== 증분 재계산 ==========
+# 명단 행·메뉴 행 해시로 단계별 결과를 재사용한다
+#   분류·개인 기준: 원본 명단 행 해시 → 전처리된 행
+#   식단·양 조절·판정: 수급자ID 단위 키(그 ID 행들의 해시 + 대표질환 한 끼 구성·밥 색인 해시) → 식단 행, 비율 진단, 판정 행
+# 바뀐 수급자(또는 바뀐 메뉴를 쓰는 질환의 수급자)만 다시 계산하고 나머지는 지난 결과에서 가져온다 (메모리 안에서만)
+# 지난 실행 명단(수급자ID, 원본 행 해시)은 원할 때 SNAPSHOT_DIR/<요양원>.parquet 에 남겨 다음 실행의 추가/변경/삭제 집계에 쓴다
+# 식단·판정 결과는 디스크에 남기지 않는다: Parquet 복원 + 저장이 전체를 다시 계산하는 것보다 오래 걸린다 (benchmark.py roster_diff)
+
+SNAPSHOT_DIR = "./roster_snapshots"
+_snapshot_lock = threading.Lock()
+
+def patient_row_hashes(patient_df):
+    # 원본 명단 행 값의 해시 (행 위치·색인과 무관). 열 구성이 바뀐 경우는 FacilityPipeline이 따로 판별한다
+    return pd.util.hash_pandas_object(patient_df, index=False).to_numpy()
+
+def disease_menu_signatures(category_df, rice_index):
+    # 질환 → 한 끼 구성 행(select_disease_menu)과 밥 색인의 해시
+    # 메뉴 한 행을 고치면 그 메뉴를 고른 질환의 값만 바뀐다 (밥 메뉴를 고치면 밥 색인이 바뀌어 전체)
+    rice = frame_fingerprint(rice_index.reset_index()).encode()
+    signatures = {}
+    for disease in DISEASE_TYPES:
+        selected = select_disease_menu(category_df, disease)
+        digest = hashlib.sha256(rice)
+        digest.update(frame_fingerprint(selected).encode() if selected is not None else b"-")
+        signatures[disease] = int.from_bytes(digest.digest()[:8], "little")
+    return signatures
+
+def _unit_keys(ids, row_keys):
+    # 수급자ID 단위 키: 행이 하나면 그 행의 키, ID가 중복되면 그 ID 행 키 전체의 해시
+    keys = row_keys.copy()
+    dup = pd.Series(ids).duplicated(keep=False).to_numpy()
+    if dup.any():
+        rows = pd.DataFrame({"id": ids[dup], "key": row_keys[dup].astype(str)})
+        joined = rows.groupby("id", sort=False)["key"].transform(",".join)
+        keys[dup] = pd.util.hash_array(joined.to_numpy(dtype=object))
+    return keys
+
+def standards_fingerprint(standards):
+    # compile_standards 결과의 해시 (FacilityPipeline이 MFDS 기준표가 바뀌었는지 판별)
+    return hashlib.sha256(repr(standards).encode()).hexdigest()
+
+def roster_changes(previous, ids, row_hashes):
+    # 지난 명단(수급자ID, _hash 열) 대비 추가/변경/삭제 수급자 수. ID가 중복되면 그 ID 행 해시 묶음으로 비교
+    def by_id(ids, hashes):
+        ids = np.asarray(ids, dtype=object)
+        keys = _unit_keys(ids, np.asarray(hashes, dtype=np.uint64))
+        first = ~pd.Series(ids).duplicated().to_numpy()
+        return pd.Series(keys[first], index=ids[first])
+
+    current = by_id(ids, row_hashes)
+    if previous is None:
+        return {"added": len(current), "changed": 0, "removed": 0}
+    previous = by_id(previous["수급자ID"], previous["_hash"])
+    common = current.index.isin(previous.index)
+    changed = current[common].to_numpy() != previous.reindex(current.index[common]).to_numpy()
+    return {
+        "added": int((~common).sum()),
+        "changed": int(changed.sum()),
+        "removed": int((~previous.index.isin(current.index)).sum()),
+    }
+
+def snapshot_path(name, root=SNAPSHOT_DIR):
+    # 요양원 이름 → 명단 파일 (파일 이름에 쓸 수 없는 문자는 _)
+    return os.path.join(root, re.sub(r'[\\/:*?"<>|]', "_", str(name)) + ".parquet")
+
+def read_roster(path):
+    # write_roster로 남긴 명단 (수급자ID, _hash 열). 없거나 읽을 수 없으면 None
+    with _snapshot_lock:
+        try:
+            roster = pd.read_parquet(path)
+        except (ImportError, OSError, ValueError):
+            return None
+    if list(roster.columns) != ["수급자ID", "_hash"]:
+        return None
+    return roster
+
+def write_roster(roster, path):
+    # 임시 파일에 다 쓴 뒤 바꿔 넣는다 (쓰는 도중 중단돼도 지난 명단이 그대로 남는다)
+    # 반환: 저장 여부 (pyarrow가 없거나 수급자ID 값 형식이 섞여 Parquet로 쓸 수 없으면 False)
+    if roster is None:
+        return False
+    with _snapshot_lock:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            roster.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+        except (ImportError, OSError, ValueError, TypeError):
+            return False
+    return True
+
+def missing_rice_menus(adjusted_results, rice_index):
+    # update_rice_nutrients와 같은 기준: 수급자별 첫 밥 행의 메뉴명 중 rice_index에 없는 것
+    missing = set()
+    for df in adjusted_results.values():
+        rice = df[(df["Category"] == "밥").to_numpy()].drop_duplicates("수급자ID")["Menu"]
+        missing.update(rice[~rice.isin(rice_index.index)].astype(str))
+    return sorted(missing)
+
+class FacilityPipeline:
+    # 요양원 한 곳의 run_facility 결과를 수급자 단위로 재사용하는 증분 계산기
+    # 마지막 실행의 명단에 있는 수급자만 기억한다. 반환되는 프레임은 캐시 원본이므로 읽기 전용으로 사용한다
+    # 수급자ID가 중복된 행들의 식단은 그 ID가 처음 나온 위치에 모인다 (run_facility는 행 위치마다 나눠 둔다)
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else MenuVariantCache()
+        self.stats = {}
+        self.patient_df = None
+        self._columns = None
+        self._prepared = None
+        self._setting = None
+        self._signatures = (None, None, None)
+        # 지난 실행의 명단 (수급자ID, 원본 행 해시) — 추가/변경/삭제 집계용
+        self._roster = None
+        # 모든 행을 새로 전처리한 마지막 호출의 (행 수, 초)
+        self._prepare_timing = (0, 0.0)
+        # 마지막 전체 계산의 (수급자 수, 초): 전처리 + run_facility와 같은 계산 시간 (메뉴 캐시를 새로 채운 시간 제외)
+        self._full = (0, 0.0)
+        self.invalidate()
+
+    def invalidate(self):
+        self._prepared = None
+        self._reset_results()
+
+    def _reset_results(self):
+        self._unit_keys = np.zeros(0, dtype=np.uint64)
+        self._menus = {}
+        self._ratios = {}
+        self._evaluation = (pd.DataFrame(), np.zeros(0, dtype=np.uint64))
+
+    def _prepare(self, raw_patient_df):
+        # 원본 행 해시가 처음 보는 행만 prepare_patient_df로 분류·개인 기준 계산
+        columns = tuple(map(str, raw_patient_df.columns))
+        if columns != self._columns:
+            self.invalidate()
+            self._columns = columns
+        row_hashes = patient_row_hashes(raw_patient_df)
+        known = self._prepared.index.get_indexer(row_hashes) >= 0 if self._prepared is not None else np.zeros(len(row_hashes), dtype=bool)
+        prepared = self._prepared
+        if prepared is None or not known.all():
+            started = time.perf_counter()
+            fresh = prepare_patient_df(raw_patient_df[~known]).set_axis(row_hashes[~known])
+            if not known.any():
+                self._prepare_timing = (len(row_hashes), time.perf_counter() - started)
+            prepared = fresh if prepared is None else pd.concat([prepared, fresh])
+            prepared = prepared[~prepared.index.duplicated()]
+        self._prepared = prepared.loc[pd.unique(row_hashes)]
+        patient_df = self._prepared.take(self._prepared.index.get_indexer(row_hashes)).set_axis(raw_patient_df.index)
+        return patient_df, row_hashes, int((~known).sum())
+
+    def prepare(self, raw_patient_df):
+        # prepare_patient_df와 같은 수급자 표 (바뀐 행만 다시 계산)
+        return self._prepare(raw_patient_df)[0]
+
+    def run(self, raw_patient_df, category_df, standards, rice_index=None, method="ratio"):
+        # run_facility와 같은 반환값: (조정된 식단, 판정표, 비율 진단, rice_index에 없는 밥 메뉴명 목록)
+        started = time.perf_counter()
+        if rice_index is None:
+            rice_index = build_rice_index(category_df)
+        patient_df, row_hashes, prepared_rows = self._prepare(raw_patient_df)
+        # 조정 방식이나 MFDS 기준이 바뀌면 식단·판정 결과는 모두 다시 계산
+        setting = (method, standards_fingerprint(standards))
+        if setting != self._setting:
+            self._reset_results()
+            self._setting = setting
+
+        # 같은 메뉴 프레임 객체면(업로드 캐시·batch 공유 데이터) 질환별 해시를 다시 만들지 않는다
+        if self._signatures[0] is not category_df or self._signatures[1] is not rice_index:
+            self._signatures = (category_df, rice_index, disease_menu_signatures(category_df, rice_index))
+        signatures = self._signatures[2]
+        diseases = patient_df["대표질환"].to_numpy(dtype=object)
+        row_keys = pd.util.hash_pandas_object(pd.DataFrame({
+            "row": row_hashes,
+            "menu": np.array([signatures[d] for d in diseases], dtype=np.uint64),
+        }), index=False).to_numpy()
+        ids = patient_df["수급자ID"].to_numpy(dtype=object)
+        changes = roster_changes(self._roster, ids, row_hashes)
+        codes, unit_ids = pd.factorize(ids, use_na_sentinel=False)
+        unit_keys = _unit_keys(ids, row_keys)[np.unique(codes, return_index=True)[1]]
+
+        # 처음 보는 키의 수급자만 run_facility 순서대로 계산
+        dirty = ~np.isin(unit_keys, self._unit_keys)
+        new_menus, new_ratios, new_evaluation = {}, {}, pd.DataFrame()
+        compute_started, built = time.perf_counter(), self.cache.build_seconds
+        if dirty.any():
+            subset = patient_df[dirty[codes]]
+            final_results = generate_final_results(subset, category_df, cache=self.cache)
+            new_menus, ratio_table, _ = adjust_facility(final_results, subset, rice_index, method=method, standards=standards)
+            new_evaluation = evaluate_facility(new_menus, subset, standards)
+            start = 0
+            for disease, df in new_menus.items():
+                count = df["수급자ID"].nunique()
+                new_ratios[disease] = ratio_table.iloc[start:start + count]
+                start += count
+        compute_seconds = time.perf_counter() - compute_started - (self.cache.build_seconds - built)
+
+        unit_index, id_index = pd.Index(unit_keys), pd.Index(unit_ids)
+
+        def key_of(resident_ids):
+            return unit_keys[id_index.get_indexer(resident_ids)]
+
+        def merge(old, new, new_ids, order):
+            # 지난 결과 중 이번 명단에 남은 수급자 + 새로 계산한 수급자 → order(단위 코드별 순위) 순서
+            old_frame, old_keys = old
+            kept = np.isin(old_keys, unit_keys)
+            keys = np.concatenate([old_keys[kept], key_of(new_ids)]).astype(np.uint64)
+            frames = [df for df in (old_frame[kept], new) if len(df)]
+            frame = pd.concat(frames) if len(frames) > 1 else (frames[0] if frames else old_frame[kept])
+            positions = order[unit_index.get_indexer(keys)]
+            sort = np.argsort(positions, kind="stable")
+            return frame.take(sort), keys[sort]
+
+        adjusted_results, menus, ratio_tables, ratios = {}, {}, [], {}
+        for disease in DISEASE_TYPES:
+            # 그 질환 행에서 수급자가 처음 나온 순서 (generate_final_results의 수급자 순서)
+            units = pd.unique(codes[diseases == disease])
+            order = np.full(len(unit_keys), -1)
+            order[units] = np.arange(len(units))
+            old_menu = self._menus.get(disease, (pd.DataFrame(), np.zeros(0, dtype=np.uint64)))
+            new_menu = new_menus.get(disease, pd.DataFrame())
+            if old_menu[0].empty and new_menu.empty:
+                continue
+            frame, keys = merge(old_menu, new_menu, new_menu["수급자ID"] if len(new_menu) else [], order)
+            if frame.empty:
+                continue
+            adjusted_results[disease] = frame.reset_index(drop=True)
+            menus[disease] = (adjusted_results[disease], keys)
+            old_ratio = self._ratios.get(disease, (pd.DataFrame(), np.zeros(0, dtype=np.uint64)))
+            new_ratio = new_ratios.get(disease, pd.DataFrame())
+            ratios[disease] = merge(old_ratio, new_ratio, new_ratio.index if len(new_ratio) else [], order)
+            ratio_tables.append(ratios[disease][0])
+
+        # 판정표는 evaluate_facility와 같이 질환별 식단에서 수급자가 처음 나온 순서
+        evaluated = pd.unique(np.concatenate([
+            id_index.get_indexer(df["수급자ID"]) for df in adjusted_results.values()
+        ])) if adjusted_results else np.zeros(0, dtype=np.intp)
+        order = np.full(len(unit_keys), -1)
+        order[evaluated] = np.arange(len(evaluated))
+        eval_df, eval_keys = merge(
+            self._evaluation, new_evaluation, new_evaluation["수급자ID"] if len(new_evaluation) else [], order
+        )
+        eval_df = eval_df.reset_index(drop=True)
+
+        self._unit_keys = unit_keys
+        self._menus, self._ratios, self._evaluation = menus, ratios, (eval_df, eval_keys)
+        self._roster = pd.DataFrame({"수급자ID": ids, "_hash": row_hashes})
+        self.patient_df = patient_df
+        ratio_table = pd.concat(ratio_tables) if ratio_tables else pd.DataFrame()
+        missing_rice = missing_rice_menus(adjusted_results, rice_index)
+
+        seconds = time.perf_counter() - started
+        recomputed = int(dirty.sum())
+        rows, prepare_seconds = self._prepare_timing
+        if recomputed and recomputed == len(unit_keys) and rows:
+            # 모든 수급자를 계산한 실행: 이 요양원을 처음부터 계산하는 데 드는 실제 시간을 기록
+            self._full = (recomputed, prepare_seconds / rows * len(row_hashes) + compute_seconds)
+        residents, full_seconds = self._full
+        self.stats = dict(
+            changes,
+            residents=len(unit_keys),
+            recomputed=recomputed,
+            reused=len(unit_keys) - recomputed,
+            prepared_rows=prepared_rows,
+            seconds=seconds,
+            # 전체 계산(1명당 시간 × 이번 수급자 수) - 이번 실행 시간. 더 오래 걸렸으면 음수, 기록이 없으면 None
+            saved_seconds=full_seconds / residents * len(unit_keys) - seconds if residents else None,
+        )
+        return adjusted_results, eval_df, ratio_table, missing_rice
+
+    def load_roster(self, path):
+        # write_roster로 남긴 명단을 다음 run()의 추가/변경/삭제 기준으로 쓴다 (식단·판정은 다시 계산)
+        roster = read_roster(path)
+        if roster is not None:
+            self._roster = roster
+        return roster is not None
+
+    def save_roster(self, path):
+        # 마지막 run()의 명단을 path에 남긴다 (load_roster로 읽음). 반환: 저장 여부
+        return write_roster(self._roster, path)
+
+
+# ========== 결과 저장소 (SQLite) ==========
+# 전체 수급자 모드 결과(조정 식단·MFDS 판정)를 (요양원, 날짜) 단위로 쌓아 두고 다시 계산하지 않고 조회한다
+#   meal_menus: 수급자별 식단 행 (PORTION_COLUMNS), meal_evaluations: 수급자별 판정 행 (_기준/_평가, 미달수)
+# 색인: (요양원, 수급자ID, 날짜) — 수급자 기간 조회, (요양원, 대표질환, 날짜) — 질환별 식단·미달 조회,
+#       (요양원, 날짜) — 같은 날짜를 다시 저장할 때 이전 결과 삭제
+
+RESULTS_DB_PATH = "./meal_results.sqlite3"
+STORE_MENU_COLUMNS = ["Category", "Menu"] + PORTION_COLUMNS
+STORE_EVALUATION_COLUMNS = [f"{n}_{kind}" for n in EVALUATION_NUTRIENTS for kind in ("기준", "평가")]
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _store_date(value):
+    # date/datetime/문자열 → "YYYY-MM-DD"
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+def _store_rows(prefix, df, str_column=None):
+    # 앞쪽 열 값(스칼라 또는 행별 배열) + df 값 → executemany용 행 목록
+    # NaN → NULL, 범주형(Category)은 문자열, str_column 번째 df 열(수급자ID)은 문자열로 바꿔 저장한다
+    block = np.empty((len(df), len(prefix) + df.shape[1]), dtype=object)
+    for j, values in enumerate(prefix):
+        block[:, j] = values
+    block[:, len(prefix):] = df.to_numpy(dtype=object)
+    block[pd.isna(block)] = None
+    if str_column is not None:
+        block[:, len(prefix) + str_column] = df.iloc[:, str_column].astype(str).to_numpy(dtype=object)
+    return block.tolist()
+
+class ResultsStore:
+    # 연결 하나를 여러 스레드(Streamlit 세션)가 같이 쓰므로 모든 쿼리를 잠금 안에서 실행한다
+    # 여러 프로세스(batch.py 작업 프로세스)는 각자 연결을 열고, WAL + busy timeout으로 쓰기 순서를 기다린다
+    def __init__(self, path=RESULTS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        keys = "center TEXT NOT NULL, date TEXT NOT NULL, 수급자ID TEXT NOT NULL, 대표질환 TEXT, 질환 TEXT"
+        menu_columns = ", ".join(f"{_quote(c)} {'REAL' if c in PORTION_COLUMNS else 'TEXT'}" for c in STORE_MENU_COLUMNS)
+        evaluation_columns = ", ".join(f"{_quote(c)} TEXT" for c in STORE_EVALUATION_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS meal_menus ({keys}, {menu_columns})")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS meal_evaluations ({keys}, 미달수 INTEGER, {evaluation_columns})")
+            for table in ("meal_menus", "meal_evaluations"):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_resident ON {table} (center, 수급자ID, date)")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_date ON {table} (center, date)")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_disease ON {table} (center, 대표질환, date)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def save(self, center, date, adjusted_results, eval_df):
+        # (요양원, 날짜) 결과를 한 트랜잭션에서 바꿔 쓴다. 반환: (식단 행 수, 판정 행 수)
+        date = _store_date(date)
+        frames = [(disease, df) for disease, df in adjusted_results.items() if not df.empty]
+        menu_columns = ["수급자ID", "질환"] + STORE_MENU_COLUMNS
+        menus = pd.concat([df[menu_columns] for _, df in frames], ignore_index=True) if frames else pd.DataFrame(columns=menu_columns)
+        primary = np.repeat(np.array([d for d, _ in frames], dtype=object), [len(df) for _, df in frames])
+        menu_rows = _store_rows([center, date, primary], menus, str_column=0)
+
+        # 판정표 수급자의 대표질환 = 그 수급자가 처음 나온 질환별 식단의 질환
+        evaluation_columns = ["수급자ID", "질환"] + STORE_EVALUATION_COLUMNS
+        evaluations = eval_df.reindex(columns=evaluation_columns) if not eval_df.empty else pd.DataFrame(columns=evaluation_columns)
+        resident_ids = menus["수급자ID"].astype(str)
+        first = ~resident_ids.duplicated().to_numpy()
+        positions = pd.Index(resident_ids[first]).get_indexer(evaluations["수급자ID"].astype(str))
+        evaluation_primary = np.where(positions >= 0, primary[first][positions] if len(primary) else None, None)
+        failed = (evaluations[STORE_EVALUATION_COLUMNS[1::2]].to_numpy(dtype=object) == "미달").sum(axis=1)
+        evaluation_rows = _store_rows([center, date, evaluation_primary, failed], evaluations, str_column=0)
+
+        def insert(table, columns):
+            placeholders = ", ".join("?" * len(columns))
+            return f"INSERT INTO {table} ({', '.join(map(_quote, columns))}) VALUES ({placeholders})"
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM meal_menus WHERE center = ? AND date = ?", (center, date))
+            self._conn.execute("DELETE FROM meal_evaluations WHERE center = ? AND date = ?", (center, date))
+            self._conn.executemany(insert("meal_menus", ["center", "date", "대표질환"] + menu_columns), menu_rows)
+            self._conn.executemany(
+                insert("meal_evaluations", ["center", "date", "대표질환", "미달수"] + evaluation_columns), evaluation_rows
+            )
+        return len(menu_rows), len(evaluation_rows)
+
+    def _query(self, sql, params):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def _date_range(self, start, end):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(_store_date(start))
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(_store_date(end))
+        return "".join(f" AND {c}" for c in clauses), params
+
+    def dates(self, center):
+        # 저장된 날짜 목록 (오래된 순)
+        rows = self._query("SELECT DISTINCT date FROM meal_evaluations WHERE center = ? ORDER BY date", [center])
+        return rows["date"].tolist()
+
+    def resident_menus(self, center, resident_id, start=None, end=None):
+        # 수급자 한 명의 기간 내 날짜별 식단 (저장 순서 = Category 순서)
+        where, params = self._date_range(start, end)
+        return self._query(
+            f"SELECT date, 수급자ID, 대표질환, 질환, {', '.join(map(_quote, STORE_MENU_COLUMNS))} FROM meal_menus "
+            f"WHERE center = ? AND 수급자ID = ?{where} ORDER BY date, rowid",
+            [center, str(resident_id)] + params,
+        )
+
+    def resident_evaluations(self, center, resident_id, start=None, end=None):
+        where, params = self._date_range(start, end)
+        return self._query(
+            f"SELECT * FROM meal_evaluations WHERE center = ? AND 수급자ID = ?{where} ORDER BY date",
+            [center, str(resident_id)] + params,
+        ).drop(columns="center")
+
+    def failing_residents(self, center, disease, nutrient=None, start=None, end=None):
+        # 대표질환 수급자 중 nutrient가 "미달"인 판정 행 (nutrient가 None이면 미달 항목이 하나라도 있는 행)
+        if nutrient is not None and nutrient not in EVALUATION_NUTRIENTS:
+            raise ValueError(f"MFDS 판정 영양소가 아닙니다: {nutrient}")
+        where, params = self._date_range(start, end)
+        failed = f"{_quote(nutrient + '_평가')} = '미달'" if nutrient is not None else "미달수 > 0"
+        return self._query(
+            f"SELECT * FROM meal_evaluations WHERE center = ? AND 대표질환 = ?{where} AND {failed} ORDER BY date, rowid",
+            [center, disease] + params,
+        ).drop(columns="center")
+
+
+# ========== 명령행 실행 ==========
+# Streamlit 없이 전체 수급자 모드와 같은 결과를 만든다 (요양원 여러 곳은 batch.py)
+#
+#   python -m meal_engine 어르신정보.xlsx [--out 맞춤식단.xlsx] [--format parquet] [--json 맞춤식단.json] [--cards 식단카드.zip]
+#                         [--ingredients 식자재.csv [--plan-days 28]] [--nutrients ingredient] [--method solver]
+
+def _json_value(value):
+    # numpy 스칼라 → 파이썬 값, NaN/inf → null
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+def _json_rows(df):
+    return {
+        key: {col: _json_value(v) for col, v in row.items()}
+        for key, row in df[~df.index.duplicated()].to_dict("index").items()
+    }
+
+def facility_records(adjusted_results, eval_df, ratio_table, patient_df):
+    # 수급자별 레코드: 개인 기준(min/max), 맞춤 식단(메뉴별 중량·영양소), MFDS 판정, 밥+주찬 비율
+    menu_columns = ["Category", "Menu"] + PORTION_COLUMNS
+    evaluations = _json_rows(eval_df.set_index("수급자ID").drop(columns="질환")) if not eval_df.empty else {}
+    ratios = _json_rows(ratio_table) if not ratio_table.empty else {}
+    patients = patient_df.drop_duplicates("수급자ID").set_index("수급자ID")
+    invalid = patients["개인기준_성별오류"] | patients["개인기준_결측"]
+    bounds = [target_bounds(nutrient) for nutrient in TARGET_NUTRIENTS]
+
+    records = []
+    for disease, df in adjusted_results.items():
+        menus = df[menu_columns].to_numpy(dtype=object)
+        for sid, rows in df.groupby("수급자ID", sort=False).indices.items():
+            patient = patients.loc[sid]
+            targets = {
+                nutrient: None if invalid[sid] else [_json_value(patient[lo]), _json_value(patient[hi])]
+                for nutrient, (lo, hi) in zip(TARGET_NUTRIENTS, bounds)
+            }
+            records.append({
+                "수급자ID": _json_value(sid),
+                "대표질환": disease,
+                "질환": patient["질환"],
+                "식단옵션": patient["식단옵션"],
+                "개인기준": targets,
+                "식단": [{col: _json_value(v) for col, v in zip(menu_columns, menu)} for menu in menus[rows]],
+                "판정": evaluations.get(sid),
+                "양조절": ratios.get(sid),
+            })
+    return records
+
+def main(argv=None):
+    # 명령행 전용 모듈은 여기서만 읽어 import 비용을 늘리지 않는다
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog="python -m meal_engine", description="수급자 맞춤 식단 생성")
+    parser.add_argument("patients", help="어르신 정보 파일(.xlsx, 첫 번째 시트)")
+    parser.add_argument("--menu", default=MENU_PATH, help="메뉴 파일 (category 시트)")
+    parser.add_argument("--mfds", default=MFDS_PATH, help="MFDS 질환별 기준 파일")
+    parser.add_argument("--out", help="결과 파일 (기본: <어르신 정보 파일명>_맞춤식단.<형식 확장자>)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="xlsx", help="결과 파일 형식")
+    parser.add_argument("--json", help="수급자별 결과 JSON 파일 (-: 표준 출력)")
+    parser.add_argument("--cards", help="수급자별 식단 카드 ZIP 파일")
+    parser.add_argument("--ingredients", help="식자재 발주량 파일 (.csv / .xlsx, 메뉴 파일의 ingredient 시트 필요)")
+    parser.add_argument("--plan-days", type=int, help="발주량을 이 기간 주기 식단의 일차별로 계산 (예: 7, 28)")
+    parser.add_argument("--method", choices=PORTION_METHODS, default="ratio", help="밥+주찬 조정 방식")
+    parser.add_argument("--nutrients", choices=NUTRIENT_SOURCES, default="category", help="메뉴 영양성분: category 시트 값 / 재료로 다시 계산")
+    args = parser.parse_args(argv)
+    if args.out is None and args.json is None and args.cards is None and args.ingredients is None:
+        args.out = export_file_name(os.path.splitext(args.patients)[0], args.format)
+
+    started = time.perf_counter()
+    with open(args.patients, "rb") as f:
+        patient_df = load_patient_upload(f.read())
+    menu_sheets = load_menu_workbook(args.menu)
+    category_df = prepare_category_df(menu_sheets["category"])
+    if args.nutrients == "ingredient":
+        if "ingredient" not in menu_sheets:
+            parser.error(f"{args.menu}에 ingredient 시트가 없습니다")
+        category_df, _ = recompute_category_nutrients(category_df, menu_sheets)
+    standards = compile_standards(load_disease_standards(args.mfds))
+    adjusted_results, eval_df, ratio_table, missing_rice = run_facility(
+        patient_df, category_df, standards, method=args.method
+    )
+
+    if args.out:
+        write_results(adjusted_results, patient_df, args.out, args.format)
+    if args.cards:
+        write_resident_cards_zip(adjusted_results, eval_df, patient_df, args.cards)
+    if args.ingredients:
+        if "ingredient" not in menu_sheets:
+            parser.error(f"{args.menu}에 ingredient 시트가 없습니다")
+        procurement, missing_recipes = facility_procurement(
+            adjusted_results, ratio_table, patient_df, build_ingredient_index(menu_sheets["ingredient"]),
+            category_df, standards, plan_days=args.plan_days,
+        )
+        write_procurement(procurement, args.ingredients)
+        if missing_recipes:
+            print(f"레시피 없는 메뉴: {', '.join(missing_recipes)}", file=sys.stderr)
+    if args.json:
+        payload = {
+            "조정방식": args.method,
+            "없는밥메뉴": missing_rice,
+            "수급자": facility_records(adjusted_results, eval_df, ratio_table, patient_df),
+        }
+        if args.json == "-":
+            json.dump(payload, sys.stdout, ensure_ascii=False)
+            sys.stdout.write("\n")
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+
+    # 진행 상황은 표준 오류로 (--json - 출력과 섞이지 않게)
+    print(
+        f"수급자 {patient_df['수급자ID'].nunique():,}명, 미달 {count_failed(eval_df):,}명, "
+        f"{time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+    if missing_rice:
+        print(f"없는 밥 메뉴: {', '.join(missing_rice)}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())